@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Time the clone_schema() database function against the number of schemata
+that already exist in the database.
+
+The versions of the function in boardinghouse/sql are installed side by side
+(as clone_schema_003, clone_schema_004, ...) in a freshly created test
+database, which is then filled with copies of the template schema. At each
+step, a new schema is cloned from the template a number of times with each
+version, and the median time is reported.
+
+With --records, the template is filled with that many rows first, and they
+are copied into each clone.
+
+It uses the same settings, and environment variables, as the test suite:
+
+    DB_NAME=bench python benchmarks/clone_schema.py --counts 0,100,500,1000
+
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # NOQA
+from django.db import DatabaseError, connection  # NOQA
+
+VERSIONS = ['003', '004', '005']
+TEMPLATE = '__template__'
+
+
+def install(cursor, version):
+    with open(os.path.join(ROOT, 'boardinghouse', 'sql', 'clone_schema.{0}.sql'.format(version))) as fp:
+        cursor.execute(fp.read().replace('clone_schema(', 'clone_schema_{0}('.format(version)))
+
+
+def grow(cursor, existing, count):
+    for index in range(existing, count):
+        cursor.execute('SELECT clone_schema(%s, %s)', [TEMPLATE, 'bench_{0:06d}'.format(index)])
+
+
+def fill(cursor, records):
+    cursor.execute(
+        "INSERT INTO {0}.tests_awaremodel (name, status, factor) "
+        "SELECT 'r' || n, false, n %% 100 FROM generate_series(1, %s) n".format(TEMPLATE),
+        [records]
+    )
+
+
+def time_clone(cursor, version, repeat, include_records):
+    timings = []
+    for attempt in range(repeat):
+        start = time.time()
+        cursor.execute('SELECT clone_schema_{0}(%s, %s, %s)'.format(version), [TEMPLATE, 'bench_clone', include_records])
+        timings.append(time.time() - start)
+        cursor.execute('DROP SCHEMA bench_clone CASCADE')
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--counts', default='0,100,500,1000',
+                        help='Comma separated numbers of existing schemata to time cloning at.')
+    parser.add_argument('--versions', default=','.join(VERSIONS),
+                        help='Comma separated versions of the clone_schema function to time.')
+    parser.add_argument('--records', type=int, default=0,
+                        help='How many records to put in the template schema, and copy into each clone.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='How many times to clone a schema with each version, at each step.')
+    options = parser.parse_args()
+
+    counts = sorted(int(count) for count in options.counts.split(','))
+    versions = options.versions.split(',')
+
+    django.setup()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+    try:
+        cursor = connection.cursor()
+        for version in versions:
+            install(cursor, version)
+        if options.records:
+            fill(cursor, options.records)
+
+        print('{0:>10} '.format('schemata') + ' '.join('{0:>12}'.format(version) for version in versions))
+        existing = 0
+        failed = set()
+        for count in counts:
+            grow(cursor, existing, count)
+            existing = count
+            results = []
+            for version in versions:
+                if version in failed:
+                    results.append('-')
+                    continue
+                try:
+                    results.append('{0:.4f}s'.format(time_clone(cursor, version, options.repeat, bool(options.records))))
+                except DatabaseError as exc:
+                    # Older versions do not work on all versions of postgres.
+                    print('clone_schema_{0} failed: {1}'.format(version, exc), file=sys.stderr)
+                    failed.add(version)
+                    results.append('failed')
+            print('{0:>10} '.format(count) + ' '.join('{0:>12}'.format(result) for result in results))
+            sys.stdout.flush()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,16 +4,22 @@ from django.db.backends.postgresql_psycopg2 import base
 
 from .schema import DatabaseSchemaEditor
 from .creation import DatabaseCreation
+from .operations import DatabaseOperations
 
 
 class DatabaseWrapper(base.DatabaseWrapper):
     """
     This is a simple subclass of the Postrges DatabaseWrapper,
-    but using our new :class:`DatabaseSchemaEditor` class.
+    but using our new :class:`DatabaseSchemaEditor` class, and our
+    SQL compilers (see :mod:`boardinghouse.backends.postgres.compiler`).
     """
+    #: The schema that our compilers should qualify tables with, if any.
+    qualified_schema = None
+
     def __init__(self, *args, **kwargs):
         super(DatabaseWrapper, self).__init__(*args, **kwargs)
         self.creation = DatabaseCreation(self)
+        self.ops = DatabaseOperations(self)
 
     def schema_editor(self, *args, **kwargs):
         return DatabaseSchemaEditor(self, *args, **kwargs)
@@ -0,0 +1,158 @@
+"""
+SQL compilers that are able to qualify table names with a schema.
+
+While :func:`qualify` is in effect for a connection, the tables of schema
+aware models are referred to as ``"schema"."table"`` (rather than relying on
+the ``search_path``), in every part of the query, including joins and
+subqueries. Shared tables are left alone.
+
+:class:`MultiSchemaCompiler` uses this to compile a query once for each of
+the schemata in a :class:`boardinghouse.base.MultiSchemaQuery`, and combines
+them with ``UNION ALL``.
+"""
+from __future__ import unicode_literals
+
+import contextlib
+
+from django.db.models.sql import compiler
+from django.db.models.sql.compiler import *  # NOQA
+from django.db.models.sql.query import Query
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+_shared_tables = set()
+
+
+def is_shared_table(table):
+    """
+    A cheaper version of :func:`boardinghouse.schema.is_shared_table`, that
+    only looks at the installed models (and not those within a migration).
+    """
+    if not _shared_tables:
+        from django.apps import apps
+        from boardinghouse.schema import REQUIRED_SHARED_TABLES, is_shared_model
+
+        _shared_tables.update(REQUIRED_SHARED_TABLES)
+        _shared_tables.update(
+            model._meta.db_table for model in apps.get_models(include_auto_created=True)
+            if is_shared_model(model)
+        )
+    return table in _shared_tables
+
+
+@contextlib.contextmanager
+def qualify(connection, schema):
+    """
+    Qualify the tables of schema aware models with schema, in queries
+    compiled for connection within this block.
+    """
+    previous = getattr(connection, 'qualified_schema', None)
+    connection.qualified_schema = schema
+    try:
+        yield
+    finally:
+        connection.qualified_schema = previous
+
+
+class SQLCompiler(compiler.SQLCompiler):
+    def quote_name_unless_alias(self, name):
+        quoted = super(SQLCompiler, self).quote_name_unless_alias(name)
+        schema = getattr(self.connection, 'qualified_schema', None)
+        # Aliases are not quoted: anything else that is a table (or a column
+        # that uses the table name as it's alias) needs a schema.
+        if schema and quoted != name and name in self.query.table_map and not is_shared_table(name):
+            return '{0}.{1}'.format(self.connection.ops.quote_name(schema), quoted)
+        return quoted
+
+
+class MultiSchemaCompiler(SQLCompiler):
+    """
+    Compile the query once for each schema, with the tables qualified with
+    that schema, and the value of the ``_schema`` extra select set to it's
+    name, and combine them with ``UNION ALL``.
+
+    Any ordering is applied to each schema, and then to the combined rows
+    (by position: columns that are ordered on, but not selected, are added
+    to the end of each schema's select list), as are the limits: each schema
+    returns at most as many rows as the high mark, and the offset is only
+    applied to the combined rows.
+    """
+    def as_sql(self, with_limits=True, with_col_aliases=False, subquery=False):
+        # The results are turned into objects using our select list, which
+        # is the same as the start of that of each branch.
+        self.setup_query()
+
+        if not self.query.schemata:
+            raise EmptyResultSet
+
+        ordering, order_by = self.get_ordering(self.query.schemata[0])
+        branches = []
+        params = []
+
+        for schema in self.query.schemata:
+            query = self.get_branch(schema, with_limits)
+            # Without a limit, ordering each schema's rows is wasted effort.
+            if query.high_mark is None:
+                query.clear_ordering(True)
+            for index, expression in enumerate(order_by):
+                query.add_annotation(expression, '__order_{0}'.format(index))
+            with qualify(self.connection, schema):
+                sql, branch_params = query.get_compiler(connection=self.connection).as_sql(
+                    with_col_aliases=with_col_aliases, subquery=subquery,
+                )
+            branches.append('({0})'.format(sql))
+            params.extend(branch_params)
+
+        result = [' UNION ALL '.join(branches)]
+        if ordering:
+            result.append('ORDER BY {0}'.format(', '.join(ordering)))
+        if with_limits:
+            if self.query.high_mark is not None:
+                result.append('LIMIT {0:d}'.format(self.query.high_mark - self.query.low_mark))
+            if self.query.low_mark:
+                result.append('OFFSET {0:d}'.format(self.query.low_mark))
+
+        return ' '.join(result), tuple(params)
+
+    def get_branch(self, schema, with_limits=True):
+        """
+        The (plain) query that selects the rows from schema.
+        """
+        query = self.query.clone(klass=Query)
+        if '_schema' in query.extra:
+            query.extra['_schema'] = ('%s', [schema])
+            query._extra_select_cache = None
+        query.low_mark = 0
+        if not with_limits:
+            query.high_mark = None
+        return query
+
+    def get_ordering(self, schema):
+        """
+        Find the position in the select list of each of the expressions that
+        the query is ordered by.
+
+        Returns a list of ``position ASC|DESC``, and a list of the expressions
+        that need to be added to the select list.
+        """
+        branch = self.get_branch(schema).get_compiler(connection=self.connection)
+        positions = []
+        order_by = []
+
+        with qualify(self.connection, schema):
+            branch.as_sql()
+            for expression, (sql, params, is_ref) in branch.get_order_by():
+                source = expression.get_source_expressions()[0]
+                source_sql = None if is_ref else branch.compile(source)[0]
+                for index, (select, (select_sql, select_params), alias) in enumerate(branch.select):
+                    if (alias == source.refs) if is_ref else (select_sql == source_sql):
+                        break
+                else:
+                    order_by.append(source)
+                    index = len(branch.select) + len(order_by) - 1
+                positions.append('{0:d} {1}'.format(index + 1, 'DESC' if expression.descending else 'ASC'))
+
+        return positions, order_by
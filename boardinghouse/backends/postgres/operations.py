@@ -0,0 +1,7 @@
+from django.db.backends.postgresql_psycopg2 import operations
+
+
+class DatabaseOperations(operations.DatabaseOperations):
+    # Our compilers are able to qualify table names with a schema, so that
+    # a query may be executed against several schemata at once.
+    compiler_module = 'boardinghouse.backends.postgres.compiler'
@@ -1,16 +1,36 @@
 from __future__ import unicode_literals
 
-from collections import defaultdict
+import logging
+import re
+from collections import OrderedDict, defaultdict
 
 from django.conf import settings
+from django.db import connection
 from django.db.backends.postgresql_psycopg2 import schema
 
 import sqlparse
 from sqlparse.tokens import DDL, DML, Keyword
 
+from ...fanout import FanoutReport, clear_progress
+from ...planner import classify, record_timings
 from ...schema import deactivate_schema, is_shared_table
 from ...signals import schema_aware_operation
 
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+CREATE_INDEX = re.compile(
+    r'^(?P<create>\s*CREATE\s+(?P<unique>UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?'
+    r'(?:IF\s+NOT\s+EXISTS\s+)?)"?(?P<name>[^"\s]+)"?\s+ON\s',
+    re.IGNORECASE
+)
+
+DDL_STATEMENT = re.compile(r'^\s*(CREATE|ALTER|DROP)\b', re.IGNORECASE)
+
+# Statements that may change the constraints on tables other than the one
+# they refer to.
+INVALIDATES_SNAPSHOT = re.compile(r'\b(CASCADE|RENAME)\b', re.IGNORECASE)
+
 
 def get_constraints(cursor, table_name, schema_name=None):
     """Return all constraints for a given table
@@ -90,6 +110,101 @@ FROM by_name""", [settings.PUBLIC_SCHEMA, schema_name, table_name] * 2)
     return {row[0]: dict(zip(columns, row)) for row in cursor}
 
 
+def get_constraint_snapshot(cursor, schema_name=None, table_name=None):
+    """Return all constraints for all tables (or just the given table)
+
+    Like :func:`get_constraints`, this looks in `settings.PUBLIC_SCHEMA` and
+    the supplied schema (defaulting to `__template__`), but it reads from
+    `pg_catalog` directly, and fetches the constraints for every table in
+    one query. The result is a dict, keyed by table name, of dicts in the
+    same format as :func:`get_constraints` returns. Tables that have no
+    constraints will have an empty dict.
+    """
+    if schema_name is None:
+        schema_name = settings.TEMPLATE_SCHEMA
+
+    cursor.execute('''
+WITH tables AS (
+
+  SELECT c.oid, c.relname
+    FROM pg_catalog.pg_class c
+   INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+   WHERE n.nspname IN (%s, %s)
+     AND c.relkind IN ('r', 'p')
+     AND (%s::text IS NULL OR c.relname = %s::text)
+
+)
+
+SELECT tables.relname,
+       con.conname,
+       con.contype,
+       ARRAY(SELECT attr.attname::text
+               FROM pg_catalog.pg_attribute attr
+              WHERE attr.attrelid = con.conrelid
+                AND attr.attnum = ANY(con.conkey)
+           ORDER BY attr.attname),
+       CASE WHEN con.contype = 'f' THEN ARRAY[
+           (SELECT ref.relname::text
+              FROM pg_catalog.pg_class ref
+             WHERE ref.oid = con.confrelid),
+           (SELECT attr.attname::text
+              FROM pg_catalog.pg_attribute attr
+             WHERE attr.attrelid = con.confrelid
+               AND attr.attnum = con.confkey[1])
+       ] END
+  FROM tables
+ INNER JOIN pg_catalog.pg_constraint con ON (con.conrelid = tables.oid)
+ WHERE con.contype IN ('p', 'u', 'f', 'c')
+
+ UNION ALL
+
+SELECT tables.relname,
+       idx_class.relname,
+       'i',
+       ARRAY(SELECT attr.attname::text
+               FROM pg_catalog.pg_attribute attr
+              WHERE attr.attrelid = idx.indrelid
+                AND attr.attnum = ANY(idx.indkey)
+           ORDER BY attr.attname),
+       NULL
+  FROM tables
+ INNER JOIN pg_catalog.pg_index idx ON (idx.indrelid = tables.oid)
+ INNER JOIN pg_catalog.pg_class idx_class ON (idx_class.oid = idx.indexrelid)
+
+ UNION ALL
+
+SELECT tables.relname, NULL, NULL, NULL, NULL
+  FROM tables''', [settings.PUBLIC_SCHEMA, schema_name, table_name, table_name])
+
+    snapshot = {}
+    for table, name, constraint_type, columns, foreign_key in cursor.fetchall():
+        constraints = snapshot.setdefault(table, {})
+        # Indexes on expressions only have no columns.
+        if name is None or not columns:
+            continue
+        constraint = constraints.setdefault(name, {
+            'constraint_name': name,
+            'columns': columns,
+            'primary_key': False,
+            'unique': False,
+            'foreign_key': None,
+            'check': False,
+            'index': False,
+        })
+        if constraint_type == 'p':
+            constraint['primary_key'] = constraint['unique'] = True
+        elif constraint_type == 'u':
+            constraint['unique'] = True
+        elif constraint_type == 'f':
+            constraint['foreign_key'] = foreign_key
+        elif constraint_type == 'c':
+            constraint['check'] = True
+        elif constraint_type == 'i':
+            constraint['index'] = True
+
+    return snapshot
+
+
 def get_index_data(cursor, index_name):
 
     cursor.execute('''SELECT c.relname AS table_name,
@@ -106,6 +221,64 @@ def get_index_data(cursor, index_name):
     return [table_name for (table_name, schema_name) in cursor.fetchall()]
 
 
+def get_index_validity(cursor, index_name):
+    """
+    Is the index with the given name in the current schema valid?
+
+    Returns None if there is no such index.
+    """
+    cursor.execute('''SELECT idx.indisvalid
+                        FROM pg_catalog.pg_index idx
+                  INNER JOIN pg_catalog.pg_class c ON (c.oid = idx.indexrelid)
+                  INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+                       WHERE n.nspname = current_schema()
+                         AND c.relname = %s''', [index_name])
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def drop_invalid_index(cursor, index_name):
+    """
+    Drop the index with the given name from the current schema, if it is
+    invalid (which happens when ``CREATE INDEX CONCURRENTLY`` fails).
+    """
+    if get_index_validity(cursor, index_name) is False:
+        LOGGER.warning('Dropping invalid index %s', index_name)
+        cursor.execute('SELECT current_schema()')
+        cursor.execute('DROP INDEX CONCURRENTLY IF EXISTS "{0}"."{1}"'.format(cursor.fetchone()[0], index_name))
+
+
+def create_index_concurrently(sql, params=None):
+    """
+    Execute the supplied ``CREATE INDEX`` statement as
+    ``CREATE INDEX CONCURRENTLY`` in the current schema.
+
+    An invalid index with the same name (left behind by an earlier
+    failure) is dropped first, and if we fail to create the index, the
+    invalid index that Postgres leaves behind is dropped. If a valid index
+    with this name already exists, nothing is done.
+
+    This uses :data:`django.db.connection`, rather than the schema editor's
+    connection, so that it may be used by worker threads.
+    """
+    match = CREATE_INDEX.match(sql)
+    index_name = match.group('name')
+    cursor = connection.cursor()
+
+    if get_index_validity(cursor, index_name):
+        return
+
+    drop_invalid_index(cursor, index_name)
+
+    try:
+        cursor.execute('CREATE {0}INDEX CONCURRENTLY {1}'.format(
+            match.group('unique') or '', sql[match.end('create'):]
+        ), params)
+    except Exception:
+        drop_invalid_index(cursor, index_name)
+        raise
+
+
 def group_tokens(parsed):
     grouped = defaultdict(list)
     identifiers = []
@@ -166,48 +339,170 @@ def get_table_and_schema(sql, cursor):
 
 class DatabaseSchemaEditor(schema.DatabaseSchemaEditor):
     """
-    This Schema Editor alters behaviour in three ways.
+    This Schema Editor alters behaviour in four ways.
 
-    1. Remove duplicates of deferred sql statements. These are
-       executed using `self.execute()` anyway, so they will get
-       applied to all schemata as appropriate.
+    1. Remove duplicates of deferred sql statements, and apply all of
+       the private ones to each schema as a single script (grouped by
+       table), rather than one statement at a time.
     2. Fire a signal during `self.execute()` so that listeners may choose
        to apply this statement to all schemata. This signal only fires for
        objects that are private objects.
     3. Change the mechanism for grabbing constraint names to also look in
        the template schema (instead of just `public`, as is hard-coded in
-       the original method).
+       the original method). These are read from a snapshot of the catalog,
+       which is discarded (per-table) as the editor executes DDL.
+    4. When enabled, and not within a transaction, private indexes are
+       created using `CREATE INDEX CONCURRENTLY` in each schema.
     """
 
+    #: When this is a list, private statements are collected into it as
+    #: (table, sql, params), rather than applied to each schema (see
+    #: :func:`boardinghouse.planner.collect_fanout`).
+    fanout_plan = None
+
+    def __init__(self, *args, **kwargs):
+        super(DatabaseSchemaEditor, self).__init__(*args, **kwargs)
+        self.fanout_report = FanoutReport()
+        self._constraint_snapshot = None
+
     def __exit__(self, exc_type, exc_value, traceback):
         # It seems that actions that add stuff to the deferred sql
         # will fire per-schema, so we can end up with multiples.
-        # We'll reduce that to a unique list.
-        # Can't just do a set, as that may change ordering.
-        deferred_sql = []
-        for sql in self.deferred_sql:
-            if sql not in deferred_sql:
-                deferred_sql.append(sql)
-        self.deferred_sql = deferred_sql
-        return super(DatabaseSchemaEditor, self).__exit__(exc_type, exc_value, traceback)
+        # We'll reduce that to a unique list, keeping the original order.
+        self.deferred_sql = list(OrderedDict.fromkeys(self.deferred_sql))
+        if exc_type is None:
+            self._execute_deferred_sql()
+        result = super(DatabaseSchemaEditor, self).__exit__(exc_type, exc_value, traceback)
         # If we manage to rewrite the SQL so it injects schema clauses, then we can remove this override.
 
-    def execute(self, sql, params=None):
-        execute = super(DatabaseSchemaEditor, self).execute
+        # Once a migration has been applied completely, we no longer need to
+        # know which schemata each of it's statements were applied to.
+        if exc_type is None and not self.collect_sql:
+            clear_progress()
+            record_timings(self.fanout_report.samples)
 
-        table_name, schema_name = get_table_and_schema(sql, self.connection.cursor())
+        self.fanout_report.log()
 
-        # TODO: try to get the apps from current project_state, not global apps.
-        if table_name and not schema_name and not is_shared_table(table_name):
+        return result
+
+    def _execute_deferred_sql(self):
+        """
+        Execute the deferred statements: those that apply to a private table
+        are grouped by table, and sent to each schema as one script (after
+        all of the others have been executed), so each schema is visited once.
+
+        Statements that are being collected (or that must be executed on their
+        own, like ``CREATE INDEX CONCURRENTLY``) are executed as normal.
+        """
+        private = OrderedDict()
+        for sql in self.deferred_sql:
+            if self.collect_sql or self._can_create_index_concurrently(sql):
+                self.execute(sql)
+                continue
+            table_name, schema_name = get_table_and_schema(sql, self.connection.cursor())
+            if table_name and not schema_name and not is_shared_table(table_name):
+                private.setdefault(table_name, []).append(sql)
+            else:
+                self.execute(sql)
+        self.deferred_sql = []
+
+        statements = [(table_name, sql) for table_name, group in private.items() for sql in group]
+        if not statements:
+            return
+        if len(statements) == 1:
+            self.execute(statements[0][1])
+            return
+
+        # The script is timed as a whole in each schema, so that time can only
+        # be recorded as a sample if every statement is of the same kind, and
+        # on the same table.
+        kinds = set((classify(sql, self.connection.pg_version), table_name) for table_name, sql in statements)
+        kind, table_name = kinds.pop() if len(kinds) == 1 else (None, statements[0][0])
+        self._fan_out(';\n'.join(sql for table_name, sql in statements), None, table_name, kind,
+                      sample=kind is not None)
+        for table_name, sql in statements:
+            self._invalidate_constraints(sql, table_name)
+
+    def _fan_out(self, sql, params, table_name, kind=None, sample=True):
+        """
+        Apply a statement (or script) to the private table in every schema.
+
+        Unless sample is False, the time taken in each schema is recorded
+        as a sample of the kind of statement.
+        """
+        execute = super(DatabaseSchemaEditor, self).execute
+
+        if sample:
+            self.fanout_report.statement = (kind or classify(sql, self.connection.pg_version), table_name)
+        if self._can_create_index_concurrently(sql):
+            schema_aware_operation.send(
+                self.__class__,
+                db_table=table_name,
+                function=create_index_concurrently,
+                args=(sql, params),
+                schema_editor=self,
+                atomic=False,
+                workers=settings.BOARDINGHOUSE_CONCURRENT_INDEX_WORKERS,
+            )
+        else:
             schema_aware_operation.send(
                 self.__class__,
                 db_table=table_name,
                 function=execute,
-                args=(sql, params)
+                args=(sql, params),
+                schema_editor=self,
             )
-            deactivate_schema()
+        self.fanout_report.statement = None
+        deactivate_schema()
+
+    def execute(self, sql, params=None):
+        table_name, schema_name = get_table_and_schema(sql, self.connection.cursor())
+
+        # TODO: try to get the apps from current project_state, not global apps.
+        if table_name and not schema_name and not is_shared_table(table_name):
+            if self.fanout_plan is not None:
+                self.fanout_plan.append((table_name, sql, params))
+                return
+            self._fan_out(sql, params, table_name)
+        else:
+            super(DatabaseSchemaEditor, self).execute(sql, params)
+
+        self._invalidate_constraints(sql, table_name)
+
+    def _can_create_index_concurrently(self, sql):
+        if not settings.BOARDINGHOUSE_CONCURRENT_INDEXES or self.collect_sql:
+            return False
+        # CREATE INDEX CONCURRENTLY cannot be executed inside a transaction.
+        if self.connection.in_atomic_block:
+            return False
+        return bool(CREATE_INDEX.match(sql))
+
+    def _get_constraints(self, table_name):
+        """
+        Get the constraints for a table from our snapshot of the catalog,
+        which is loaded (in one query) the first time it is required.
+        """
+        snapshot = self._constraint_snapshot
+        if snapshot is None:
+            with self.connection.cursor() as cursor:
+                snapshot = self._constraint_snapshot = get_constraint_snapshot(cursor)
+        if table_name not in snapshot:
+            with self.connection.cursor() as cursor:
+                snapshot.update(get_constraint_snapshot(cursor, table_name=table_name))
+        return snapshot.setdefault(table_name, {})
+
+    def _invalidate_constraints(self, sql, table_name):
+        """
+        Discard any parts of our catalog snapshot that executing sql may have
+        made stale: either the table it refers to, or, if that can't be
+        determined (or the statement may affect other tables), all of it.
+        """
+        if self._constraint_snapshot is None or not DDL_STATEMENT.match(sql):
+            return
+        if not table_name or INVALIDATES_SNAPSHOT.search(sql):
+            self._constraint_snapshot = None
         else:
-            execute(sql, params)
+            self._constraint_snapshot.pop(table_name, None)
 
     def _constraint_names(self, model, column_names=None, unique=None,
                           primary_key=None, index=None, foreign_key=None,
@@ -216,8 +511,7 @@ class DatabaseSchemaEditor(schema.DatabaseSchemaEditor):
         Returns all constraint names matching the columns and conditions
         """
         column_names = list(column_names) if column_names else None
-        with self.connection.cursor() as cursor:
-            constraints = get_constraints(cursor, model._meta.db_table)
+        constraints = self._get_constraints(model._meta.db_table)
         result = []
         for name, infodict in constraints.items():
             if column_names is None or column_names == infodict['columns']:
@@ -1,31 +1,178 @@
 from __future__ import unicode_literals
 
-from django.db import models
+import django
+from django.db import connections, models
+from django.db.utils import NotSupportedError
+from django.db.models.expressions import RawSQL, Ref, Star, Value
+from django.db.models.sql.query import Query
 
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    from django.db.models.sql.datastructures import EmptyResultSet
 
-class MultiSchemaMixin(object):
+
+class MultiSchemaQuery(Query):
     """
-    A mixin that allows for fetching objects from multiple
-    schemata in the one request.
+    A query that is executed against each of a number of schemata, and the
+    results combined (see
+    :class:`boardinghouse.backends.postgres.compiler.MultiSchemaCompiler`).
+    """
+    compiler = 'MultiSchemaCompiler'
+    schemata = ()
 
-    Consider this experimental.
+    def clone(self, *args, **kwargs):
+        obj = super(MultiSchemaQuery, self).clone(*args, **kwargs)
+        obj.schemata = self.schemata
+        return obj
 
-    .. note:: You probably don't want want this on your QuerySet, just
-        on your Manager.
-    """
-    def from_schemata(self, *schemata):
+    def get_aggregation(self, using, added_aggregate_names):
         """
-        Perform these queries across several schemata.
+        Aggregate over the combined rows of every schema.
+
+        Otherwise, the aggregates would be added to the select list of each
+        schema, and only the first schema's values returned. Instead, like
+        :meth:`get_count`, each aggregate is calculated over a subquery of the
+        combined rows, which selects the expressions that it aggregates.
         """
-        qs = self.get_queryset()
-        query = str(qs.query)
+        aggregates = [
+            (alias, expression) for alias, expression in self.annotation_select.items()
+            if alias in added_aggregate_names
+        ]
+        if not aggregates:
+            return {}
+
+        inner = self.clone()
+        inner.select_related = False
+        if self.low_mark == 0 and self.high_mark is None:
+            inner.clear_ordering(True)
+        inner.set_annotation_mask([alias for alias in self.annotation_select if alias not in added_aggregate_names])
+
+        aggregates = [(alias, _select_in_subquery(inner, expression)) for alias, expression in aggregates]
+        connection = connections[using]
+        try:
+            sql, params = inner.get_compiler(using).as_sql()
+        except EmptyResultSet:
+            values = [None] * len(aggregates)
+        else:
+            compiler = Query(self.model).get_compiler(using)
+            selects = []
+            for alias, expression in aggregates:
+                select_sql, select_params = compiler.compile(expression)
+                selects.append(select_sql)
+                params = tuple(select_params) + tuple(params)
+            cursor = connection.cursor()
+            cursor.execute('SELECT {0} FROM ({1}) AS "_rows"'.format(', '.join(selects), sql), params)
+            values = cursor.fetchone()
+
+        return dict(
+            (alias, expression.convert_value(value, expression, connection, {}))
+            for (alias, expression), value in zip(aggregates, values)
+        )
+
+    def get_count(self, using):
+        # The normal aggregation would count the rows in each schema.
+        sql, params = self.get_compiler(using).as_sql()
+        cursor = connections[using].cursor()
+        cursor.execute('SELECT COUNT(*) FROM ({0}) AS "_rows"'.format(sql), params)
+        return cursor.fetchone()[0]
+
+
+def _refers_to_annotation(expression):
+    return isinstance(expression, Ref) or any(
+        _refers_to_annotation(source) for source in expression.get_source_expressions()
+    )
+
+
+def _select_in_subquery(inner, expression):
+    """
+    Rewrite the sources of an aggregate so they refer to the columns of the
+    subquery that it is calculated over (adding them to inner, as needed).
+    """
+    expression = expression.copy()
+    sources = []
+    for source in expression.get_source_expressions():
+        if isinstance(source, (Star, Value)):
+            sources.append(source)
+        elif isinstance(source, Ref):
+            sources.append(RawSQL('"_rows".{0}'.format(_quote(source.refs)), [], output_field=source.output_field))
+        elif _refers_to_annotation(source):
+            sources.append(_select_in_subquery(inner, source))
+        else:
+            alias = '_aggregate_{0}'.format(len(inner.annotations))
+            inner.add_annotation(source, alias, is_summary=False)
+            sources.append(RawSQL('"_rows".{0}'.format(_quote(alias)), [], output_field=source.output_field))
+    expression.set_source_expressions(sources)
+    return expression
+
+
+def _quote(name):
+    return '"{0}"'.format(name.replace('"', '""'))
+
+
+def _not_supported(name):
+    def method(self, *args, **kwargs):
+        raise NotSupportedError('{0}() is not supported on a query across several schemata.'.format(name))
+    method.__name__ = str(name)
+    return method
+
+
+class ReadOnlyMixin(object):
+    """
+    Prevent writing through a queryset that is executed against several
+    schemata: these would be executed (unqualified) against the active
+    schema instead.
+    """
+    create = _not_supported('create')
+    bulk_create = _not_supported('bulk_create')
+    get_or_create = _not_supported('get_or_create')
+    update_or_create = _not_supported('update_or_create')
+    update = _not_supported('update')
+    _update = _not_supported('update')
+    delete = _not_supported('delete')
+    _raw_delete = _not_supported('delete')
+    select_for_update = _not_supported('select_for_update')
+
+    def __reduce__(self):
+        # The class is created on the fly, so it can't be found by name.
+        return _unpickle_read_only, (self.__class__.__bases__[1],), self.__getstate__()
+
+
+_read_only_classes = {}
+
+
+def _read_only(queryset_class):
+    if issubclass(queryset_class, ReadOnlyMixin):
+        return queryset_class
+    if queryset_class not in _read_only_classes:
+        _read_only_classes[queryset_class] = type(
+            str('ReadOnly{0}'.format(queryset_class.__name__)), (ReadOnlyMixin, queryset_class), {}
+        )
+    return _read_only_classes[queryset_class]
+
 
-        if len(schemata) == 1 and hasattr(schemata[0], 'filter'):
-            schemata = schemata[0]
+def _unpickle_read_only(queryset_class):
+    cls = _read_only(queryset_class)
+    return cls.__new__(cls)
 
+
+def from_schemata(queryset, schemata):
+    """
+    Make a copy of queryset that will be executed against each of schemata
+    (schema objects, or names), with the ``_schema`` attribute of each object
+    set to the schema it came from.
+
+    The copy may only be used to read: methods that would write (such as
+    ``update()`` and ``delete()``) raise ``NotSupportedError``.
+    """
+    if len(schemata) == 1 and hasattr(schemata[0], 'filter'):
+        schemata = schemata[0]
+
+    if django.VERSION < (1, 8):
         # We want to fetch all objects from selected schemata.
         # We need to inject the schema as an attribute _schema on the query,
         # so we can access it later.
+        query = str(queryset.query)
         multi_query = [
             query.replace(
                 'SELECT ', "SELECT '{0!s}' as _schema, ".format(schema.schema)
@@ -33,8 +180,66 @@ class MultiSchemaMixin(object):
                 'FROM "', 'FROM "{0!s}"."'.format(schema.schema)
             ) for schema in schemata
         ]
+        return queryset.model._default_manager.raw(" UNION ALL ".join(multi_query))
+
+    # Each schema will replace this with it's own name.
+    queryset = queryset.extra(select={'_schema': '%s'}, select_params=[None])
+    queryset.query = queryset.query.clone(klass=MultiSchemaQuery)
+    queryset.query.schemata = [getattr(schema, 'schema', schema) for schema in schemata]
+    queryset.__class__ = _read_only(queryset.__class__)
+    return queryset
+
+
+class MultiSchemaQuerySet(models.query.QuerySet):
+    """
+    A QuerySet that allows for fetching objects from multiple schemata
+    in the one query.
+    """
+    def from_schemata(self, *schemata):
+        """
+        Perform these queries across several schemata.
+        """
+        return from_schemata(self, schemata)
+
+    def gather(self, schemata, limit=None, workers=None, chunk_size=2000):
+        """
+        Execute this query against each of schemata concurrently, and yield
+        the (merged) objects from all of them: see
+        :func:`boardinghouse.gather.gather`.
+        """
+        from .gather import gather
+        return gather(self, schemata, limit=limit, workers=workers, chunk_size=chunk_size)
+
 
-        return self.raw(" UNION ALL ".join(multi_query))
+class MultiSchemaMixin(object):
+    """
+    A mixin that allows for fetching objects from multiple
+    schemata in the one request.
+
+    Consider this experimental.
+
+    .. note:: You probably don't want want this on your QuerySet, just
+        on your Manager (or use :class:`MultiSchemaQuerySet`).
+    """
+    def from_schemata(self, *schemata):
+        """
+        Perform these queries across several schemata.
+
+        The query is compiled once for each schema, with every table
+        qualified with that schema (including those in joins and subqueries),
+        and combined with ``UNION ALL``. Ordering and limits are applied to
+        each schema, and then to the combined rows.
+        """
+        return from_schemata(self.get_queryset(), schemata)
+
+    def gather(self, schemata, limit=None, workers=None, chunk_size=2000):
+        """
+        Execute this query against each of schemata concurrently, and yield
+        the (merged) objects from all of them: see
+        :func:`boardinghouse.gather.gather`.
+        """
+        from .gather import gather
+        return gather(self.get_queryset(), schemata, limit=limit, workers=workers, chunk_size=chunk_size)
 
 
 class MultiSchemaManager(MultiSchemaMixin, models.Manager):
@@ -0,0 +1,334 @@
+"""
+Cloning a schema, and it's records, using a number of database connections.
+
+The ``clone_schema()`` database function does all of it's work in a single
+backend, so the records of a template schema with many large tables are
+copied one table at a time. :func:`clone_schema` does the same work in
+stages:
+
+1. The structure of the new schema is created by the database function
+   (without records), and then it's foreign keys and indexes are dropped.
+2. A number of worker threads, each with it's own connection, copy the
+   records of each table (largest first), and then rebuild it's indexes.
+   All of the workers read from the same snapshot of the source schema.
+3. The foreign keys are added back, and the sequences are set to the values
+   they have in the source schema.
+
+The result is the same as ``clone_schema(source, dest, true)``: if any part
+of it fails, the new schema is dropped.
+
+This is used when a schema is created as a clone of another schema (see
+:mod:`boardinghouse.contrib.template`), and
+:data:`boardinghouse.settings.BOARDINGHOUSE_CLONE_WORKERS` is more than one.
+
+:func:`create_schemata` is used when many schemata are created at once (by
+:meth:`boardinghouse.models.SchemaQuerySet.bulk_create`): the structure of
+the template schema is cloned into all of them by one call to the
+``clone_schemata()`` database function, or split into chunks that are cloned
+by that number of connections.
+"""
+from __future__ import unicode_literals
+
+import collections
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.six.moves import queue
+
+from . import rollups, snapshot, spares
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+TABLES = """
+    SELECT c.relname
+      FROM pg_catalog.pg_class c
+INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+     WHERE n.nspname = %s
+       AND c.relkind = 'r'
+  ORDER BY pg_catalog.pg_relation_size(c.oid) DESC, c.relname
+"""
+
+SEQUENCES = """
+    SELECT c.relname
+      FROM pg_catalog.pg_class c
+INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+     WHERE n.nspname = %s
+       AND c.relkind = 'S'
+"""
+
+CONSTRAINTS = """
+    SELECT c.relname, r.conname, pg_catalog.pg_get_constraintdef(r.oid, true)
+      FROM pg_catalog.pg_constraint r
+INNER JOIN pg_catalog.pg_class c ON (c.oid = r.conrelid)
+INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+     WHERE n.nspname = %s
+       AND c.relkind = 'r'
+       AND r.contype = ANY(%s)
+  ORDER BY r.oid
+"""
+
+INDEXES = """
+    SELECT c.relname, i.relname, pg_catalog.pg_get_indexdef(x.indexrelid)
+      FROM pg_catalog.pg_index x
+INNER JOIN pg_catalog.pg_class c ON (c.oid = x.indrelid)
+INNER JOIN pg_catalog.pg_class i ON (i.oid = x.indexrelid)
+INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+     WHERE n.nspname = %s
+       AND c.relkind = 'r'
+       AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_constraint r WHERE r.conindid = x.indexrelid AND r.conrelid = c.oid)
+  ORDER BY x.indexrelid
+"""
+
+
+def _qualify(schema, name):
+    quote = connection.ops.quote_name
+    return '{0}.{1}'.format(quote(schema), quote(name))
+
+
+def _strip(cursor, schema):
+    """
+    Drop the foreign keys, and the indexes (including those that back a
+    primary key, unique or exclusion constraint), from every table in schema.
+
+    Returns a list of the statements that re-create the foreign keys, and a
+    dict of {table name: [statements]} that re-create each table's indexes.
+    """
+    quote = connection.ops.quote_name
+    foreign_keys = []
+    indexes = collections.defaultdict(list)
+    drop = []
+
+    cursor.execute(CONSTRAINTS, [schema, ['f']])
+    for table, name, definition in cursor.fetchall():
+        foreign_keys.append('ALTER TABLE {0} ADD CONSTRAINT {1} {2}'.format(_qualify(schema, table), quote(name), definition))
+        drop.append('ALTER TABLE {0} DROP CONSTRAINT {1}'.format(_qualify(schema, table), quote(name)))
+
+    cursor.execute(CONSTRAINTS, [schema, ['p', 'u', 'x']])
+    for table, name, definition in cursor.fetchall():
+        indexes[table].append('ALTER TABLE {0} ADD CONSTRAINT {1} {2}'.format(_qualify(schema, table), quote(name), definition))
+        drop.append('ALTER TABLE {0} DROP CONSTRAINT {1}'.format(_qualify(schema, table), quote(name)))
+
+    cursor.execute(INDEXES, [schema])
+    for table, name, definition in cursor.fetchall():
+        indexes[table].append(definition)
+        drop.append('DROP INDEX {0}'.format(_qualify(schema, name)))
+
+    for statement in drop:
+        cursor.execute(statement)
+
+    return foreign_keys, indexes
+
+
+def _copy_table(source, dest, table, snapshot, statements):
+    """
+    Copy the records of table from source to dest (as they were in snapshot),
+    and then build it's indexes.
+    """
+    with transaction.atomic():
+        cursor = connection.cursor()
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        cursor.execute('SET TRANSACTION SNAPSHOT %s', [snapshot])
+        # The database function creates triggers after copying records, so
+        # they must not fire here either.
+        cursor.execute('ALTER TABLE {0} DISABLE TRIGGER USER'.format(_qualify(dest, table)))
+        cursor.execute('INSERT INTO {0} SELECT * FROM {1}'.format(_qualify(dest, table), _qualify(source, table)))
+        cursor.execute('ALTER TABLE {0} ENABLE TRIGGER USER'.format(_qualify(dest, table)))
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def _copy_tables(source, dest, tables, snapshot, indexes, workers):
+    """
+    Copy the records of each table, using a number of worker threads.
+
+    Returns a list of (table name, exception) for the tables that failed.
+    """
+    pending = queue.Queue()
+    errors = queue.Queue()
+
+    for table in tables:
+        pending.put(table)
+
+    def worker():
+        try:
+            while True:
+                try:
+                    table = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    _copy_table(source, dest, table, snapshot, indexes.get(table, []))
+                except Exception as exc:
+                    LOGGER.exception('Unable to copy table %s from %s to %s', table, source, dest)
+                    errors.put((table, exc))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for i in range(min(workers, pending.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return [errors.get() for i in range(errors.qsize())]
+
+
+def clone_schema(source, dest, workers=None):
+    """
+    Create the schema dest as a copy of source, including it's records.
+
+    When workers is (or defaults to) one, or we are within a transaction (the
+    workers would be unable to see the new schema), this just uses the
+    ``clone_schema()`` database function.
+    """
+    workers = workers or settings.BOARDINGHOUSE_CLONE_WORKERS
+    cursor = connection.cursor()
+
+    if workers < 2 or connection.in_atomic_block:
+        cursor.execute('SELECT clone_schema(%s, %s, true)', [source, dest])
+        return
+
+    cursor.execute('SELECT clone_schema(%s, %s, false)', [source, dest])
+
+    try:
+        with transaction.atomic():
+            foreign_keys, indexes = _strip(cursor, dest)
+
+        cursor.execute(TABLES, [source])
+        tables = [row[0] for row in cursor.fetchall()]
+
+        # Hold the snapshot that the workers read from open until they
+        # have finished.
+        with transaction.atomic():
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+            cursor.execute('SELECT pg_export_snapshot()')
+            snapshot = cursor.fetchone()[0]
+
+            errors = _copy_tables(source, dest, tables, snapshot, indexes, workers)
+            if errors:
+                raise errors[0][1]
+
+            cursor.execute(SEQUENCES, [source])
+            for sequence in [row[0] for row in cursor.fetchall()]:
+                cursor.execute('SELECT last_value, is_called FROM {0}'.format(_qualify(source, sequence)))
+                last_value, is_called = cursor.fetchone()
+                cursor.execute('SELECT setval(%s, %s, %s)', [_qualify(dest, sequence), last_value, is_called])
+
+        with transaction.atomic():
+            for statement in foreign_keys:
+                cursor.execute(statement)
+    except Exception:
+        connection.cursor().execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(connection.ops.quote_name(dest)))
+        raise
+
+    LOGGER.info('Cloned schema %s from %s (%d tables, %d workers)', dest, source, len(tables), workers)
+
+
+def create_schema(source, dest, include_records=False):
+    """
+    Create the schema dest as a copy of source, using whichever of the
+    faster methods are enabled.
+
+    Records that are copied are added to every rollup (see
+    :func:`boardinghouse.rollups.seed_schema`), as they do not fire the
+    rollup triggers.
+    """
+    _create_schema(source, dest, include_records)
+    if include_records:
+        rollups.seed_schema(dest)
+
+
+def _create_schema(source, dest, include_records):
+    if dest != settings.TEMPLATE_SCHEMA:
+        if include_records and settings.BOARDINGHOUSE_CLONE_WORKERS > 1:
+            return clone_schema(source, dest)
+        # A schema cloned from the template schema may be a renamed spare.
+        if not include_records and spares.claim(dest):
+            return
+        if snapshot.is_enabled():
+            return snapshot.clone_schema(source, dest, include_records)
+
+    cursor = connection.cursor()
+    cursor.execute('SELECT clone_schema(%s, %s, %s)', [source, dest, include_records])
+    cursor.close()
+
+
+def _clone_chunks(source, chunks, workers):
+    """
+    Clone each chunk of schemata using the ``clone_schemata()`` database
+    function, using a number of worker threads.
+
+    Returns a list of (chunk, exception) for the chunks that failed.
+    """
+    pending = queue.Queue()
+    errors = queue.Queue()
+
+    for chunk in chunks:
+        pending.put(chunk)
+
+    def worker():
+        try:
+            while True:
+                try:
+                    chunk = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    with transaction.atomic():
+                        connection.cursor().execute('SELECT clone_schemata(%s, %s, false)', [source, chunk])
+                except Exception as exc:
+                    LOGGER.exception('Unable to clone schemata %s from %s', ', '.join(chunk), source)
+                    errors.put((chunk, exc))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for i in range(min(workers, pending.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return [errors.get() for i in range(errors.qsize())]
+
+
+def create_schemata(source, dests, workers=None):
+    """
+    Create each of the schemata in dests as a copy of the structure of
+    source, using as few round trips as possible.
+
+    Spare schemata are claimed for as many of them as possible, and the rest
+    are created from a snapshot, or by a single call to the
+    ``clone_schemata()`` database function. When workers is (or defaults to)
+    more than one, and we are not within a transaction, that is split into
+    chunks that are cloned in parallel: if any of them fail, all of the new
+    schemata are dropped.
+    """
+    workers = workers or settings.BOARDINGHOUSE_CLONE_WORKERS
+    claimed = set(spares.claim_many(dests))
+    remaining = [dest for dest in dests if dest not in claimed]
+
+    if not remaining:
+        return
+
+    if snapshot.is_enabled():
+        snapshot.clone_schemata(source, remaining)
+        return
+
+    if workers < 2 or len(remaining) < 2 or connection.in_atomic_block:
+        cursor = connection.cursor()
+        cursor.execute('SELECT clone_schemata(%s, %s, false)', [source, remaining])
+        cursor.close()
+        return
+
+    chunks = [remaining[i::workers] for i in range(min(workers, len(remaining)))]
+    errors = _clone_chunks(source, chunks, workers)
+    if errors:
+        connection.cursor().execute(';'.join([
+            'DROP SCHEMA IF EXISTS {0} CASCADE'.format(connection.ops.quote_name(dest)) for dest in dests
+        ]))
+        raise errors[0][1]
+
+    LOGGER.info('Cloned %d schemata from %s (%d workers)', len(remaining), source, workers)
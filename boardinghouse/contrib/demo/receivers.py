@@ -2,8 +2,9 @@ from django.conf import settings
 from django.db import models
 from django.dispatch import receiver
 
-from boardinghouse.schema import _table_exists
 from boardinghouse import signals
+from boardinghouse.fanout import apply_to_schemata
+from boardinghouse.schema import _table_exists
 from boardinghouse.receivers import create_schema, drop_schema
 
 from .models import DemoSchema
@@ -18,9 +19,7 @@ models.signals.post_delete.connect(drop_schema, sender=DemoSchema)
 @receiver(signals.schema_aware_operation, weak=False, dispatch_uid='execute-all-demo-schemata')
 def execute_on_all_templates(sender, db_table, function, **kwargs):
     if _table_exists(DemoSchema._meta.db_table):
-        for schema in DemoSchema.objects.active():
-            schema.activate()
-            function(*kwargs.get('args', []), **kwargs.get('kwargs', {}))
+        apply_to_schemata(DemoSchema.objects.active(), function, **kwargs)
 
 
 @receiver(signals.session_requesting_schema_change, weak=False, dispatch_uid='change-to-demo-schema')
@@ -33,3 +32,10 @@ def change_to_demo_schema(sender, schema, user, session, **kwargs):
 def find_demo_schema(sender, schema, **kwargs):
     if schema and schema.startswith(settings.BOARDINGHOUSE_DEMO_PREFIX):
         return DemoSchema.objects.get(user=schema.split(settings.BOARDINGHOUSE_DEMO_PREFIX)[1])
+
+
+@receiver(signals.list_schemata, weak=False, dispatch_uid='list-demo-schemata')
+def list_demo_schemata(sender, **kwargs):
+    if _table_exists(DemoSchema._meta.db_table):
+        return [schema.schema for schema in DemoSchema.objects.all()]
+    return []
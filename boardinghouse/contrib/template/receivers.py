@@ -4,6 +4,7 @@ from django.db import models
 
 from boardinghouse import signals
 from boardinghouse.exceptions import Forbidden
+from boardinghouse.fanout import apply_to_schemata
 from boardinghouse.receivers import create_schema, drop_schema
 from boardinghouse.schema import _table_exists
 
@@ -19,9 +20,7 @@ models.signals.post_delete.connect(drop_schema, sender=SchemaTemplate)
 @receiver(signals.schema_aware_operation, weak=False, dispatch_uid='execute-all-templates')
 def execute_on_all_templates(sender, db_table, function, **kwargs):
     if _table_exists(SchemaTemplate._meta.db_table):
-        for schema in SchemaTemplate.objects.all():
-            schema.activate()
-            function(*kwargs.get('args', []), **kwargs.get('kwargs', {}))
+        apply_to_schemata(SchemaTemplate.objects.all(), function, **kwargs)
 
 
 @receiver(signals.session_requesting_schema_change, weak=False, dispatch_uid='change-to-schema-template')
@@ -40,3 +39,10 @@ def change_to_schema_template(sender, schema, user, session, **kwargs):
 def find_schema_template(sender, schema, **kwargs):
     if schema and schema.startswith(settings.BOARDINGHOUSE_TEMPLATE_PREFIX):
         return SchemaTemplate.objects.get(pk=schema.split(settings.BOARDINGHOUSE_TEMPLATE_PREFIX)[1])
+
+
+@receiver(signals.list_schemata, weak=False, dispatch_uid='list-schema-templates')
+def list_schema_templates(sender, **kwargs):
+    if _table_exists(SchemaTemplate._meta.db_table):
+        return [schema.schema for schema in SchemaTemplate.objects.all()]
+    return []
@@ -0,0 +1,185 @@
+"""
+Distributing the migration of schemata across a number of processes.
+
+When :data:`boardinghouse.settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT` is
+enabled, private statements executed by the schema editor during ``migrate``
+are stored in the same log as lazy migrations (see :mod:`boardinghouse.lazy`),
+but are only applied immediately to the template schema (and other sources
+of schemata, such as :mod:`boardinghouse.contrib.template`).
+
+Once ``migrate`` has committed, the migrating process becomes the coordinator:
+it puts one :class:`boardinghouse.models.FanoutTask` for each schema that is
+lagging behind into a shared work table, and then works through that table,
+along with any number of ``boardinghouse_fanout_worker`` processes (on this or
+other machines). Each of these claims a batch of tasks using
+``SELECT ... FOR UPDATE SKIP LOCKED``, so no two processes ever work on the same
+schema. The row locks are held until the batch is committed: if a worker dies,
+it's tasks become available to the others again.
+
+A session-level advisory lock prevents two coordinators from running at once.
+
+Schemata that are activated before a worker gets to them are brought up to
+date when they are activated, exactly as with lazy migrations.
+"""
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import os
+import socket
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.encoding import force_bytes, force_text
+
+from . import lazy
+from .schema import _table_exists, activate_schema, deactivate_schema
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+COORDINATOR_LOCK = int(hashlib.md5(force_bytes('boardinghouse.distributed.coordinator')).hexdigest()[:15], 16)
+
+
+def is_enabled(schema_editor=None):
+    """
+    Should statements executed by this schema editor be distributed?
+    """
+    if not settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT:
+        return False
+    if schema_editor is not None and schema_editor.collect_sql:
+        return False
+    from .models import FanoutTask
+    return lazy._tables_exist() and _table_exists(FanoutTask._meta.db_table)
+
+
+def worker_name():
+    return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+
+def enqueue(run=None):
+    """
+    Put a task in the work table for each lagging schema that does not
+    already have one waiting.
+
+    Returns the run identifier, and the number of tasks that were added.
+    """
+    from .models import FanoutTask
+
+    run = run or uuid.uuid4().hex
+    waiting = set(FanoutTask.objects.filter(completed_at=None).values_list('schema', flat=True))
+    tasks = [
+        FanoutTask(run=run, schema=schema_name)
+        for schema_name in lazy.lagging_schemata()
+        if schema_name not in waiting
+    ]
+    FanoutTask.objects.bulk_create(tasks)
+    return run, len(tasks)
+
+
+def claim(batch_size):
+    """
+    Claim (and lock, until the current transaction ends) up to batch_size
+    tasks that no other process is working on.
+
+    Returns a list of (task id, schema name).
+    """
+    from .models import FanoutTask
+
+    cursor = connection.cursor()
+    cursor.execute(
+        'SELECT id, schema FROM {0} WHERE completed_at IS NULL '
+        'ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED'.format(FanoutTask._meta.db_table),
+        [batch_size]
+    )
+    return cursor.fetchall()
+
+
+def process_batch(batch_size=None, worker=None):
+    """
+    Claim a batch of tasks, and bring each of those schemata up to date.
+
+    A failure in one schema is recorded against it's task, and does not
+    prevent the other schemata in the batch from being migrated.
+
+    Returns a list of (schema name, error), where error is None on success.
+    """
+    from .models import FanoutTask
+
+    batch_size = batch_size or settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT_BATCH_SIZE
+    worker = worker or worker_name()
+    results = []
+
+    with transaction.atomic():
+        for pk, schema_name in claim(batch_size):
+            error = None
+            try:
+                with transaction.atomic():
+                    with lazy.suspended():
+                        activate_schema(schema_name)
+                        lazy.catch_up(schema_name, touch=False)
+            except Exception as exc:
+                LOGGER.exception('Unable to migrate schema %s', schema_name)
+                error = force_text(exc)
+            finally:
+                deactivate_schema()
+            FanoutTask.objects.filter(pk=pk).update(
+                worker=worker,
+                completed_at=timezone.now(),
+                error=error or '',
+            )
+            results.append((schema_name, error))
+
+    return results
+
+
+def work(batch_size=None, worker=None):
+    """
+    Process batches of tasks until there are none left to claim.
+
+    Returns a list of (schema name, error) for every task processed.
+    """
+    results = []
+    while True:
+        batch = process_batch(batch_size, worker)
+        if not batch:
+            return results
+        results.extend(batch)
+
+
+def coordinate(batch_size=None, interval=None):
+    """
+    Queue up the lagging schemata, work through them along with any other
+    workers, and wait until they have all been processed.
+
+    Returns the list of (schema name, error) for the tasks that failed, or
+    None if another coordinator is already running.
+    """
+    from .models import FanoutTask
+
+    interval = settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT_POLL_INTERVAL if interval is None else interval
+    cursor = connection.cursor()
+    cursor.execute('SELECT pg_try_advisory_lock(%s)', [COORDINATOR_LOCK])
+    if not cursor.fetchone()[0]:
+        LOGGER.warning('Another process is already coordinating the migration of schemata.')
+        return None
+
+    try:
+        run, count = enqueue()
+        LOGGER.info('Queued %d schemata for migration', count)
+        work(batch_size)
+
+        # The remaining tasks have been claimed by other workers.
+        while FanoutTask.objects.filter(run=run, completed_at=None).exists():
+            time.sleep(interval)
+
+        failed = list(FanoutTask.objects.filter(run=run).exclude(error='').values_list('schema', 'error'))
+        FanoutTask.objects.filter(run=run, error='').delete()
+        for schema_name, error in failed:
+            LOGGER.error('Migrating schema %s failed: %s', schema_name, error)
+        return failed
+    finally:
+        cursor.execute('SELECT pg_advisory_unlock(%s)', [COORDINATOR_LOCK])
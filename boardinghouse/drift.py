@@ -0,0 +1,389 @@
+"""
+Detecting schemata that have drifted from the template schema.
+
+The structure of every schema is described by a set of items, built from
+the system catalogs (``pg_class``, ``pg_attribute``, ``pg_index`` and
+``pg_constraint``): one for each table, view and sequence, each column (with
+it's type, nullability and default), each index, and each constraint. Any
+references to the schema itself are removed, so that identical schemata are
+described identically. The names of indexes and constraints are not included:
+cloning a schema creates it's tables using ``CREATE TABLE ... (LIKE ...)``,
+which generates new names for them.
+
+The fingerprint of a schema is the md5 of all of it's items: the fingerprints
+of every schema are computed by a single query, so comparing thousands of
+schemata takes seconds. Only those schemata whose fingerprint differs from
+the template schema's are then described in full, so the differences may be
+reported. Only the schemata that boardinghouse is responsible for (see
+:data:`boardinghouse.signals.list_schemata`) are compared: other schemata in
+the database (and orphaned ones) are never described, or repaired.
+
+Schemata that have drifted may be repaired: the statements required to make
+a schema's description match the template schema's are generated and applied
+to each schema (see :func:`plan_repair` and :func:`repair`).
+"""
+from __future__ import unicode_literals
+
+import collections
+import logging
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils.encoding import force_text
+
+from .fanout import apply_to_schemata
+from .schema import _get_search_path, deactivate_schema
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+Drift = collections.namedtuple('Drift', ['schema', 'missing', 'extra'])
+
+ITEMS = r'''
+WITH namespaces AS (
+    SELECT oid, nspname, '\m' || nspname || '\.' AS qualifier
+      FROM pg_catalog.pg_namespace
+     WHERE nspname <> %s
+       AND nspname NOT LIKE 'pg\_%%'
+       AND nspname <> 'information_schema'
+       {filter}
+), relations AS (
+    SELECT c.oid, c.relname, c.relkind, n.nspname, n.qualifier
+      FROM pg_catalog.pg_class c
+INNER JOIN namespaces n ON (n.oid = c.relnamespace)
+     WHERE c.relkind IN ('r', 'v', 'm', 'S')
+), items AS (
+    SELECT nspname AS schema,
+           'relation'::text AS kind,
+           relname AS relation,
+           relname AS name,
+           relkind::text AS definition
+      FROM relations
+     UNION ALL
+    SELECT r.nspname,
+           'column',
+           r.relname,
+           a.attname,
+           pg_catalog.format_type(a.atttypid, a.atttypmod) ||
+           CASE WHEN a.attnotnull THEN ' NOT NULL' ELSE '' END ||
+           COALESCE(' DEFAULT ' || regexp_replace(
+               pg_catalog.pg_get_expr(d.adbin, d.adrelid), r.qualifier, '', 'g'
+           ), '')
+      FROM relations r
+INNER JOIN pg_catalog.pg_attribute a ON (a.attrelid = r.oid)
+ LEFT JOIN pg_catalog.pg_attrdef d ON (d.adrelid = a.attrelid AND d.adnum = a.attnum)
+     WHERE a.attnum > 0
+       AND NOT a.attisdropped
+       AND r.relkind <> 'S'
+     UNION ALL
+    SELECT r.nspname,
+           'index',
+           r.relname,
+           c.relname,
+           regexp_replace(pg_catalog.pg_get_indexdef(i.indexrelid), r.qualifier, '', 'g')
+      FROM relations r
+INNER JOIN pg_catalog.pg_index i ON (i.indrelid = r.oid)
+INNER JOIN pg_catalog.pg_class c ON (c.oid = i.indexrelid)
+     -- Indexes that enforce constraints are described by the constraint.
+     WHERE NOT EXISTS (SELECT 1 FROM pg_catalog.pg_constraint WHERE conindid = i.indexrelid)
+     UNION ALL
+    SELECT r.nspname,
+           'constraint',
+           r.relname,
+           c.conname,
+           regexp_replace(pg_catalog.pg_get_constraintdef(c.oid), r.qualifier, '', 'g')
+      FROM relations r
+INNER JOIN pg_catalog.pg_constraint c ON (c.conrelid = r.oid)
+)
+'''
+
+#: A description of an item, that does not depend upon the names of indexes
+#: or constraints.
+ITEM = r'''CASE kind
+    WHEN 'column' THEN 'column ' || relation || '.' || name || ' ' || definition
+    WHEN 'index' THEN 'index ' || regexp_replace(definition, ' INDEX \S+ ON ', ' INDEX ON ')
+    ELSE kind || ' ' || relation || ' ' || definition
+END'''
+
+COLUMN = re.compile(r'^(?P<type>.+?)(?P<not_null> NOT NULL)?(?: DEFAULT (?P<default>.*))?$')
+NEXTVAL = re.compile(r"^nextval\('(?P<sequence>.+)'::regclass\)$")
+
+#: The order in which missing constraints are added: foreign keys need
+#: the primary key or unique constraint they refer to.
+CONSTRAINT_ORDER = ('PRIMARY KEY', 'UNIQUE', 'CHECK', 'EXCLUDE', 'FOREIGN KEY')
+
+Item = collections.namedtuple('Item', ['kind', 'relation', 'name', 'definition'])
+Repair = collections.namedtuple('Repair', ['statements', 'unrepaired', 'error'])
+
+
+def _items_query(select, schemata=None):
+    params = [settings.PUBLIC_SCHEMA]
+    schema_filter = ''
+    if schemata is not None:
+        schema_filter = 'AND nspname = ANY(%s)'
+        params.append(list(schemata))
+    return ITEMS.format(filter=schema_filter) + select, params
+
+
+def fingerprints(cursor=None, schemata=None):
+    """
+    Get the fingerprint of every schema (except the public schema), or just
+    those named, in one query.
+
+    Returns a dict of {schema name: fingerprint}.
+    """
+    cursor = cursor or connection.cursor()
+    cursor.execute(*_items_query(
+        "SELECT schema, md5(string_agg({0}, E'\\n' ORDER BY {0})) FROM items GROUP BY schema".format(ITEM),
+        schemata
+    ))
+    return dict(cursor.fetchall())
+
+
+def describe(schemata, cursor=None):
+    """
+    Get the items that describe the structure of each of the named schemata.
+
+    Returns a dict of {schema name: {description: :class:`Item`}}.
+    """
+    cursor = cursor or connection.cursor()
+    cursor.execute(*_items_query(
+        'SELECT schema, {0}, kind, relation, name, definition FROM items'.format(ITEM),
+        schemata
+    ))
+    items = dict((schema_name, {}) for schema_name in schemata)
+    for row in cursor.fetchall():
+        items[row[0]][row[1]] = Item(*row[2:])
+    return items
+
+
+def _known_schemata():
+    """
+    The names of the schemata that boardinghouse is responsible for (see
+    :data:`boardinghouse.signals.list_schemata`), except spare schemata.
+
+    Schemata created by anything else (or orphaned) are never compared, or
+    repaired.
+    """
+    from .orphans import known_schemata
+    from .spares import is_spare
+
+    return sorted(
+        schema_name for schema_name in known_schemata()
+        if schema_name != settings.PUBLIC_SCHEMA and not is_spare(schema_name)
+    )
+
+
+def find_drift(schemata=None, cursor=None):
+    """
+    Compare every schema that boardinghouse knows about (or just those
+    named) with the template schema.
+
+    Returns a list of :class:`Drift`, one for each schema that differs,
+    listing the items that are missing from it, and the extra items it has.
+    """
+    cursor = cursor or connection.cursor()
+    if schemata is None:
+        schemata = _known_schemata()
+    schemata = [schema_name for schema_name in schemata if schema_name != settings.TEMPLATE_SCHEMA]
+    found = fingerprints(cursor, [settings.TEMPLATE_SCHEMA] + schemata)
+    template = found.pop(settings.TEMPLATE_SCHEMA, None)
+    found = dict((schema_name, found.get(schema_name)) for schema_name in schemata)
+
+    drifted = sorted(schema_name for schema_name, fingerprint in found.items() if fingerprint != template)
+    if not drifted:
+        return []
+
+    items = describe([settings.TEMPLATE_SCHEMA] + drifted, cursor)
+    expected = set(items.pop(settings.TEMPLATE_SCHEMA))
+    return [
+        Drift(schema_name, sorted(expected - set(items[schema_name])), sorted(set(items[schema_name]) - expected))
+        for schema_name in drifted
+    ]
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _column_definition(definition):
+    match = COLUMN.match(definition)
+    return match.group('type'), bool(match.group('not_null')), match.group('default')
+
+
+def _constraint_order(item):
+    for i, prefix in enumerate(CONSTRAINT_ORDER):
+        if item.definition.startswith(prefix):
+            return i
+    return len(CONSTRAINT_ORDER)
+
+
+def _is_foreign_key(item):
+    return item.kind == 'constraint' and item.definition.startswith('FOREIGN KEY')
+
+
+def plan_repair(expected, actual):
+    """
+    Generate the statements that will bring a schema described by actual
+    into line with one described by expected (both as returned by
+    :func:`describe`). The statements do not refer to the schema, so
+    must be executed with it active.
+
+    Returns a tuple of (statements, unrepaired), where unrepaired is a list
+    of the descriptions of items that will not be changed: extra tables,
+    views and columns are never dropped (as that would lose data), and
+    missing views are not created.
+    """
+    statements = []
+    unrepaired = []
+    missing = [expected[key] for key in sorted(set(expected) - set(actual))]
+    extra = [actual[key] for key in sorted(set(actual) - set(expected))]
+
+    # Tables are created with everything but their foreign keys.
+    created = set()
+    for item in missing:
+        if item.kind != 'relation':
+            continue
+        if item.definition == 'r':
+            statements.append('CREATE TABLE {0} (LIKE {1}.{0} INCLUDING ALL)'.format(
+                _quote(item.relation), _quote(settings.TEMPLATE_SCHEMA)))
+            created.add(item.relation)
+        elif item.definition == 'S':
+            statements.append('CREATE SEQUENCE {0}'.format(_quote(item.relation)))
+        else:
+            unrepaired.append('relation {0} {1}'.format(item.relation, item.definition))
+    missing = [
+        item for item in missing
+        if item.kind != 'relation' and (item.relation not in created or _is_foreign_key(item))
+    ]
+
+    for item in extra:
+        if item.kind == 'constraint':
+            statements.append('ALTER TABLE {0} DROP CONSTRAINT {1}'.format(
+                _quote(item.relation), _quote(item.name)))
+        elif item.kind == 'index':
+            statements.append('DROP INDEX {0}'.format(_quote(item.name)))
+
+    actual_columns = dict(
+        ((item.relation, item.name), item) for item in actual.values() if item.kind == 'column'
+    )
+    for item in missing:
+        if item.kind != 'column':
+            continue
+        column = _quote(item.name)
+        alter = 'ALTER TABLE {0} '.format(_quote(item.relation))
+        data_type, not_null, default = _column_definition(item.definition)
+        if (item.relation, item.name) not in actual_columns:
+            statements.append(alter + 'ADD COLUMN {0} {1}'.format(column, item.definition))
+            continue
+        old_type, old_not_null, old_default = _column_definition(
+            actual_columns.pop((item.relation, item.name)).definition
+        )
+        if data_type != old_type:
+            statements.append(alter + 'ALTER COLUMN {0} TYPE {1} USING {0}::{1}'.format(column, data_type))
+        if default != old_default:
+            if default is None:
+                statements.append(alter + 'ALTER COLUMN {0} DROP DEFAULT'.format(column))
+            else:
+                statements.append(alter + 'ALTER COLUMN {0} SET DEFAULT {1}'.format(column, default))
+        if not_null != old_not_null:
+            statements.append(alter + 'ALTER COLUMN {0} {1} NOT NULL'.format(column, 'SET' if not_null else 'DROP'))
+
+    # Any columns that were not matched up with a missing column are extra.
+    for item in extra:
+        if item.kind == 'column' and (item.relation, item.name) in actual_columns:
+            unrepaired.append('column {0}.{1} {2}'.format(item.relation, item.name, item.definition))
+        elif item.kind == 'relation':
+            unrepaired.append('relation {0} {1}'.format(item.relation, item.definition))
+
+    for item in sorted([item for item in missing if item.kind == 'constraint'], key=_constraint_order):
+        statements.append('ALTER TABLE {0} ADD CONSTRAINT {1} {2}'.format(
+            _quote(item.relation), _quote(item.name), item.definition))
+
+    for item in missing:
+        if item.kind == 'index':
+            statements.append(item.definition)
+
+    return statements, unrepaired
+
+
+def plan_sequences(expected, actual):
+    """
+    Generate the statements that move each sequence that :func:`plan_repair`
+    will create (or that belongs to a table it will create) past the values
+    already in the column that uses it, so that new rows do not collide with
+    existing ones.
+    """
+    missing = [expected[key] for key in sorted(set(expected) - set(actual)) if expected[key].kind == 'relation']
+    created = set(item.relation for item in missing)
+
+    statements = []
+    for key in sorted(expected):
+        item = expected[key]
+        if item.kind != 'column':
+            continue
+        match = NEXTVAL.match(_column_definition(item.definition)[2] or '')
+        if not match:
+            continue
+        sequence = match.group('sequence')
+        if item.relation in created or sequence.strip('"') in created:
+            statements.append("SELECT setval('{0}', COALESCE(MAX({1}), 0) + 1, false) FROM {2}".format(
+                sequence, _quote(item.name), _quote(item.relation)))
+    return statements
+
+
+def _repair_active_schema(expected, results):
+    def repair():
+        schema_name = _get_search_path()
+        statements, unrepaired = [], []
+        try:
+            with transaction.atomic():
+                cursor = connection.cursor()
+                actual = describe([schema_name], cursor)[schema_name]
+                sequences = plan_sequences(expected, actual)
+                # Tables created from the template need a second pass, to
+                # point their defaults at this schema's sequences.
+                for attempt in range(2):
+                    planned, unrepaired = plan_repair(expected, actual)
+                    for sql in planned:
+                        LOGGER.debug('Repairing schema %s: %s', schema_name, sql)
+                        cursor.execute(sql)
+                    statements.extend(planned)
+                    if not any(sql.startswith('CREATE TABLE') for sql in planned):
+                        break
+                    actual = describe([schema_name], cursor)[schema_name]
+                for sql in sequences:
+                    LOGGER.debug('Repairing schema %s: %s', schema_name, sql)
+                    cursor.execute(sql)
+                statements.extend(sequences)
+        except DatabaseError as exc:
+            LOGGER.error('Unable to repair schema %s: %s', schema_name, exc)
+            results[schema_name] = Repair(statements, unrepaired, force_text(exc))
+        else:
+            results[schema_name] = Repair(statements, unrepaired, None)
+    return repair
+
+
+def repair(schemata=None, workers=1):
+    """
+    Bring every schema that has drifted from the template schema (or just
+    those named) back into line with it, with the statements generated by
+    :func:`plan_repair` (and :func:`plan_sequences`). Each schema is repaired in a transaction, and a
+    number of workers may repair schemata in parallel (see
+    :func:`boardinghouse.fanout.apply_to_schemata`).
+
+    A schema that could not be repaired is left unchanged, and the error
+    is reported, rather than raised.
+
+    Returns a dict of {schema name: :class:`Repair`}.
+    """
+    drifted = [drift.schema for drift in find_drift(schemata)]
+    if not drifted:
+        return {}
+
+    expected = describe([settings.TEMPLATE_SCHEMA])[settings.TEMPLATE_SCHEMA]
+    results = {}
+    apply_to_schemata(drifted, _repair_active_schema(expected, results), workers=workers)
+    deactivate_schema()
+    return results
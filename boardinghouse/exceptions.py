@@ -23,6 +23,13 @@ class SchemaNotFound(Exception):
     """
 
 
+class SchemaNotReady(SchemaNotFound):
+    """
+    An exception that is raised when an attempt to activate a schema that
+    is still waiting to be provisioned is made.
+    """
+
+
 class SchemaRequiredException(Exception):
     """
     An exception raised when an operation requires a schema to be active
@@ -0,0 +1,486 @@
+"""
+Applying private operations to many schemata.
+
+Each receiver of :data:`boardinghouse.signals.schema_aware_operation` knows
+about one source of schemata (the template, the schema model, template
+schemata, demo schemata): it hands those schemata, along with the function
+that needs to be executed, to :func:`apply_to_schemata`.
+
+When this happens as part of a migration, the outcome for each schema is
+recorded in :class:`boardinghouse.models.MigrationProgress`. If the migration
+is non-atomic, and fails part way through the fan-out (or the process is
+killed), then re-running ``migrate`` will skip the schemata that the
+statement has already been applied to. When a migration completes, the
+progress records for it are removed.
+
+Progress is only recorded for non-atomic migrations: an atomic migration
+(the default) rolls back everything it has done when it fails, so a re-run
+will start from scratch, which is exactly what is required.
+
+The migration (and operation) being applied is recorded by the ``migrate``
+command (see :func:`begin_migration`).
+
+Statements executed in each schema may be given a ``lock_timeout`` and a
+``statement_timeout`` (see :data:`boardinghouse.settings.BOARDINGHOUSE_FANOUT_LOCK_TIMEOUT`),
+so that DDL queued behind a long running query in one busy schema does not
+block all other queries on that table. A statement that times out waiting
+for a lock is retried (after a jittered, exponentially increasing delay)
+up to :data:`boardinghouse.settings.BOARDINGHOUSE_FANOUT_RETRIES` times.
+
+Statements that must not run within a transaction (such as
+``CREATE INDEX CONCURRENTLY``) may be applied to a number of schemata at
+once, with :func:`parallel`: each worker thread uses it's own connection.
+
+The time spent in each schema (and the part of it spent waiting for locks,
+in statements that timed out and the delays before retrying them) is
+collected by the schema editor, and the schemata that waited longest are
+logged when the migration completes.
+"""
+from __future__ import unicode_literals
+
+import contextlib
+import functools
+import hashlib
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.utils.encoding import force_bytes, force_text
+from django.utils.six.moves import queue
+
+from .schema import _table_exists, activate_schema, activate_template_schema
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+#: The Postgres error code raised when lock_timeout is exceeded.
+LOCK_NOT_AVAILABLE = '55P03'
+
+#: The value stored in :attr:`MigrationProgress.operation` for statements
+#: that are not part of an operation, such as deferred SQL.
+DEFERRED = -1
+
+
+_current = threading.local()
+
+
+def current_migration():
+    """
+    The migration that is currently being applied (or unapplied), and the
+    operation within it.
+
+    Returns a tuple of (migration, operation index, backwards), or None if we
+    are not within a migration.
+    """
+    return getattr(_current, 'migration', None)
+
+
+def _track_operation(method, index):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        migration, previous, backwards = _current.migration
+        _current.migration = (migration, index, backwards)
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _current.migration = (migration, previous, backwards)
+    return wrapper
+
+
+def begin_migration(migration, backwards=False):
+    """
+    Record that migration is being applied (or unapplied, if backwards), and
+    which of it's operations is being executed, for :func:`current_migration`,
+    until :func:`end_migration` is called.
+
+    The ``migrate`` command (see
+    :mod:`boardinghouse.management.commands.migrate`) calls this as each
+    migration is started.
+    """
+    end_migration()
+    method = 'database_backwards' if backwards else 'database_forwards'
+    tracked = []
+    for index, operation in enumerate(migration.operations):
+        if method not in vars(operation):
+            setattr(operation, method, _track_operation(getattr(operation, method), index))
+            tracked.append(operation)
+    # Deferred SQL is executed after Migration.apply() has returned (when the
+    # schema editor context manager exits), so it is not part of an operation.
+    _current.migration = (migration, DEFERRED, backwards)
+    _current.tracked = (method, tracked)
+
+
+def end_migration():
+    """
+    Record that no migration is being applied.
+    """
+    method, tracked = getattr(_current, 'tracked', (None, []))
+    for operation in tracked:
+        delattr(operation, method)
+    _current.migration = None
+    _current.tracked = (None, [])
+
+
+@contextlib.contextmanager
+def migrating(migration, backwards=False):
+    """
+    Record that migration is being applied (or unapplied) within this context.
+    """
+    begin_migration(migration, backwards)
+    try:
+        yield
+    finally:
+        end_migration()
+
+
+def _migration_label(migration):
+    return '{0}.{1}'.format(migration.app_label, migration.name)
+
+
+def _digest(args, kwargs):
+    """
+    A stable identifier for a statement, based upon the arguments that
+    will be passed to the function that executes it.
+    """
+    return hashlib.md5(force_bytes('{0!r}{1!r}'.format(
+        list(args), sorted(kwargs.items())
+    ))).hexdigest()
+
+
+def _progress_table_exists():
+    from .models import MigrationProgress
+    return _table_exists(MigrationProgress._meta.db_table)
+
+
+class Progress(object):
+    """
+    The record of which schemata a single statement within a migration has
+    been applied to.
+    """
+    def __init__(self, migration, operation, statement, backwards=False):
+        from .models import MigrationProgress
+
+        self.model = MigrationProgress
+        self.key = {
+            'migration': migration,
+            'operation': operation,
+            'statement': statement,
+            'backwards': backwards,
+        }
+        self.queryset = MigrationProgress.objects.filter(**self.key)
+        self.status = dict(self.queryset.values_list('schema', 'status'))
+
+    @classmethod
+    def for_statement(cls, args, kwargs):
+        """
+        Get the progress for the statement described by args and kwargs,
+        if we are within a migration (and able to store progress).
+        """
+        found = current_migration()
+        # Within a transaction, the progress would be rolled back along with
+        # the statement, so it could never be used to resume.
+        if not found or connection.in_atomic_block or not _progress_table_exists():
+            return None
+        migration, operation, backwards = found
+        return cls(_migration_label(migration), operation, _digest(args, kwargs), backwards)
+
+    def completed(self, schema_name):
+        return self.status.get(schema_name) == SUCCEEDED
+
+    def record(self, schema_name, status, duration, error=''):
+        if schema_name in self.status:
+            self.queryset.filter(schema=schema_name).update(status=status, duration=duration, error=error)
+        else:
+            self.model.objects.create(schema=schema_name, status=status, duration=duration, error=error, **self.key)
+        self.status[schema_name] = status
+
+
+def clear_progress():
+    """
+    Remove all progress records for the migration that is currently
+    being applied (or unapplied).
+
+    This should be called once a migration has completed.
+    """
+    from .models import MigrationProgress
+
+    found = current_migration()
+    if found and _progress_table_exists():
+        migration, operation, backwards = found
+        MigrationProgress.objects.filter(
+            migration=_migration_label(migration),
+            backwards=backwards,
+        ).delete()
+
+
+def _activate(schema):
+    schema_name = getattr(schema, 'schema', schema)
+    if schema_name == settings.TEMPLATE_SCHEMA:
+        activate_template_schema()
+    elif hasattr(schema, 'activate'):
+        schema.activate()
+    else:
+        activate_schema(schema_name)
+
+
+class FanoutReport(object):
+    """
+    The time spent (and the number of retries required, and the time spent
+    waiting for locks) applying statements to each schema.
+    """
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.retries = defaultdict(int)
+        self.waits = defaultdict(float)
+        #: The (kind, table) of the statement currently being applied.
+        self.statement = None
+        #: (schema name, kind, table, duration) for each statement applied
+        #: to each schema.
+        self.samples = []
+
+    def add(self, schema_name, duration, retries=0, waited=0.0):
+        self.durations[schema_name] += duration
+        self.retries[schema_name] += retries
+        self.waits[schema_name] += waited
+        if self.statement:
+            # The time spent waiting for locks depends on what else was
+            # running, not on the size of the table.
+            kind, table = self.statement
+            self.samples.append((schema_name, kind, table, duration - waited))
+
+    def most_blocked(self, count=None):
+        """
+        A list of (schema name, waited, retries, duration), those that spent
+        the longest waiting for locks first (and then the slowest).
+        """
+        ordered = sorted(
+            self.durations,
+            key=lambda schema_name: (-self.waits[schema_name], -self.durations[schema_name], schema_name)
+        )
+        return [
+            (schema_name, self.waits[schema_name], self.retries[schema_name], self.durations[schema_name])
+            for schema_name in ordered[:count]
+        ]
+
+    def log(self, count=None):
+        if count is None:
+            count = settings.BOARDINGHOUSE_FANOUT_REPORT_SIZE
+        if not count or not self.durations:
+            return
+        LOGGER.info('Schemata that waited longest for locks: %s', ', '.join(
+            '{0} ({1:.3f}s waiting, {2} retries, {3:.3f}s in total)'.format(*each)
+            for each in self.most_blocked(count)
+        ))
+
+
+def _is_lock_timeout(exc):
+    cause = getattr(exc, '__cause__', None)
+    return getattr(cause, 'pgcode', getattr(exc, 'pgcode', None)) == LOCK_NOT_AVAILABLE
+
+
+def _retry_delay(attempt):
+    """
+    Full jitter: a random delay of up to the base delay, doubled for
+    each previous attempt.
+    """
+    return random.uniform(0, settings.BOARDINGHOUSE_FANOUT_RETRY_DELAY * 2 ** attempt)
+
+
+def _set_timeouts(lock_timeout, statement_timeout, local=True):
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT set_config('lock_timeout', %s, %s), set_config('statement_timeout', %s, %s)",
+        [force_text(lock_timeout or 0), local, force_text(statement_timeout or 0), local]
+    )
+    return cursor.fetchone()
+
+
+def _execute_with_timeouts(function, args, kwargs, schema_name, atomic=True):
+    """
+    Call function(*args, **kwargs) with the configured lock and statement
+    timeouts in place, retrying if we fail to acquire a lock in time.
+
+    Statements that may not run inside a transaction (such as
+    ``CREATE INDEX CONCURRENTLY``) should pass ``atomic=False``: the timeouts
+    will then be set for the session, rather than a savepoint.
+
+    Returns a tuple of (retries, waited): the number of retries that were
+    required, and the time spent in the attempts that timed out waiting for
+    a lock, and in the delays before retrying them.
+    """
+    lock_timeout = settings.BOARDINGHOUSE_FANOUT_LOCK_TIMEOUT
+    statement_timeout = settings.BOARDINGHOUSE_FANOUT_STATEMENT_TIMEOUT
+
+    if not lock_timeout and not statement_timeout:
+        function(*args, **kwargs)
+        return 0, 0.0
+
+    cursor = connection.cursor()
+    cursor.execute("SELECT current_setting('lock_timeout'), current_setting('statement_timeout')")
+    previous = cursor.fetchone()
+
+    attempt = 0
+    waited = 0.0
+    while True:
+        start = time.time()
+        try:
+            if atomic:
+                # The savepoint means that a statement that timed out does not
+                # abort the migration's transaction, and may be retried.
+                with transaction.atomic():
+                    _set_timeouts(lock_timeout, statement_timeout)
+                    function(*args, **kwargs)
+                    _set_timeouts(*previous)
+            else:
+                _set_timeouts(lock_timeout, statement_timeout, local=False)
+                try:
+                    function(*args, **kwargs)
+                finally:
+                    _set_timeouts(*previous, local=False)
+            return attempt, waited
+        except DatabaseError as exc:
+            if not _is_lock_timeout(exc) or attempt >= settings.BOARDINGHOUSE_FANOUT_RETRIES:
+                raise
+            delay = _retry_delay(attempt)
+            attempt += 1
+            LOGGER.warning('Lock timeout in schema %s: retrying in %.2fs (attempt %d)',
+                           schema_name, delay, attempt)
+            time.sleep(delay)
+            waited += time.time() - start
+
+
+def _apply(schema, function, args, kwargs, atomic=True):
+    """
+    Activate schema, and apply function to it.
+
+    Returns a tuple of (duration, retries, waited).
+    """
+    _activate(schema)
+    start = time.time()
+    retries, waited = _execute_with_timeouts(function, args, kwargs, getattr(schema, 'schema', schema), atomic)
+    return time.time() - start, retries, waited
+
+
+def parallel(schemata, function, args=None, kwargs=None, workers=1, atomic=True):
+    """
+    Apply function(*args, **kwargs) to each schema, using a number of worker
+    threads.
+
+    Each worker uses it's own database connection (and closes it when
+    finished), so function must use :data:`django.db.connection`, rather
+    than a connection (or cursor) that was created in this thread. It must
+    also not be used when that connection is within a transaction, as the
+    workers will not be able to see uncommitted changes.
+
+    Returns a list of (schema, duration, retries, waited, exception) tuples, in the
+    order that the schemata were completed.
+    """
+    args = args or []
+    kwargs = kwargs or {}
+    pending = queue.Queue()
+    results = queue.Queue()
+
+    for schema in schemata:
+        pending.put(schema)
+
+    def worker():
+        try:
+            while True:
+                try:
+                    schema = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    duration, retries, waited = _apply(schema, function, args, kwargs, atomic)
+                except Exception as exc:
+                    results.put((schema, None, 0, 0.0, exc))
+                else:
+                    results.put((schema, duration, retries, waited, None))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for i in range(min(workers, pending.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return [results.get() for i in range(results.qsize())]
+
+
+def apply_to_schemata(schemata, function, args=None, kwargs=None, **options):
+    """
+    Activate each schema in turn, and call function(*args, **kwargs) with
+    it active.
+
+    Schemata may be schema names, or objects with a `schema` attribute and
+    an `activate()` method.
+
+    Within a migration, schemata that this statement has already been applied
+    to (by an earlier, interrupted, run) will be skipped.
+
+    If a `schema_editor` is passed in, the time spent in each schema is added
+    to it's `fanout_report`.
+
+    Statements that must not be executed within a transaction should pass
+    `atomic=False`: if they are executed outside of one, they may also pass
+    `workers` to apply them to a number of schemata at once (see
+    :func:`parallel`).
+    """
+    args = args or []
+    kwargs = kwargs or {}
+    atomic = options.get('atomic', True)
+    workers = options.get('workers') or 1
+    progress = Progress.for_statement(args, kwargs)
+    report = getattr(options.get('schema_editor'), 'fanout_report', None)
+
+    def completed(schema_name, duration, retries, waited):
+        if report is not None:
+            report.add(schema_name, duration, retries, waited)
+        if progress:
+            progress.record(schema_name, SUCCEEDED, duration)
+
+    def failed(schema_name, duration, exc):
+        # Within a transaction, this record would be rolled back along with
+        # everything else (and we would not be able to write it anyway).
+        if progress and not connection.in_atomic_block:
+            progress.record(schema_name, FAILED, duration, error=force_text(exc))
+
+    pending = []
+    for schema in schemata:
+        if progress and progress.completed(getattr(schema, 'schema', schema)):
+            LOGGER.debug('Skipping schema %s: statement already applied', getattr(schema, 'schema', schema))
+        else:
+            pending.append(schema)
+
+    if workers > 1 and not connection.in_atomic_block:
+        errors = []
+        for schema, duration, retries, waited, exc in parallel(pending, function, args, kwargs, workers, atomic):
+            schema_name = getattr(schema, 'schema', schema)
+            if exc is None:
+                completed(schema_name, duration, retries, waited)
+            else:
+                failed(schema_name, duration, exc)
+                errors.append(exc)
+        if errors:
+            raise errors[0]
+        return
+
+    for schema in pending:
+        schema_name = getattr(schema, 'schema', schema)
+        start = time.time()
+
+        try:
+            duration, retries, waited = _apply(schema, function, args, kwargs, atomic)
+        except Exception as exc:
+            failed(schema_name, time.time() - start, exc)
+            raise
+
+        completed(schema_name, duration, retries, waited)
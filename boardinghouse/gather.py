@@ -0,0 +1,382 @@
+"""
+Executing a query against each of a number of schemata concurrently, and
+merging the results as they are consumed.
+
+:meth:`boardinghouse.base.MultiSchemaMixin.from_schemata` combines the query
+for every schema into one ``UNION ALL``: with thousands of schemata, that is
+one enormous statement, planned and executed by a single backend.
+:func:`gather` instead executes the query for each schema separately (with
+the tables of schema aware models qualified with that schema, see
+:mod:`boardinghouse.backends.postgres.compiler`), using a number of worker
+threads, each with it's own database connection.
+
+Each schema's rows are fetched ``chunk_size`` at a time, in order (followed
+by the primary key, so that each chunk can start after the last row of the
+previous one, rather than at an offset). While one chunk of a schema is being
+consumed, the next one is fetched by one of the workers, so only a chunk or
+two of each schema is held in memory.
+
+If the queryset is ordered, the chunks of every schema are combined with a
+k-way merge (using a heap), so the merged rows are yielded in order without
+sorting them all again, as soon as the first chunk of each schema has been
+fetched. Text is ordered by codepoint (``COLLATE "C"``) rather than by the
+collation of the database, as that is how the rows are compared while
+merging them. Unordered results are yielded one schema after another. With a
+``limit``, each schema returns at most that many rows, and iteration stops as
+soon as ``limit`` rows have been yielded.
+
+As each chunk is a separate query, rows that are written while the results
+are being consumed may (or may not) be included.
+
+Each object has it's ``_schema`` attribute set to the name of the schema it
+came from.
+
+Worker threads cannot see changes that have not been committed, so within a
+transaction (or with only one worker) the schemata are queried one after
+another, using the current connection.
+"""
+from __future__ import unicode_literals
+
+import functools
+import heapq
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import CharField, F, Func, Q, TextField
+from django.utils import six
+from django.utils.six.moves import queue
+
+from .backends.postgres.compiler import qualify
+
+#: The prefix of the annotations that hold the values each schema's rows are
+#: ordered by.
+ORDER_PREFIX = '_gather_order_'
+
+
+class CollateC(Func):
+    """
+    Compare text by codepoint (as python does), whatever the collation of
+    it's column.
+    """
+    template = '%(expressions)s COLLATE "C"'
+
+
+@functools.total_ordering
+class Descending(object):
+    """
+    Wrap a value so that it sorts in the reverse order.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _get_ordering(queryset):
+    """
+    The (field name, descending) pairs that queryset is ordered by.
+    """
+    query = queryset.query
+    ordering = query.order_by or (query.default_ordering and query.get_meta().ordering) or []
+    result = []
+    for name in ordering:
+        if not isinstance(name, six.string_types):
+            raise ValueError('Only orderings by field name may be merged: {0!r}'.format(name))
+        if name == '?':
+            raise ValueError('Random ordering may not be merged.')
+        # A reversed queryset still lists it's ordering as it was given.
+        descending = name.startswith('-') == query.standard_ordering
+        name = name.lstrip('-+')
+        if name == 'pk':
+            name = query.get_meta().pk.name
+        result.append((name, descending))
+    return result
+
+
+def _sort_key(values, ordering):
+    # Postgres sorts NULL after everything else, and then reverses that for
+    # a descending ordering.
+    return tuple(
+        Descending((value is None, value)) if descending else (value is None, value)
+        for value, (name, descending) in zip(values, ordering)
+    )
+
+
+def _get_keys(queryset, ordering):
+    """
+    The (field name, descending) pairs that each schema's rows are fetched in
+    the order of: ordering, followed by the primary key (if it is not already
+    part of it), so that every row has a distinct position.
+    """
+    pk = queryset.query.get_meta().pk.name
+    if any(name == pk for name, descending in ordering):
+        return list(ordering)
+    return list(ordering) + [(pk, False)]
+
+
+def _prepare(queryset, keys):
+    """
+    The queryset that should be executed in each schema (before being
+    filtered, and sliced, for each chunk).
+    """
+    if queryset.query.low_mark or queryset.query.high_mark is not None:
+        raise ValueError('Pass a limit, rather than slicing the queryset.')
+    if getattr(queryset, '_fields', None) is not None:
+        raise ValueError('Only querysets of model instances may be gathered.')
+
+    aliases = ['{0}{1}'.format(ORDER_PREFIX, index) for index in range(len(keys))]
+    annotations = dict((alias, F(name)) for alias, (name, descending) in zip(aliases, keys))
+    resolved = queryset.annotate(**annotations).query.annotations
+    for alias, (name, descending) in zip(aliases, keys):
+        output_field = resolved[alias].output_field
+        if isinstance(output_field, (CharField, TextField)):
+            annotations[alias] = CollateC(F(name), output_field=output_field)
+
+    queryset = queryset.annotate(**annotations)
+    queryset.query.standard_ordering = True
+    return queryset.order_by(*[
+        '-' + alias if descending else alias
+        for alias, (name, descending) in zip(aliases, keys)
+    ])
+
+
+def _after(keys, values):
+    """
+    A filter for the rows that come after values (those of the last row
+    fetched) in the order of keys, or None if no row could.
+
+    Postgres sorts NULL after everything else (and so before everything else
+    when descending).
+    """
+    condition = None
+    equal = Q()
+    for index, ((name, descending), value) in enumerate(zip(keys, values)):
+        alias = '{0}{1}'.format(ORDER_PREFIX, index)
+        if value is None:
+            beyond = Q(**{alias + '__isnull': False}) if descending else None
+            same = Q(**{alias + '__isnull': True})
+        else:
+            beyond = Q(**{alias + ('__lt' if descending else '__gt'): value})
+            if not descending:
+                beyond |= Q(**{alias + '__isnull': True})
+            same = Q(**{alias: value})
+        if beyond is not None:
+            condition = equal & beyond if condition is None else condition | (equal & beyond)
+        equal &= same
+    return condition
+
+
+class _Stream(object):
+    """
+    The rows of one schema, fetched chunk_size at a time: each chunk is the
+    rows after the last one fetched (rather than an offset, or a cursor), so
+    a chunk may be fetched by any connection.
+    """
+    def __init__(self, queryset, schema_name, keys, chunk_size, limit=None):
+        self.queryset = queryset
+        self.schema_name = schema_name
+        self.keys = keys
+        self.chunk_size = chunk_size
+        self.remaining = limit
+        self.last = None
+        #: Whether the last chunk has been consumed (only ever set by the
+        #: thread consuming the stream).
+        self.exhausted = False
+        self.results = queue.Queue()
+
+    def fetch(self):
+        """
+        Fetch the next chunk.
+
+        Returns a list of (sort key, object), and whether it is the last chunk.
+        """
+        queryset = self.queryset
+        if self.last is not None:
+            after = _after(self.keys, self.last)
+            if after is None:
+                return [], True
+            queryset = queryset.filter(after)
+        size = self.chunk_size if self.remaining is None else min(self.chunk_size, self.remaining)
+        with qualify(connections[queryset.db], self.schema_name):
+            objects = list(queryset[:size])
+
+        rows = []
+        for obj in objects:
+            values = []
+            for index in range(len(self.keys)):
+                attr = '{0}{1}'.format(ORDER_PREFIX, index)
+                values.append(getattr(obj, attr))
+                delattr(obj, attr)
+            obj._schema = self.schema_name
+            rows.append((_sort_key(values, self.keys), obj))
+            self.last = values
+
+        if self.remaining is not None:
+            self.remaining -= len(rows)
+        return rows, len(rows) < size or self.remaining == 0
+
+
+class _SerialFetcher(object):
+    """
+    Fetch each chunk when it is needed, using the current connection.
+    """
+    def request(self, stream):
+        pass
+
+    def get(self, stream):
+        return stream.fetch()
+
+    def close(self):
+        pass
+
+
+class _ConcurrentFetcher(object):
+    """
+    Fetch the chunks that have been requested using a number of worker
+    threads (each with it's own connection), so that the next chunk of each
+    schema is fetched while the previous one is being consumed.
+
+    Once closed, the workers stop when their current query has finished.
+    """
+    def __init__(self, db, workers):
+        self.db = db
+        self.pending = queue.Queue()
+        self.stopped = threading.Event()
+        self.threads = [threading.Thread(target=self.worker) for i in range(workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def worker(self):
+        try:
+            while True:
+                stream = self.pending.get()
+                if stream is None or self.stopped.is_set():
+                    return
+                try:
+                    stream.results.put((stream.fetch(), None))
+                except Exception as exc:
+                    stream.results.put(((None, None), exc))
+        finally:
+            connections[self.db].close()
+
+    def request(self, stream):
+        self.pending.put(stream)
+
+    def get(self, stream):
+        result, exc = stream.results.get()
+        if exc is not None:
+            raise exc
+        return result
+
+    def close(self):
+        self.stopped.set()
+        for thread in self.threads:
+            self.pending.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+def _chunks(fetcher, stream):
+    """
+    Get the next chunk of stream (which must have been requested), and
+    request the one after it.
+    """
+    rows, stream.exhausted = fetcher.get(stream)
+    if not stream.exhausted:
+        fetcher.request(stream)
+    return rows
+
+
+def _merge(fetcher, streams):
+    """
+    Merge the (already sorted) rows of each of streams, yielding each object
+    in order: only the current chunk of each stream is held in memory.
+    """
+    for stream in streams:
+        fetcher.request(stream)
+
+    chunks = {}
+    heap = []
+    for index, stream in enumerate(streams):
+        chunks[index] = _chunks(fetcher, stream)
+        if chunks[index]:
+            # The index breaks ties, so the objects are never compared.
+            heap.append((chunks[index][0][0], index, 0))
+    heapq.heapify(heap)
+
+    while heap:
+        key, index, position = heap[0]
+        yield chunks[index][position][1]
+        position += 1
+        if position == len(chunks[index]) and not streams[index].exhausted:
+            chunks[index], position = _chunks(fetcher, streams[index]), 0
+        if position < len(chunks[index]):
+            heapq.heapreplace(heap, (chunks[index][position][0], index, position))
+        else:
+            heapq.heappop(heap)
+
+
+def _concatenate(fetcher, streams, workers):
+    """
+    Yield the objects of each of streams in turn: the first chunks of the
+    next few streams are requested while the current one is consumed.
+    """
+    for stream in streams[:workers]:
+        fetcher.request(stream)
+    for index, stream in enumerate(streams):
+        if index + workers < len(streams):
+            fetcher.request(streams[index + workers])
+        while True:
+            for key, obj in _chunks(fetcher, stream):
+                yield obj
+            if stream.exhausted:
+                break
+
+
+def gather(queryset, schemata, limit=None, workers=None, chunk_size=2000):
+    """
+    Execute queryset against each of schemata (schema objects, or names),
+    using up to workers (or
+    :data:`boardinghouse.settings.BOARDINGHOUSE_GATHER_WORKERS`) database
+    connections at once, and yield the objects from all of them, fetching
+    chunk_size rows from each schema at a time.
+
+    If queryset is ordered (by field names), the objects are yielded in that
+    order. Only the first limit objects are yielded.
+    """
+    workers = workers or settings.BOARDINGHOUSE_GATHER_WORKERS
+    schemata = [getattr(schema, 'schema', schema) for schema in schemata]
+    ordering = _get_ordering(queryset)
+    keys = _get_keys(queryset, ordering)
+    queryset = _prepare(queryset, keys)
+
+    if limit == 0 or not schemata:
+        return
+
+    streams = [_Stream(queryset, schema_name, keys, chunk_size, limit) for schema_name in schemata]
+
+    if workers < 2 or len(schemata) < 2 or connections[queryset.db].in_atomic_block:
+        fetcher = _SerialFetcher()
+    else:
+        fetcher = _ConcurrentFetcher(queryset.db, min(workers, len(schemata)))
+
+    try:
+        if ordering:
+            objects = _merge(fetcher, streams)
+        else:
+            objects = _concatenate(fetcher, streams, workers)
+
+        for count, obj in enumerate(objects, 1):
+            yield obj
+            if count == limit:
+                return
+    finally:
+        fetcher.close()
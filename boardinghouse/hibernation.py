@@ -0,0 +1,394 @@
+"""
+Archiving the records of inactive schemata, and dropping them.
+
+Deleting a schema object (without ``drop=True``) only marks it as inactive:
+it's database schema, along with every table, index and sequence in it, stays
+in the system catalogs, and is still migrated along with all of the others.
+
+When :data:`boardinghouse.settings.BOARDINGHOUSE_HIBERNATION_PATH` is set, an
+inactive schema may be hibernated (by :func:`hibernate`, or the
+``boardinghouse_hibernate`` command): the records of each of it's tables, and
+the values of it's sequences, are written to a compressed file in that
+directory, the database schema is dropped, and the schema object is marked as
+``hibernated``. Hibernated schemata are not migrated.
+
+The records are dumped from a single snapshot, so they are consistent with
+each other: when hibernating, the tables are locked against writes until the
+schema has been dropped, so nothing written in the meantime is lost.
+
+When a hibernated schema is activated again (by setting ``is_active``, or
+:func:`wake`), it is cloned from the (current) template schema, and the
+records are loaded back into it. The columns of each table are restored by
+name: columns that have been added since the schema was hibernated are given
+the default of their model field (as a migration would have done). If a
+migration has since removed a column (or table) that held records, or added
+a column that may not be null and has no default, waking the schema fails,
+and it stays hibernated (and inactive).
+
+The archive is removed once the woken schema has been committed. Before
+Django 1.9 (which has no ``transaction.on_commit``), it is left in place, and
+removed by :func:`remove_stale_archives` (which ``boardinghouse_hibernate``
+runs) once the schema is active.
+
+The migrations that had been applied when the schema was hibernated are
+recorded, and the :class:`boardinghouse.operations.RunPythonPerSchema`
+operations of those that have been applied since are run once the records
+have been loaded.
+
+The file contains the applied migrations, and then each table's records in
+the text format of ``COPY``, each preceded by a line naming the table and
+it's columns::
+
+    -- migrations {"applied": [["app", "0001_initial"]]}
+    -- table {"table": "app_model", "columns": ["id", "name"]}
+    1	First
+    \\.
+    -- sequence {"sequence": "app_model_id_seq", "last_value": 1, "is_called": true}
+"""
+from __future__ import unicode_literals
+
+import contextlib
+import gzip
+import json
+import logging
+import os
+import tempfile
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.utils.encoding import force_bytes
+
+from . import clone, lazy, signals
+from .provisioning import READY
+from .schema import activate_schema, deactivate_schema, get_active_schema_name, get_schema_model
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+HIBERNATED = 'hibernated'
+
+TABLES = """
+    SELECT c.relname,
+           ARRAY(SELECT a.attname
+                   FROM pg_catalog.pg_attribute a
+                  WHERE a.attrelid = c.oid
+                    AND a.attnum > 0
+                    AND NOT a.attisdropped
+               ORDER BY a.attnum)
+      FROM pg_catalog.pg_class c
+INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+     WHERE n.nspname = %s
+       AND c.relkind = 'r'
+  ORDER BY c.relname
+"""
+
+SEQUENCES = """
+    SELECT c.relname
+      FROM pg_catalog.pg_class c
+INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+     WHERE n.nspname = %s
+       AND c.relkind = 'S'
+  ORDER BY c.relname
+"""
+
+COLUMNS = """
+    SELECT a.attname, a.attnotnull, d.adbin IS NOT NULL
+      FROM pg_catalog.pg_attribute a
+ LEFT JOIN pg_catalog.pg_attrdef d ON (d.adrelid = a.attrelid AND d.adnum = a.attnum)
+     WHERE a.attrelid = %s::regclass
+       AND a.attnum > 0
+       AND NOT a.attisdropped
+  ORDER BY a.attnum
+"""
+
+MIGRATIONS = b'-- migrations '
+TABLE = b'-- table '
+SEQUENCE = b'-- sequence '
+END = b'\\.\n'
+
+
+def is_enabled():
+    return bool(settings.BOARDINGHOUSE_HIBERNATION_PATH)
+
+
+def archive_path(schema_name):
+    return os.path.join(settings.BOARDINGHOUSE_HIBERNATION_PATH, '{0}.gz'.format(schema_name))
+
+
+def _qualify(schema, name):
+    return '{0}.{1}'.format(connection.ops.quote_name(schema), connection.ops.quote_name(name))
+
+
+def _header(prefix, **data):
+    return prefix + json.dumps(data, sort_keys=True).encode('utf-8') + b'\n'
+
+
+@contextlib.contextmanager
+def _snapshot():
+    """
+    Run the queries within this context against a single snapshot of the
+    database (unless we are already within a transaction).
+    """
+    if connection.in_atomic_block:
+        yield
+        return
+    with transaction.atomic():
+        connection.cursor().execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+        yield
+
+
+def dump(schema_name, fp):
+    """
+    Write the applied migrations, and the records and sequence values of a
+    schema, to fp.
+    """
+    with _snapshot():
+        _dump(schema_name, fp)
+
+
+def _dump(schema_name, fp):
+    cursor = connection.cursor()
+
+    applied = sorted(MigrationRecorder(connection).applied_migrations())
+    fp.write(_header(MIGRATIONS, applied=[list(key) for key in applied]))
+
+    cursor.execute(TABLES, [schema_name])
+    for table, columns in cursor.fetchall():
+        fp.write(_header(TABLE, table=table, columns=columns))
+        cursor.copy_expert('COPY {0} ({1}) TO STDOUT'.format(
+            _qualify(schema_name, table),
+            ', '.join(connection.ops.quote_name(column) for column in columns),
+        ), fp)
+        fp.write(END)
+
+    cursor.execute(SEQUENCES, [schema_name])
+    for sequence in [row[0] for row in cursor.fetchall()]:
+        cursor.execute('SELECT last_value, is_called FROM {0}'.format(_qualify(schema_name, sequence)))
+        last_value, is_called = cursor.fetchone()
+        fp.write(_header(SEQUENCE, sequence=sequence, last_value=last_value, is_called=is_called))
+
+
+def _copy_text(value):
+    """
+    The representation of value in the text format of COPY.
+    """
+    if value is None:
+        return b'\\N'
+    for character, escaped in [('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r')]:
+        value = value.replace(character, escaped)
+    return force_bytes(value)
+
+
+def _missing_columns(cursor, schema_name, table, columns):
+    """
+    Get the columns of table that are not in columns (as they were added
+    after the schema was hibernated), and the value (in the text format of
+    COPY) that each record should have: the default of it's model field.
+
+    Columns with a default in the database are left to the database.
+    """
+    fields = {}
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.db_table == table:
+            fields = dict((field.column, field) for field in model._meta.local_fields)
+
+    missing = []
+    cursor.execute(COLUMNS, [_qualify(schema_name, table)])
+    for column, not_null, has_default in cursor.fetchall():
+        if column in columns or has_default:
+            continue
+        field = fields.get(column)
+        if field is not None and field.has_default():
+            missing.append((column, field.get_db_prep_save(field.get_default(), connection)))
+        elif not_null:
+            raise ValueError('Unable to wake schema {0}: {1}.{2} may not be null, and has no default'.format(
+                schema_name, table, column
+            ))
+
+    if not missing:
+        return [], b''
+    cursor.execute('SELECT {0}'.format(', '.join(['%s::text'] * len(missing))), [value for column, value in missing])
+    values = cursor.fetchone()
+    return [column for column, value in missing], b''.join(b'\t' + _copy_text(value) for value in values)
+
+
+def load(schema_name, fp):
+    """
+    Load records and sequence values written by :func:`dump` into a schema
+    (which must already have the tables and sequences).
+
+    Returns the migrations that had been applied when the records were
+    dumped, as a list of (app_label, migration name), or None if they were
+    not recorded.
+    """
+    cursor = connection.cursor()
+    # The tables are loaded in any order, so foreign keys may only be checked
+    # once they all have been.
+    cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+    applied = None
+
+    for line in fp:
+        if line.startswith(MIGRATIONS):
+            header = json.loads(line[len(MIGRATIONS):].decode('utf-8'))
+            applied = [tuple(key) for key in header['applied']]
+        elif line.startswith(TABLE):
+            header = json.loads(line[len(TABLE):].decode('utf-8'))
+            columns, values = _missing_columns(cursor, schema_name, header['table'], header['columns'])
+            # Each table's records are buffered (in memory, or on disk if
+            # there are a lot of them), as COPY needs a file of it's own.
+            with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as records:
+                for line in fp:
+                    if line == END:
+                        break
+                    records.write(line[:-1] + values + b'\n' if values else line)
+                records.seek(0)
+                cursor.copy_expert('COPY {0} ({1}) FROM STDIN'.format(
+                    _qualify(schema_name, header['table']),
+                    ', '.join(connection.ops.quote_name(column) for column in header['columns'] + columns),
+                ), records)
+        elif line.startswith(SEQUENCE):
+            header = json.loads(line[len(SEQUENCE):].decode('utf-8'))
+            cursor.execute('SELECT setval(%s, %s, %s)', [
+                _qualify(schema_name, header['sequence']), header['last_value'], header['is_called'],
+            ])
+        elif line.strip():
+            raise ValueError('Unexpected line in hibernated schema: {0!r}'.format(line))
+
+    return applied
+
+
+def applied_since(applied):
+    """
+    The migrations that have been applied since those in applied were, in
+    the order they were applied in, as a list of (app_label, migration name).
+    """
+    from django.db.migrations.loader import MigrationLoader
+
+    loader = MigrationLoader(connection)
+    applied = set(applied)
+    since = []
+    for leaf in sorted(loader.graph.leaf_nodes()):
+        for key in loader.graph.forwards_plan(leaf):
+            if key in loader.applied_migrations and key not in applied and key not in since:
+                since.append(key)
+    return since
+
+
+def data_migrations(migrations):
+    """
+    The RunPythonPerSchema operations of each of migrations, as a list of
+    (app_label.migration name, operation index).
+    """
+    from django.db.migrations.loader import MigrationLoader
+
+    from .operations import RunPythonPerSchema
+
+    loader = MigrationLoader(connection)
+    return [
+        ('{0}.{1}'.format(*key), index)
+        for key in migrations
+        for index, operation in enumerate(loader.get_migration(*key).operations)
+        if isinstance(operation, RunPythonPerSchema)
+    ]
+
+
+def _run_data_migrations(schema_name, migrations):
+    """
+    Run the RunPythonPerSchema operations of each of migrations in a schema.
+    """
+    operations = data_migrations(migrations)
+    if not operations:
+        return
+
+    previous = get_active_schema_name()
+    with lazy.suspended():
+        activate_schema(schema_name)
+        try:
+            for migration, index in operations:
+                LOGGER.info('Running %s (operation %d) in woken schema %s', migration, index, schema_name)
+                lazy.run_operation(migration, index)
+        finally:
+            if previous:
+                activate_schema(previous)
+            else:
+                deactivate_schema()
+
+
+def hibernate(schema):
+    """
+    Archive the records of an inactive schema, and drop it.
+
+    The schema object is locked (and checked to still be inactive), and
+    every table in the schema is locked against writes, so that no records
+    may be written between being archived and the schema being dropped.
+    """
+    if schema.is_active:
+        raise ValueError('Only inactive schemata may be hibernated: {0}'.format(schema.schema))
+
+    path = archive_path(schema.schema)
+
+    with transaction.atomic():
+        locked = get_schema_model().objects.select_for_update().filter(pk=schema.pk, is_active=False)
+        if not list(locked.values_list('pk', flat=True)):
+            raise ValueError('Only inactive schemata may be hibernated: {0}'.format(schema.schema))
+        cursor = connection.cursor()
+        cursor.execute(TABLES, [schema.schema])
+        tables = [_qualify(schema.schema, table) for table, columns in cursor.fetchall()]
+        if tables:
+            cursor.execute('LOCK TABLE {0} IN SHARE MODE'.format(', '.join(tables)))
+
+        with gzip.open(path, 'wb') as fp:
+            _dump(schema.schema, fp)
+
+        get_schema_model().objects.filter(pk=schema.pk).update(status=HIBERNATED)
+        signals.schemata_deleted.send(sender=schema.__class__, schemata=[schema.schema])
+    schema.status = HIBERNATED
+
+    LOGGER.info('Schema %s hibernated to %s (%d bytes)', schema.schema, path, os.path.getsize(path))
+
+
+def _remove_archive(path):
+    # The archive is only removed once the schema it was loaded into has
+    # been committed: without on_commit (before Django 1.9), it is left for
+    # remove_stale_archives().
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(lambda: os.remove(path))
+
+
+def remove_stale_archives():
+    """
+    Remove the archives of schemata that have been woken (and are active).
+
+    Returns the names of the schemata whose archives were removed.
+    """
+    removed = []
+    woken = get_schema_model().objects.active().exclude(status=HIBERNATED).values_list('schema', flat=True)
+    for schema_name in woken:
+        path = archive_path(schema_name)
+        if os.path.exists(path):
+            os.remove(path)
+            removed.append(schema_name)
+    return removed
+
+
+def wake(schema):
+    """
+    Clone a hibernated schema from the template schema, load it's records
+    back into it, and run any data migrations it has missed.
+    """
+    path = archive_path(schema.schema)
+
+    with transaction.atomic():
+        clone.create_schema(settings.TEMPLATE_SCHEMA, schema.schema)
+        with gzip.open(path, 'rb') as fp:
+            applied = load(schema.schema, fp)
+        if applied is not None:
+            _run_data_migrations(schema.schema, applied_since(applied))
+        get_schema_model().objects.filter(pk=schema.pk).update(status=READY)
+        _remove_archive(path)
+
+    schema.status = READY
+
+    LOGGER.info('Schema %s woken from %s', schema.schema, path)
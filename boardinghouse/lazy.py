@@ -0,0 +1,283 @@
+"""
+Lazy migration of schemata.
+
+When :data:`boardinghouse.settings.BOARDINGHOUSE_LAZY_MIGRATIONS` is enabled,
+private statements executed by the schema editor during ``migrate`` are
+only applied immediately to the template schema (and other sources of
+schemata, such as :mod:`boardinghouse.contrib.template`), and to those
+schemata that are active, were activated within
+:data:`boardinghouse.settings.BOARDINGHOUSE_LAZY_MIGRATION_WINDOW`, and are
+otherwise up to date. This means that deploy time is proportional to the
+number of active tenants, rather than the total number of tenants.
+
+Every such statement is stored (in order) as a
+:class:`boardinghouse.models.MigrationStatement`, and each schema's position
+in that log is stored as a :class:`boardinghouse.models.SchemaMigrationState`.
+A schema that has no state has had every statement applied to it: this is
+true of all schemata that existed before lazy migrations were enabled, and
+all schemata created since (as they are cloned from the template schema).
+Before a statement is recorded, every schema without a state is given one.
+
+When a schema that is lagging behind is next activated, the statements it
+is missing are applied to it, under an advisory lock (so that concurrent
+activations do not both try to apply them), before anything else happens.
+
+Lazy migrations should not be disabled while schemata are lagging: use the
+``boardinghouse_catch_up`` management command to bring them all up to date
+first.
+"""
+from __future__ import unicode_literals
+
+import contextlib
+import datetime
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.encoding import force_bytes, force_text
+
+from .fanout import _migration_label, apply_to_schemata, current_migration
+from .schema import _table_exists, get_active_schema_name, get_schema_model
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+_state = threading.local()
+
+#: How often we record that a schema has been activated.
+TOUCH_INTERVAL = datetime.timedelta(hours=1)
+
+
+@contextlib.contextmanager
+def suspended():
+    """
+    Within this context, activating a schema will not bring it up to date,
+    or record that it was activated.
+    """
+    previous = is_suspended()
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', False)
+
+
+def _tables_exist():
+    from .models import MigrationStatement, SchemaMigrationState
+    return _table_exists(MigrationStatement._meta.db_table) and \
+        _table_exists(SchemaMigrationState._meta.db_table)
+
+
+def is_enabled(schema_editor=None):
+    """
+    Should statements executed by this schema editor be applied lazily?
+
+    Only statements that come from a schema editor (rather than some other
+    sender of :data:`boardinghouse.signals.schema_aware_operation`) may be,
+    as we need to be able to store the SQL.
+
+    Distributed migrations (see :mod:`boardinghouse.distributed`) use the
+    same mechanism.
+    """
+    if not settings.BOARDINGHOUSE_LAZY_MIGRATIONS and not settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT:
+        return False
+    if schema_editor is None or schema_editor.collect_sql:
+        return False
+    return _tables_exist()
+
+
+def _lock_key(schema_name):
+    return int(hashlib.md5(force_bytes('boardinghouse.lazy.{0}'.format(schema_name))).hexdigest()[:15], 16)
+
+
+def _render(schema_editor, sql, params):
+    """
+    Get the statement as it will be executed, with any parameters applied.
+    """
+    if not params:
+        return sql
+    cursor = schema_editor.connection.cursor()
+    return force_text(cursor.cursor.mogrify(sql, params))
+
+
+def _recording(function, statement_id):
+    from .models import SchemaMigrationState
+
+    def apply(*args, **kwargs):
+        function(*args, **kwargs)
+        SchemaMigrationState.objects.filter(
+            schema=get_active_schema_name()
+        ).update(statement_id=statement_id)
+
+    return apply
+
+
+def eager_schemata(schemata, statement_id):
+    """
+    Filter the queryset of schemata to those that should have a new statement
+    applied immediately: active schemata that have been activated recently,
+    and have had every statement up to (and including) statement_id applied.
+
+    When migrations are distributed, no schemata are migrated immediately.
+    """
+    from .models import SchemaMigrationState
+
+    if settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT:
+        return schemata.none()
+
+    recent = timezone.now() - settings.BOARDINGHOUSE_LAZY_MIGRATION_WINDOW
+    current = SchemaMigrationState.objects.filter(
+        statement_id=statement_id,
+        last_activated__gte=recent,
+    )
+    return schemata.filter(is_active=True, schema__in=current.values('schema'))
+
+
+def apply_lazily(schemata, db_table, function, args=None, kwargs=None, **options):
+    """
+    Record the statement in args (or, without args, the
+    :class:`boardinghouse.operations.RunPythonPerSchema` operation that is
+    being applied), and apply it to those schemata that should be migrated
+    immediately.
+    """
+    from .models import MigrationStatement, SchemaMigrationState
+
+    found = current_migration()
+    if args:
+        sql, params = args
+        recorded = {'sql': _render(options['schema_editor'], sql, params)}
+    elif found and found[1] >= 0:
+        recorded = {'operation': found[1], 'backwards': found[2]}
+    else:
+        raise ValueError('Only statements, or operations within a migration, may be applied lazily.')
+
+    previous = MigrationStatement.objects.aggregate(latest=Max('id'))['latest'] or 0
+    statement = MigrationStatement.objects.create(
+        migration=_migration_label(found[0]) if found else '',
+        db_table=db_table or '',
+        **recorded
+    )
+
+    existing = set(SchemaMigrationState.objects.values_list('schema', flat=True))
+    SchemaMigrationState.objects.bulk_create([
+        SchemaMigrationState(schema=schema_name, statement_id=previous)
+        for schema_name in schemata.values_list('schema', flat=True)
+        if schema_name not in existing
+    ])
+
+    eager = eager_schemata(schemata, previous)
+
+    with suspended():
+        apply_to_schemata(eager, _recording(function, statement.pk), args, kwargs, **options)
+
+
+def _load_operation(migration, index):
+    """
+    Load the operation at index within migration (as app_label.name), and
+    the historical apps it should be run with.
+    """
+    from django.db.migrations.loader import MigrationLoader
+
+    app_label, name = migration.split('.', 1)
+    loader = MigrationLoader(connection)
+    state = loader.project_state((app_label, name), at_end=False)
+    operations = loader.get_migration(app_label, name).operations
+    for operation in operations[:index]:
+        operation.state_forwards(app_label, state)
+    return operations[index], state.apps
+
+
+def run_operation(migration, index, backwards=False):
+    """
+    Run the code (or reverse code) of the
+    :class:`boardinghouse.operations.RunPythonPerSchema` operation at index
+    within migration (as app_label.name) in the active schema.
+    """
+    from .operations import _call_in_chunks
+
+    operation, apps = _load_operation(migration, index)
+    code = operation.reverse_code if backwards else operation.code
+    with suspended(), connection.schema_editor() as schema_editor:
+        _call_in_chunks(code, apps, schema_editor)
+
+
+def catch_up(schema_name, touch=True):
+    """
+    Apply any statements that the (currently active) schema is missing.
+
+    If touch is True, then the schema is also recorded as having been
+    activated now.
+
+    Returns the number of statements that were applied.
+    """
+    from .models import MigrationStatement, SchemaMigrationState
+
+    if not _tables_exist():
+        return 0
+
+    cursor = connection.cursor()
+    cursor.execute(
+        'SELECT state.statement_id, state.last_activated, (SELECT max(id) FROM {0}) '
+        'FROM (SELECT %s::text AS schema) AS activated '
+        'LEFT OUTER JOIN {1} AS state USING (schema)'.format(
+            MigrationStatement._meta.db_table,
+            SchemaMigrationState._meta.db_table,
+        ),
+        [schema_name]
+    )
+    statement_id, last_activated, latest = cursor.fetchone()
+    now = timezone.now()
+    applied = 0
+
+    # A schema with no state is up to date. Other sources of schemata (like
+    # templates) are always migrated immediately, so they never need one.
+    if statement_id is None:
+        if touch and get_schema_model().objects.filter(schema=schema_name).exists():
+            SchemaMigrationState.objects.get_or_create(schema=schema_name, defaults={
+                'statement_id': latest or 0,
+                'last_activated': now,
+            })
+        return 0
+
+    if latest and statement_id < latest:
+        with transaction.atomic():
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [_lock_key(schema_name)])
+            # Another process may have brought the schema up to date while
+            # we were waiting for the lock.
+            state = SchemaMigrationState.objects.get(schema=schema_name)
+            for statement in MigrationStatement.objects.filter(pk__gt=state.statement_id):
+                if statement.operation is None:
+                    cursor.execute(statement.sql)
+                else:
+                    run_operation(statement.migration, statement.operation, statement.backwards)
+                state.statement_id = statement.pk
+                applied += 1
+            if touch:
+                state.last_activated = now
+            state.save()
+        if applied:
+            LOGGER.info('Applied %d deferred statements to schema %s', applied, schema_name)
+    elif touch and (last_activated is None or last_activated < now - TOUCH_INTERVAL):
+        SchemaMigrationState.objects.filter(schema=schema_name).update(last_activated=now)
+
+    return applied
+
+
+def lagging_schemata():
+    """
+    The names of all schemata that have statements waiting to be applied.
+    """
+    from .models import MigrationStatement, SchemaMigrationState
+
+    latest = MigrationStatement.objects.aggregate(latest=Max('id'))['latest'] or 0
+    return SchemaMigrationState.objects.filter(
+        statement_id__lt=latest
+    ).values_list('schema', flat=True)
@@ -0,0 +1,26 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_catch_up`
+
+Apply any deferred migration statements to every schema that is lagging
+behind (see :mod:`boardinghouse.lazy`).
+
+This does not count as activating the schemata, so they will still not be
+migrated immediately by subsequent lazy migrations, unless they are used.
+"""
+from django.core.management.base import BaseCommand
+
+from ... import lazy
+from ...schema import activate_schema, deactivate_schema
+
+
+class Command(BaseCommand):
+    help = 'Apply deferred migration statements to all lagging schemata.'
+
+    def handle(self, *args, **options):
+        for schema_name in list(lazy.lagging_schemata()):
+            with lazy.suspended():
+                activate_schema(schema_name)
+                applied = lazy.catch_up(schema_name, touch=False)
+                deactivate_schema()
+            if int(options.get('verbosity', 1)) > 0:
+                self.stdout.write('Applied {0} statements to {1}'.format(applied, schema_name))
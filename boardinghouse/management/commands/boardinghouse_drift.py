@@ -0,0 +1,86 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_drift`
+
+Report the schemata whose structure differs from the template schema, and
+how (see :mod:`boardinghouse.drift`).
+
+Items that are missing from a schema are prefixed with ``-``, and extra
+items with ``+``. Pass schema names to only check those schemata.
+
+With ``--repair``, the schemata that have drifted are brought back into line
+with the template schema instead (see :func:`boardinghouse.drift.repair`),
+using ``--workers`` database connections at once.
+"""
+from optparse import make_option
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...drift import find_drift, repair
+from ...schema import _schema_exists
+
+
+class Command(BaseCommand):
+    help = 'Report schemata that have drifted from the template schema.'
+    args = '[schema ...]'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--repair', action='store_true', dest='repair', default=False,
+                help='Repair the schemata that have drifted.'),
+            make_option('--workers', action='store', dest='workers', type='int', default=1,
+                help='How many schemata to repair at once.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemata', nargs='*',
+            help='Only check these schemata.')
+        parser.add_argument('--repair', action='store_true', dest='repair', default=False,
+            help='Repair the schemata that have drifted.')
+        parser.add_argument('--workers', action='store', dest='workers', type=int, default=1,
+            help='How many schemata to repair at once.')
+
+    def handle(self, *args, **options):
+        schemata = options.get('schemata') or list(args) or None
+
+        if not _schema_exists(settings.TEMPLATE_SCHEMA):
+            raise CommandError('The template schema does not exist.')
+
+        if options.get('repair'):
+            return self.repair(schemata, options.get('workers') or 1)
+
+        drifted = find_drift(schemata)
+
+        if not drifted:
+            self.stdout.write('No schemata have drifted from {0}.'.format(settings.TEMPLATE_SCHEMA))
+            return
+
+        for drift in drifted:
+            self.stdout.write('{0}:'.format(drift.schema))
+            for item in drift.missing:
+                self.stdout.write('  - {0}'.format(item))
+            for item in drift.extra:
+                self.stdout.write('  + {0}'.format(item))
+
+        self.stdout.write('{0} schemata have drifted from {1}.'.format(len(drifted), settings.TEMPLATE_SCHEMA))
+
+    def repair(self, schemata, workers):
+        results = repair(schemata, workers)
+
+        if not results:
+            self.stdout.write('No schemata have drifted from {0}.'.format(settings.TEMPLATE_SCHEMA))
+            return
+
+        for schema_name, result in sorted(results.items()):
+            self.stdout.write('{0}:'.format(schema_name))
+            for sql in result.statements:
+                self.stdout.write('  {0}'.format(sql))
+            for item in result.unrepaired:
+                self.stdout.write('  not repaired: {0}'.format(item))
+            if result.error:
+                self.stderr.write('  failed: {0}'.format(result.error))
+
+        failed = [schema_name for schema_name, result in results.items() if result.error]
+        if failed:
+            raise CommandError('Unable to repair {0} schemata: {1}'.format(len(failed), ', '.join(sorted(failed))))
@@ -0,0 +1,53 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_fanout_worker`
+
+Apply deferred migration statements to the schemata queued up by a
+coordinating ``migrate`` (see :mod:`boardinghouse.distributed`).
+
+Any number of workers may be run at once, on any number of machines. By
+default, a worker polls for new tasks forever: with ``--once``, it exits
+when there are no tasks left for it to claim.
+"""
+from optparse import make_option
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ... import distributed
+
+
+class Command(BaseCommand):
+    help = 'Migrate schemata queued up by a distributed migration.'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--batch-size', action='store', dest='batch_size', type='int', default=None,
+                help='How many schemata to claim at a time.'),
+            make_option('--once', action='store_true', dest='once', default=False,
+                help='Exit when there are no tasks left to claim.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=None,
+            help='How many schemata to claim at a time.')
+        parser.add_argument('--once', action='store_true', dest='once', default=False,
+            help='Exit when there are no tasks left to claim.')
+
+    def handle(self, *args, **options):
+        batch_size = options.get('batch_size') or settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT_BATCH_SIZE
+        verbosity = int(options.get('verbosity', 1))
+        worker = distributed.worker_name()
+
+        while True:
+            results = distributed.work(batch_size, worker)
+            if verbosity > 0:
+                for schema_name, error in results:
+                    if error:
+                        self.stderr.write('Failed to migrate {0}: {1}'.format(schema_name, error))
+                    else:
+                        self.stdout.write('Migrated {0}'.format(schema_name))
+            if options.get('once'):
+                return
+            time.sleep(settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT_POLL_INTERVAL)
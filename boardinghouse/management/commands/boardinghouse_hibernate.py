@@ -0,0 +1,64 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_hibernate`
+
+Hibernate inactive schemata: archive their records, and drop them (see
+:mod:`boardinghouse.hibernation`). Pass schema names to only hibernate those
+schemata: otherwise, every inactive schema is hibernated. The archives of
+schemata that have since been woken are removed.
+
+With ``--wake``, the named schemata are restored instead, and made active.
+"""
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import hibernation
+from ...schema import get_schema_model
+
+
+class Command(BaseCommand):
+    help = 'Archive and drop inactive schemata, or restore them.'
+    args = '[schema ...]'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--wake', action='store_true', dest='wake', default=False,
+                help='Restore the named schemata.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemata', nargs='*',
+            help='Only hibernate (or wake) these schemata.')
+        parser.add_argument('--wake', action='store_true', dest='wake', default=False,
+            help='Restore the named schemata.')
+
+    def handle(self, *args, **options):
+        schemata = options.get('schemata') or list(args)
+        verbosity = int(options.get('verbosity', 1))
+
+        if not hibernation.is_enabled():
+            raise CommandError('BOARDINGHOUSE_HIBERNATION_PATH is not set.')
+
+        queryset = get_schema_model().objects.all()
+        if schemata:
+            queryset = queryset.filter(schema__in=schemata)
+
+        if options.get('wake'):
+            if not schemata:
+                raise CommandError('Pass the names of the schemata to wake.')
+            for schema in queryset.filter(status=hibernation.HIBERNATED):
+                schema.is_active = True
+                schema.save()
+                if verbosity > 0:
+                    self.stdout.write('Woke {0}'.format(schema.schema))
+            return
+
+        for schema in queryset.inactive().exclude(status=hibernation.HIBERNATED):
+            hibernation.hibernate(schema)
+            if verbosity > 0:
+                self.stdout.write('Hibernated {0}'.format(schema.schema))
+
+        for schema_name in hibernation.remove_stale_archives():
+            if verbosity > 1:
+                self.stdout.write('Removed the archive of {0}'.format(schema_name))
@@ -0,0 +1,80 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_orphans`
+
+List the schemata in the database that do not belong to any schema object
+(see :mod:`boardinghouse.orphans`), along with their size on disk.
+
+Schemata that may be orphans, but do not have the prefix of a schema that
+boardinghouse creates, are listed as unclaimed. They are only treated as
+orphans when they are named on the command line.
+
+With ``--reap``, the orphans are renamed to tombstones, and then dropped
+a few at a time (see :mod:`boardinghouse.reaper`).
+"""
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from ... import orphans, reaper
+
+
+class Command(BaseCommand):
+    help = 'List (and optionally drop) schemata that do not belong to anything.'
+    args = '[schema ...]'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--reap', action='store_true', dest='reap', default=False,
+                help='Drop the orphaned schemata.'),
+            make_option('--batch-size', action='store', dest='batch_size', type='int', default=10,
+                help='How many schemata to drop in each transaction.'),
+            make_option('--pause', action='store', dest='pause', type='float', default=1.0,
+                help='How many seconds to wait between batches.'),
+            make_option('--lock-timeout', action='store', dest='lock_timeout', default='1s',
+                help='How long each batch may wait for a lock.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemata', nargs='*',
+            help='Also treat these unclaimed schemata as orphans.')
+        parser.add_argument('--reap', action='store_true', dest='reap', default=False,
+            help='Drop the orphaned schemata.')
+        parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=10,
+            help='How many schemata to drop in each transaction.')
+        parser.add_argument('--pause', action='store', dest='pause', type=float, default=1.0,
+            help='How many seconds to wait between batches.')
+        parser.add_argument('--lock-timeout', action='store', dest='lock_timeout', default='1s',
+            help='How long each batch may wait for a lock.')
+
+    def handle(self, *args, **options):
+        schemata = options.get('schemata') or list(args)
+        verbosity = int(options.get('verbosity', 1))
+        unclaimed = orphans.find_unclaimed()
+
+        missing = set(schemata) - set(schema_name for schema_name, size in unclaimed)
+        if missing:
+            raise CommandError('Unable to treat known (or missing) schemata as orphans: {0}'.format(', '.join(sorted(missing))))
+
+        found = orphans.find_orphans(include=schemata)
+
+        if verbosity > 0:
+            for schema_name, size in found:
+                self.stdout.write('{0}\t{1}'.format(schema_name, filesizeformat(size)))
+            self.stdout.write('{0} orphaned schemata, {1}'.format(
+                len(found), filesizeformat(sum(size for schema_name, size in found))
+            ))
+            for schema_name, size in unclaimed:
+                if schema_name not in schemata:
+                    self.stdout.write('{0}\t{1}\t(unclaimed)'.format(schema_name, filesizeformat(size)))
+
+        if options.get('reap') and found:
+            reaper.condemn([schema_name for schema_name, size in found])
+            dropped, skipped = reaper.reap(
+                batch_size=options.get('batch_size') or 10,
+                pause=options.get('pause', 1.0),
+                lock_timeout=options.get('lock_timeout') or '1s',
+            )
+            if verbosity > 0:
+                self.stdout.write('Dropped {0} schemata, skipped {1}'.format(dropped, skipped))
@@ -0,0 +1,93 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_plan_fanout`
+
+Estimate how long the unapplied migrations will take to apply to every
+schema, without applying them (see :mod:`boardinghouse.planner`).
+
+Takes the same ``app_label`` and ``migration_name`` arguments as
+``migrate``. Statements that rewrite tables are flagged.
+"""
+from optparse import make_option
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+from ...planner import REWRITE, plan_fanout
+
+
+def _megabytes(size):
+    return '{0:.1f} MB'.format(size / (1024.0 * 1024.0))
+
+
+class Command(BaseCommand):
+    help = 'Estimate the time that applying migrations to every schema will take.'
+    args = '[app_label] [migration_name]'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--database', action='store', dest='database', default=DEFAULT_DB_ALIAS,
+                help='Nominates a database to plan for. Defaults to the "default" database.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label', nargs='?',
+            help='App label of an application to plan migrations for.')
+        parser.add_argument('migration_name', nargs='?',
+            help='Database state will be brought to the state after that migration.')
+        parser.add_argument('--database', action='store', dest='database', default=DEFAULT_DB_ALIAS,
+            help='Nominates a database to plan for. Defaults to the "default" database.')
+
+    def get_targets(self, executor, app_label=None, migration_name=None):
+        if app_label and app_label not in executor.loader.migrated_apps:
+            raise CommandError("App '{0}' does not have migrations.".format(app_label))
+        if app_label and migration_name:
+            if migration_name == 'zero':
+                return [(app_label, None)]
+            try:
+                migration = executor.loader.get_migration_by_prefix(app_label, migration_name)
+            except KeyError:
+                raise CommandError("Cannot find a migration matching '{0}' from app '{1}'.".format(
+                    migration_name, app_label))
+            return [(app_label, migration.name)]
+        if app_label:
+            return [key for key in executor.loader.graph.leaf_nodes() if key[0] == app_label]
+        return executor.loader.graph.leaf_nodes()
+
+    def handle(self, *args, **options):
+        app_label = options.get('app_label') or (args[0] if args else None)
+        migration_name = options.get('migration_name') or (args[1] if len(args) > 1 else None)
+
+        connection = connections[options.get('database') or DEFAULT_DB_ALIAS]
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(self.get_targets(executor, app_label, migration_name))
+
+        if not plan:
+            self.stdout.write('No migrations to apply.')
+            return
+
+        estimates = plan_fanout(executor, plan)
+        current = None
+        for estimate in estimates:
+            if estimate.migration != current:
+                current = estimate.migration
+                self.stdout.write('{0}{1}'.format(current, ' (backwards)' if estimate.backwards else ''))
+            self.stdout.write('  [{0}]{1} {2}'.format(
+                estimate.kind,
+                ' REWRITES TABLE' if estimate.kind == REWRITE else '',
+                estimate.sql,
+            ))
+            self.stdout.write('      {0} schemata, {1}, ~{2} rows: {3:.2f}s{4}'.format(
+                estimate.schemata,
+                _megabytes(estimate.size),
+                estimate.rows,
+                estimate.seconds,
+                ' (slowest: {0}, {1:.2f}s)'.format(*estimate.slowest) if estimate.slowest else '',
+            ))
+
+        self.stdout.write('Total: {0} private statements, {1} rewriting tables, {2:.2f}s'.format(
+            len(estimates),
+            len([estimate for estimate in estimates if estimate.kind == REWRITE]),
+            sum(estimate.seconds for estimate in estimates),
+        ))
@@ -0,0 +1,67 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_provision_schemata`
+
+Create the database schemata for schema objects that were queued up for
+provisioning (see :mod:`boardinghouse.provisioning`).
+
+Any number of workers may be run at once. By default, a worker polls for new
+tasks forever: with ``--once``, it exits when there are no tasks left for it
+to claim.
+
+With ``--retry-failed``, schemata that failed to be provisioned are queued
+again first.
+"""
+from optparse import make_option
+import time
+
+import django
+from django.core.management.base import BaseCommand
+
+from ... import provisioning
+
+
+class Command(BaseCommand):
+    help = 'Provision schemata that are waiting to be created.'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--batch-size', action='store', dest='batch_size', type='int', default=1,
+                help='How many schemata to claim at a time.'),
+            make_option('--interval', action='store', dest='interval', type='float', default=1.0,
+                help='How many seconds to wait before looking for more schemata.'),
+            make_option('--once', action='store_true', dest='once', default=False,
+                help='Exit when there are no tasks left to claim.'),
+            make_option('--retry-failed', action='store_true', dest='retry_failed', default=False,
+                help='Queue schemata that failed to be provisioned again.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=1,
+            help='How many schemata to claim at a time.')
+        parser.add_argument('--interval', action='store', dest='interval', type=float, default=1.0,
+            help='How many seconds to wait before looking for more schemata.')
+        parser.add_argument('--once', action='store_true', dest='once', default=False,
+            help='Exit when there are no tasks left to claim.')
+        parser.add_argument('--retry-failed', action='store_true', dest='retry_failed', default=False,
+            help='Queue schemata that failed to be provisioned again.')
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        worker = provisioning.worker_name()
+
+        if options.get('retry_failed'):
+            queued = provisioning.retry()
+            if verbosity > 0:
+                self.stdout.write('Queued {0} failed schemata again'.format(len(queued)))
+
+        while True:
+            results = provisioning.work(options.get('batch_size') or 1, worker)
+            if verbosity > 0:
+                for schema_name, error in results:
+                    if error:
+                        self.stderr.write('Failed to provision {0}: {1}'.format(schema_name, error))
+                    else:
+                        self.stdout.write('Provisioned {0}'.format(schema_name))
+            if options.get('once'):
+                return
+            time.sleep(options.get('interval') or 1.0)
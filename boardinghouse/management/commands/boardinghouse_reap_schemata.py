@@ -0,0 +1,64 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_reap_schemata`
+
+Drop the tombstones of deleted schemata (see :mod:`boardinghouse.reaper`),
+``--batch-size`` at a time, pausing for ``--pause`` seconds between batches.
+Each batch gives up on any lock it has waited ``--lock-timeout`` for, and is
+tried again on the next run.
+
+By default, the tombstones are reaped once: with ``--interval``, they are
+reaped every that many seconds, forever.
+"""
+from optparse import make_option
+import time
+
+import django
+from django.core.management.base import BaseCommand
+
+from ... import reaper
+
+
+class Command(BaseCommand):
+    help = 'Drop the schemata that have been deleted.'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--batch-size', action='store', dest='batch_size', type='int', default=10,
+                help='How many schemata to drop in each transaction.'),
+            make_option('--pause', action='store', dest='pause', type='float', default=1.0,
+                help='How many seconds to wait between batches.'),
+            make_option('--lock-timeout', action='store', dest='lock_timeout', default='1s',
+                help='How long each batch may wait for a lock.'),
+            make_option('--limit', action='store', dest='limit', type='int', default=None,
+                help='Drop at most this many schemata on each run.'),
+            make_option('--interval', action='store', dest='interval', type='float', default=None,
+                help='Keep reaping, every this many seconds.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=10,
+            help='How many schemata to drop in each transaction.')
+        parser.add_argument('--pause', action='store', dest='pause', type=float, default=1.0,
+            help='How many seconds to wait between batches.')
+        parser.add_argument('--lock-timeout', action='store', dest='lock_timeout', default='1s',
+            help='How long each batch may wait for a lock.')
+        parser.add_argument('--limit', action='store', dest='limit', type=int, default=None,
+            help='Drop at most this many schemata on each run.')
+        parser.add_argument('--interval', action='store', dest='interval', type=float, default=None,
+            help='Keep reaping, every this many seconds.')
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+
+        while True:
+            dropped, skipped = reaper.reap(
+                batch_size=options.get('batch_size') or 10,
+                pause=options.get('pause', 1.0),
+                lock_timeout=options.get('lock_timeout') or '1s',
+                limit=options.get('limit'),
+            )
+            if verbosity > 0 and (dropped or skipped):
+                self.stdout.write('Dropped {0} schemata, skipped {1}'.format(dropped, skipped))
+            if not options.get('interval'):
+                return
+            time.sleep(options['interval'])
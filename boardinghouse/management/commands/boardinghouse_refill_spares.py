@@ -0,0 +1,50 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_refill_spares`
+
+Drop any spare schemata that no longer match the template schema, and clone
+new ones until there are ``BOARDINGHOUSE_SPARE_SCHEMATA`` of them (see
+:mod:`boardinghouse.spares`).
+
+By default, the pool is refilled once: with ``--interval``, it is refilled
+every that many seconds, forever.
+"""
+from optparse import make_option
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ... import spares
+
+
+class Command(BaseCommand):
+    help = 'Refill the pool of spare schemata.'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--size', action='store', dest='size', type='int', default=None,
+                help='How many spare schemata to keep (default: BOARDINGHOUSE_SPARE_SCHEMATA).'),
+            make_option('--interval', action='store', dest='interval', type='float', default=None,
+                help='Keep refilling the pool, every this many seconds.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', action='store', dest='size', type=int, default=None,
+            help='How many spare schemata to keep (default: BOARDINGHOUSE_SPARE_SCHEMATA).')
+        parser.add_argument('--interval', action='store', dest='interval', type=float, default=None,
+            help='Keep refilling the pool, every this many seconds.')
+
+    def handle(self, *args, **options):
+        size = options.get('size')
+        if size is None:
+            size = settings.BOARDINGHOUSE_SPARE_SCHEMATA
+        verbosity = int(options.get('verbosity', 1))
+
+        while True:
+            created, discarded = spares.refill(size)
+            if verbosity > 0 and (created or discarded):
+                self.stdout.write('Created {0} spare schemata, discarded {1}'.format(created, discarded))
+            if not options.get('interval'):
+                return
+            time.sleep(options['interval'])
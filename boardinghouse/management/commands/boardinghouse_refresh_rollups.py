@@ -0,0 +1,66 @@
+"""
+:mod:`boardinghouse.management.commands.boardinghouse_refresh_rollups`
+
+Fold the changes recorded by the triggers of each rollup into it's
+aggregates (see :mod:`boardinghouse.rollups`). Pass rollup names to only
+refresh those rollups: otherwise, every rollup is refreshed.
+
+By default, the rollups are refreshed once: with ``--interval``, they are
+refreshed every that many seconds, forever. With ``--rebuild``, the
+aggregates are instead recalculated from the records in every schema.
+"""
+from optparse import make_option
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import rollups
+from ...models import Rollup
+
+
+class Command(BaseCommand):
+    help = 'Fold the changes to each rollup into it\'s aggregates.'
+    args = '[rollup ...]'
+
+    if django.VERSION < (1, 8):
+        option_list = BaseCommand.option_list + (
+            make_option('--rebuild', action='store_true', dest='rebuild', default=False,
+                help='Recalculate the aggregates from every schema.'),
+            make_option('--interval', action='store', dest='interval', type='float', default=None,
+                help='Keep refreshing, every this many seconds.'),
+        )
+
+    def add_arguments(self, parser):
+        parser.add_argument('rollups', nargs='*',
+            help='Only refresh these rollups.')
+        parser.add_argument('--rebuild', action='store_true', dest='rebuild', default=False,
+            help='Recalculate the aggregates from every schema.')
+        parser.add_argument('--interval', action='store', dest='interval', type=float, default=None,
+            help='Keep refreshing, every this many seconds.')
+
+    def handle(self, *args, **options):
+        names = options.get('rollups') or list(args)
+        verbosity = int(options.get('verbosity', 1))
+
+        queryset = Rollup.objects.all()
+        if names:
+            queryset = queryset.filter(name__in=names)
+            missing = set(names) - set(queryset.values_list('name', flat=True))
+            if missing:
+                raise CommandError('Unknown rollups: {0}'.format(', '.join(sorted(missing))))
+
+        if options.get('rebuild'):
+            for rollup in queryset:
+                rollups.rebuild(rollup)
+                if verbosity > 0:
+                    self.stdout.write('Rebuilt {0}'.format(rollup.name))
+            return
+
+        while True:
+            for name, folded in rollups.refresh(queryset):
+                if verbosity > 0 and folded:
+                    self.stdout.write('Folded {0} changes into {1}'.format(folded, name))
+            if not options.get('interval'):
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+"""
+:mod:`boardinghouse.management.commands.migrate`
+
+This replaces the ``migrate`` command with one that records which migration
+(and which of it's operations) is being applied, so that the progress of
+each statement through the schemata can be recorded, and statements may be
+applied lazily (see :func:`boardinghouse.fanout.begin_migration`).
+"""
+from django.core.management.commands import migrate
+
+from ...fanout import begin_migration, end_migration
+
+
+class Command(migrate.Command):
+    def migration_progress_callback(self, action, migration=None, fake=False):
+        if action in ('apply_start', 'unapply_start') and not fake:
+            begin_migration(migration, backwards=action == 'unapply_start')
+        super(Command, self).migration_progress_callback(action, migration, fake)
+        if action in ('apply_success', 'unapply_success'):
+            end_migration()
+
+    def handle(self, *args, **options):
+        try:
+            return super(Command, self).handle(*args, **options)
+        finally:
+            end_migration()
@@ -13,12 +13,16 @@ from django.http import (
 from django.shortcuts import redirect
 from django.utils.translation import ugettext_lazy as _
 
-from .exceptions import Forbidden, TemplateSchemaActivation, SchemaNotFound
+from .exceptions import Forbidden, TemplateSchemaActivation, SchemaNotFound, SchemaNotReady
 from .schema import activate_schema, deactivate_schema
 from .signals import session_requesting_schema_change, session_schema_changed
 
 logger = logging.getLogger('boardinghouse.middleware')
 
+#: How many seconds a client should wait before retrying a request for a
+#: schema that is still being provisioned.
+RETRY_AFTER = 5
+
 
 def change_schema(request, schema):
     """
@@ -210,6 +214,11 @@ class SchemaMiddleware(object):
         if 'schema' in request.session:
             try:
                 activate_schema(request.session['schema'])
+            except SchemaNotReady:
+                deactivate_schema()
+                response = HttpResponse(_('That schema is not ready yet'), status=503)
+                response['Retry-After'] = str(RETRY_AFTER)
+                return response
             except SchemaNotFound:
                 deactivate_schema()
                 request.session.pop('schema')
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import boardinghouse.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0005_group_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MigrationProgress',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('migration', models.CharField(help_text='The migration, as app_label.migration_name.', max_length=255)),
+                ('operation', models.IntegerField(help_text='The index of the operation within the migration, or -1 for deferred SQL.')),
+                ('statement', models.CharField(help_text='A digest of the statement that was executed.', max_length=32)),
+                ('backwards', models.BooleanField(default=False)),
+                ('schema', models.CharField(max_length=63)),
+                ('status', models.CharField(choices=[('succeeded', 'Succeeded'), ('failed', 'Failed')], max_length=16)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('recorded_at', models.DateTimeField(auto_now=True)),
+            ],
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+        migrations.AlterUniqueTogether(
+            name='migrationprogress',
+            unique_together=set([('migration', 'operation', 'statement', 'backwards', 'schema')]),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import boardinghouse.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0006_migrationprogress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MigrationStatement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('migration', models.CharField(blank=True, help_text='The migration, as app_label.migration_name.', max_length=255)),
+                ('db_table', models.CharField(max_length=255)),
+                ('sql', models.TextField(blank=True)),
+                ('operation', models.IntegerField(blank=True, help_text='The index (within the migration) of the RunPythonPerSchema operation to run, instead of sql.', null=True)),
+                ('backwards', models.BooleanField(default=False, help_text="Whether the operation's reverse code should be run.")),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='SchemaMigrationState',
+            fields=[
+                ('schema', models.CharField(max_length=63, primary_key=True, serialize=False)),
+                ('statement_id', models.IntegerField(default=0)),
+                ('last_activated', models.DateTimeField(blank=True, null=True)),
+            ],
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+    ]
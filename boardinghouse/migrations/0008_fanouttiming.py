@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import boardinghouse.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0007_lazy_migrations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FanoutTiming',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('size', models.BigIntegerField(help_text='The size of the table, in bytes.')),
+                ('rows', models.BigIntegerField(help_text='The estimated number of rows in the table.')),
+                ('duration', models.FloatField()),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+    ]
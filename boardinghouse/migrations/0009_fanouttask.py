@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import boardinghouse.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0008_fanouttiming'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FanoutTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run', models.CharField(db_index=True, max_length=32)),
+                ('schema', models.CharField(max_length=63)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+
+from django.db import migrations
+
+with open(os.path.join(os.path.dirname(__file__), '..', 'sql', 'clone_schema.004.sql')) as fp:
+    FORWARDS = fp.read()
+with open(os.path.join(os.path.dirname(__file__), '..', 'sql', 'clone_schema.003.sql')) as fp:
+    REVERSE = fp.read()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0009_fanouttask'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=FORWARDS, reverse_sql=REVERSE),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import boardinghouse.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0011_clone_schema_deferred_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpareSchema',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema', models.CharField(max_length=63, unique=True)),
+                ('fingerprint', models.CharField(db_index=True, help_text='The fingerprint of the structure of the schema when it was created.', max_length=32)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import boardinghouse.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0012_spareschema'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchemaSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(db_index=True, max_length=63)),
+                ('fingerprint', models.CharField(help_text='The fingerprint of the structure of the source schema.', max_length=32)),
+                ('structure', models.TextField()),
+                ('records', models.TextField()),
+                ('finish', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+    ]
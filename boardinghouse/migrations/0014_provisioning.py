@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+import boardinghouse.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.BOARDINGHOUSE_SCHEMA_MODEL),
+        ('boardinghouse', '0013_schemasnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schema',
+            name='status',
+            field=models.CharField(choices=[('provisioning', 'Provisioning'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', editable=False, max_length=16),
+        ),
+        migrations.CreateModel(
+            name='ProvisioningTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('schema', models.CharField(max_length=63)),
+                ('template', models.CharField(max_length=63)),
+                ('include_records', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('worker', models.CharField(blank=True, max_length=255)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+    ]
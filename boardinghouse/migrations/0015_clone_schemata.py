@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+
+from django.db import migrations
+
+with open(os.path.join(os.path.dirname(__file__), '..', 'sql', 'clone_schemata.001.sql')) as fp:
+    FORWARDS = fp.read()
+
+REVERSE = 'DROP FUNCTION IF EXISTS clone_schemata(text, text[], boolean)'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0014_provisioning'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=FORWARDS, reverse_sql=REVERSE),
+    ]
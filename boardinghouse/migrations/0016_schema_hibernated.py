@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.BOARDINGHOUSE_SCHEMA_MODEL),
+        ('boardinghouse', '0015_clone_schemata'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='schema',
+            name='status',
+            field=models.CharField(choices=[('provisioning', 'Provisioning'), ('ready', 'Ready'), ('failed', 'Failed'), ('hibernated', 'Hibernated')], default='ready', editable=False, max_length=16),
+        ),
+    ]
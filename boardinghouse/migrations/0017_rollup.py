@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+import boardinghouse.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('boardinghouse', '0016_schema_hibernated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='The name of the shared table the aggregates are stored in.', max_length=57, unique=True)),
+                ('source', models.CharField(help_text='The private table that is aggregated.', max_length=63)),
+                ('date_column', models.CharField(blank=True, help_text='The column whose date the rows are grouped by, if any.', max_length=63)),
+                ('dimensions', models.CharField(blank=True, help_text='The other columns the rows are grouped by (comma separated).', max_length=255)),
+                ('measures', models.CharField(blank=True, help_text='The columns that are summed (comma separated).', max_length=255)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            bases=(boardinghouse.base.SharedSchemaMixin, models.Model),
+        ),
+    ]
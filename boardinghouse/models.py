@@ -5,14 +5,14 @@ import logging
 from django.conf import settings
 from django.core.cache import cache
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import connection, models, transaction
 from django.forms import ValidationError
 from django.utils import six
 from django.utils.translation import ugettext_lazy as _
 
 from .base import SharedSchemaMixin
-from .schema import _schema_exists, activate_schema, deactivate_schema
-from . import signals
+from .schema import _existing_schemata, _schema_exists, activate_schema, deactivate_schema
+from . import clone, hibernation, provisioning, signals
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(logging.NullHandler())
@@ -27,15 +27,47 @@ schema_name_validator = RegexValidator(
 
 
 class SchemaQuerySet(models.query.QuerySet):
-    def bulk_create(self, *args, **kwargs):
+    def bulk_create(self, objs, *args, **kwargs):
         # Normally a bulk_create would not trigger the post_save signal for
-        # each instance. We need to rely on that firing to create the actual
-        # database schema, so we manually trigger that signal.
-        created = super(SchemaQuerySet, self).bulk_create(*args, **kwargs)
+        # each instance. Other apps may rely on that firing, so we manually
+        # trigger that signal, but create all of the database schemata first,
+        # in as few queries as possible.
+        objs = list(objs)
+        schema_names = [schema.schema for schema in objs]
+        existing = _existing_schemata(schema_names)
+        if existing:
+            raise ValueError('Attempt to create an existing schema: {0}'.format(', '.join(sorted(existing))))
+
+        queued = provisioning.is_enabled()
+        for schema in objs:
+            if queued:
+                schema.status = provisioning.PROVISIONING
+            # The post_save handler does not need to create these.
+            schema._schema_created = True
+
+        created = super(SchemaQuerySet, self).bulk_create(objs, *args, **kwargs)
+
+        if queued:
+            provisioning.enqueue_many(schema_names, settings.TEMPLATE_SCHEMA)
+        elif schema_names:
+            try:
+                clone.create_schemata(settings.TEMPLATE_SCHEMA, schema_names)
+            except Exception:
+                # Outside of a transaction, the objects have already been
+                # committed: they must not outlive their schemata.
+                if not connection.in_atomic_block:
+                    self.filter(schema__in=schema_names).delete(drop=True)
+                raise
+            LOGGER.info('New schemata created: %s', ', '.join(schema_names))
+
         for schema in created:
             models.signals.post_save.send(sender=self.model,
                                           instance=schema,
                                           created=True)
+        if schema_names and not queued:
+            for schema_name in schema_names:
+                signals.schema_created.send(sender=self.model, schema=schema_name)
+            signals.schemata_created.send(sender=self.model, schemata=schema_names)
         cache.delete('active-schemata')
         return created
 
@@ -92,6 +124,12 @@ class AbstractSchema(SharedSchemaMixin, models.Model):
     is_active = models.BooleanField(default=True,
         help_text=_(u'Use this instead of deleting schemata.')
     )
+    status = models.CharField(max_length=16, default=provisioning.READY, editable=False, choices=(
+        (provisioning.PROVISIONING, _(u'Provisioning')),
+        (provisioning.READY, _(u'Ready')),
+        (provisioning.FAILED, _(u'Failed')),
+        (hibernation.HIBERNATED, _(u'Hibernated')),
+    ))
 
     objects = SchemaQuerySet.as_manager()
 
@@ -115,10 +153,17 @@ class AbstractSchema(SharedSchemaMixin, models.Model):
         if self._initial_schema in [None, ''] or 'force_insert' in kwargs:
             if _schema_exists(self.schema):
                 raise ValidationError(_('Schema %s already in use') % self.schema)
+            # The post_save handler does not need to check again.
+            self._schema_exists_checked = True
+            if provisioning.is_enabled() and self.schema != settings.TEMPLATE_SCHEMA:
+                self.status = provisioning.PROVISIONING
         elif self.schema != self._initial_schema:
             raise ValidationError(_('may not change schema after creation.'))
 
-        return super(AbstractSchema, self).save(*args, **kwargs)
+        # Making a hibernated schema active wakes it (in a post_save handler):
+        # if that fails, it must stay inactive.
+        with transaction.atomic():
+            return super(AbstractSchema, self).save(*args, **kwargs)
 
     def delete(self, drop=False):
         if drop:
@@ -153,6 +198,203 @@ class Schema(AbstractSchema):
         swappable = 'BOARDINGHOUSE_SCHEMA_MODEL'
 
 
+class MigrationProgress(SharedSchemaMixin, models.Model):
+    """
+    The outcome of applying a single private statement from a migration
+    to a single schema.
+
+    These records allow a migration that was interrupted part way through
+    applying a statement to every schema to resume where it left off: see
+    :mod:`boardinghouse.fanout`.
+    """
+    migration = models.CharField(max_length=255,
+        help_text=_(u'The migration, as app_label.migration_name.')
+    )
+    operation = models.IntegerField(
+        help_text=_(u'The index of the operation within the migration, or -1 for deferred SQL.')
+    )
+    statement = models.CharField(max_length=32,
+        help_text=_(u'A digest of the statement that was executed.')
+    )
+    backwards = models.BooleanField(default=False)
+    schema = models.CharField(max_length=63)
+    status = models.CharField(max_length=16, choices=(
+        ('succeeded', _(u'Succeeded')),
+        ('failed', _(u'Failed')),
+    ))
+    duration = models.FloatField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    recorded_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+        unique_together = (
+            ('migration', 'operation', 'statement', 'backwards', 'schema'),
+        )
+
+
+class MigrationStatement(SharedSchemaMixin, models.Model):
+    """
+    A private statement that was executed during a migration while lazy
+    migrations were enabled.
+
+    Schemata that were not migrated at the time will have these applied,
+    in order, when they are next activated: see :mod:`boardinghouse.lazy`.
+
+    A :class:`boardinghouse.operations.RunPythonPerSchema` operation is
+    recorded by it's position in the migration, rather than as SQL.
+    """
+    migration = models.CharField(max_length=255, blank=True,
+        help_text=_(u'The migration, as app_label.migration_name.')
+    )
+    db_table = models.CharField(max_length=255)
+    sql = models.TextField(blank=True)
+    operation = models.IntegerField(null=True, blank=True,
+        help_text=_(u'The index (within the migration) of the RunPythonPerSchema operation to run, instead of sql.')
+    )
+    backwards = models.BooleanField(default=False,
+        help_text=_(u'Whether the operation\'s reverse code should be run.')
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+        ordering = ('id',)
+
+
+class SchemaMigrationState(SharedSchemaMixin, models.Model):
+    """
+    The last :class:`MigrationStatement` that has been applied to a schema,
+    and when that schema was last activated.
+
+    A schema with no state has had every statement applied to it.
+    """
+    schema = models.CharField(max_length=63, primary_key=True)
+    statement_id = models.IntegerField(default=0)
+    last_activated = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+
+
+class FanoutTiming(SharedSchemaMixin, models.Model):
+    """
+    How long a private statement took to apply to one schema, and how big
+    the table it was applied to was.
+
+    These are used to calibrate the estimates made by
+    :mod:`boardinghouse.planner`.
+    """
+    kind = models.CharField(max_length=16)
+    size = models.BigIntegerField(
+        help_text=_(u'The size of the table, in bytes.')
+    )
+    rows = models.BigIntegerField(
+        help_text=_(u'The estimated number of rows in the table.')
+    )
+    duration = models.FloatField()
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+
+
+class FanoutTask(SharedSchemaMixin, models.Model):
+    """
+    A schema that needs to have deferred migration statements applied to it
+    by one of the workers (see :mod:`boardinghouse.distributed`).
+    """
+    run = models.CharField(max_length=32, db_index=True)
+    schema = models.CharField(max_length=63)
+    created_at = models.DateTimeField(auto_now_add=True)
+    worker = models.CharField(max_length=255, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+
+
+class SpareSchema(SharedSchemaMixin, models.Model):
+    """
+    A schema that has been cloned from the template schema ahead of time,
+    ready to be claimed by a new schema (see :mod:`boardinghouse.spares`).
+    """
+    schema = models.CharField(max_length=63, unique=True)
+    fingerprint = models.CharField(max_length=32, db_index=True,
+        help_text=_(u'The fingerprint of the structure of the schema when it was created.')
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+
+
+class SchemaSnapshot(SharedSchemaMixin, models.Model):
+    """
+    The statements that create a copy of a source schema, with the name of
+    the new schema left out (see :mod:`boardinghouse.snapshot`).
+    """
+    source = models.CharField(max_length=63, db_index=True)
+    fingerprint = models.CharField(max_length=32,
+        help_text=_(u'The fingerprint of the structure of the source schema.')
+    )
+    structure = models.TextField()
+    records = models.TextField()
+    finish = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+
+
+class ProvisioningTask(SharedSchemaMixin, models.Model):
+    """
+    A schema that is waiting for it's database schema to be created by one of
+    the workers (see :mod:`boardinghouse.provisioning`).
+    """
+    schema = models.CharField(max_length=63)
+    template = models.CharField(max_length=63)
+    include_records = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    worker = models.CharField(max_length=255, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+
+
+class Rollup(SharedSchemaMixin, models.Model):
+    """
+    A shared table of aggregates of a private table in every schema, which
+    is kept up to date by a trigger in each schema (see
+    :mod:`boardinghouse.rollups`).
+
+    Rollups are installed by the :class:`boardinghouse.operations.InstallRollup`
+    migration operation.
+    """
+    name = models.CharField(max_length=57, unique=True,
+        help_text=_(u'The name of the shared table the aggregates are stored in.')
+    )
+    source = models.CharField(max_length=63,
+        help_text=_(u'The private table that is aggregated.')
+    )
+    date_column = models.CharField(max_length=63, blank=True,
+        help_text=_(u'The column whose date the rows are grouped by, if any.')
+    )
+    dimensions = models.CharField(max_length=255, blank=True,
+        help_text=_(u'The other columns the rows are grouped by (comma separated).')
+    )
+    measures = models.CharField(max_length=255, blank=True,
+        help_text=_(u'The columns that are summed (comma separated).')
+    )
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'boardinghouse'
+
+
 # This is a bit of fancy trickery to stick the property _is_shared_model
 # on every model class, returning False, unless it has been explicitly
 # set to True in the model definition (see base.py for examples).
@@ -1,4 +1,15 @@
-from django.db import migrations
+import contextlib
+import inspect
+import logging
+import threading
+
+from django.db import migrations, transaction
+
+from .schema import _get_search_path, deactivate_schema
+from .signals import schema_aware_operation
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
 
 
 class AddField(migrations.AddField):
@@ -20,3 +31,210 @@ class AddField(migrations.AddField):
 
     def database_backwards(self, app_label, *args):
         return super(AddField, self).database_backwards(self.app_label, *args)
+
+
+def _call_in_chunks(code, apps, schema_editor):
+    """
+    Call code(apps, schema_editor) in a transaction: if it is a generator
+    function, each chunk of work (up to each yield) gets it's own transaction
+    instead.
+    """
+    with transaction.atomic():
+        result = code(apps, schema_editor)
+        if not inspect.isgenerator(result):
+            return
+    while True:
+        with transaction.atomic():
+            try:
+                next(result)
+            except StopIteration:
+                return
+
+
+class RunPythonPerSchema(migrations.RunPython):
+    """
+    Run some python code once in every schema (the template schema, and
+    every schema from every source of schemata, such as templates and
+    demos), with that schema active.
+
+    As with RunPython, the code is passed `apps` and `schema_editor`.
+
+    Each schema is migrated in it's own transaction (or savepoint, if the
+    migration is atomic). Code that migrates a large amount of data may be
+    a generator: each time it yields, the work done so far in that schema
+    is committed (in a non-atomic migration).
+
+    In a non-atomic migration, `workers` schemata are migrated at once, each
+    in it's own thread with it's own database connection: the code must use
+    models from `apps` (or :data:`django.db.connection`), rather than
+    `schema_editor.connection`, which belongs to the migrating thread.
+
+    If `progress` is supplied, it is called with the schema name and the
+    number of schemata completed so far, after each schema is committed.
+
+    With lazy (or distributed) migrations, the code is only run immediately
+    in those schemata that are up to date: the others run it (after the
+    statements that precede it) when they catch up.
+    """
+    def __init__(self, code, reverse_code=None, workers=1, progress=None, **kwargs):
+        super(RunPythonPerSchema, self).__init__(code, reverse_code, **kwargs)
+        self.workers = workers
+        self.progress = progress
+
+    def deconstruct(self):
+        name, args, kwargs = super(RunPythonPerSchema, self).deconstruct()
+        if self.workers != 1:
+            kwargs['workers'] = self.workers
+        if self.progress is not None:
+            kwargs['progress'] = self.progress
+        return self.__class__.__name__, args, kwargs
+
+    @contextlib.contextmanager
+    def _per_schema(self, attribute):
+        code = getattr(self, attribute)
+        setattr(self, attribute, self._run_per_schema(code))
+        try:
+            yield
+        finally:
+            setattr(self, attribute, code)
+
+    def _run_per_schema(self, code):
+        def run(apps, schema_editor):
+            lock = threading.Lock()
+            completed = []
+
+            def apply():
+                schema_name = _get_search_path()
+                _call_in_chunks(code, apps, schema_editor)
+                with lock:
+                    completed.append(schema_name)
+                    count = len(completed)
+                if self.progress:
+                    self.progress(schema_name, count)
+                else:
+                    LOGGER.info('Migrated schema %s (%d completed)', schema_name, count)
+
+            atomic = schema_editor.connection.in_atomic_block
+            schema_aware_operation.send(
+                sender=schema_editor,
+                db_table=None,
+                function=apply,
+                schema_editor=schema_editor,
+                atomic=atomic,
+                workers=1 if atomic else self.workers,
+            )
+
+        return run
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        with self._per_schema('code'):
+            super(RunPythonPerSchema, self).database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if self.reverse_code is None:
+            return super(RunPythonPerSchema, self).database_backwards(
+                app_label, schema_editor, from_state, to_state)
+        with self._per_schema('reverse_code'):
+            super(RunPythonPerSchema, self).database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return 'Raw Python operation (in every schema)'
+
+
+class InstallRollup(migrations.operations.base.Operation):
+    """
+    Install a rollup of a private model (see :mod:`boardinghouse.rollups`):
+    the shared tables, and a trigger on the model's table in every schema.
+    The records that already exist in each schema are added as deltas, which
+    are folded in by the next refresh.
+
+    `model` is given as 'app_label.ModelName', and the columns are given as
+    the names of it's fields: each row is grouped by the date of
+    `date_field` (if given), and the value of each of `group_by`, and the
+    values of each of `sums` are added up.
+
+    A migration with this operation must depend on the boardinghouse
+    migration that creates :class:`boardinghouse.models.Rollup`.
+    """
+    reduces_to_sql = False
+    reversible = True
+
+    def __init__(self, name, model, date_field=None, group_by=(), sums=()):
+        self.name = name
+        self.model = model
+        self.date_field = date_field
+        self.group_by = list(group_by)
+        self.sums = list(sums)
+
+    def deconstruct(self):
+        kwargs = {'name': self.name, 'model': self.model}
+        if self.date_field:
+            kwargs['date_field'] = self.date_field
+        if self.group_by:
+            kwargs['group_by'] = self.group_by
+        if self.sums:
+            kwargs['sums'] = self.sums
+        return self.__class__.__name__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def _get_rollup(self, apps, connection):
+        """
+        An (unsaved) rollup, and the database type of each dimension column.
+        """
+        from . import models
+
+        opts = apps.get_model(self.model)._meta
+        columns = dict(
+            (name, opts.get_field(name).column) for name in [self.date_field] + self.group_by + self.sums if name
+        )
+        rollup = models.Rollup(
+            name=self.name,
+            source=opts.db_table,
+            date_column=columns[self.date_field] if self.date_field else '',
+            dimensions=','.join(columns[name] for name in self.group_by),
+            measures=','.join(columns[name] for name in self.sums),
+        )
+        types = dict((columns[name], opts.get_field(name).db_type(connection)) for name in self.group_by)
+        return rollup, types
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        from . import models, rollups
+
+        rollup, types = self._get_rollup(to_state.apps, schema_editor.connection)
+        for sql in rollups.install_sql(rollup, types):
+            schema_editor.execute(sql)
+        schema_editor.execute(
+            'INSERT INTO {0} (name, source, date_column, dimensions, measures) '
+            'VALUES (%s, %s, %s, %s, %s)'.format(rollups.shared_table(models.Rollup._meta.db_table)),
+            [rollup.name, rollup.source, rollup.date_column, rollup.dimensions, rollup.measures]
+        )
+        # The private table is named in the statement, so it is applied to
+        # every schema.
+        schema_editor.execute(rollups.trigger_sql(rollup))
+        schema_aware_operation.send(
+            sender=schema_editor,
+            db_table=rollup.source,
+            function=rollups.execute,
+            args=rollups.seed_sql(rollup),
+            schema_editor=schema_editor,
+        )
+        deactivate_schema()
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        from . import models, rollups
+
+        rollup, types = self._get_rollup(from_state.apps, schema_editor.connection)
+        schema_editor.execute('DROP TRIGGER IF EXISTS {0} ON {1}'.format(
+            schema_editor.quote_name(rollups.delta_table(rollup)), schema_editor.quote_name(rollup.source)
+        ))
+        schema_editor.execute(
+            'DELETE FROM {0} WHERE name = %s'.format(rollups.shared_table(models.Rollup._meta.db_table)),
+            [rollup.name]
+        )
+        for sql in rollups.uninstall_sql(rollup):
+            schema_editor.execute(sql)
+
+    def describe(self):
+        return 'Install rollup {0} of {1}'.format(self.name, self.model)
@@ -0,0 +1,122 @@
+"""
+Finding database schemata that no longer belong to anything.
+
+A clone that failed part way, or a schema that was created (or renamed) by
+hand, can leave a schema in the database with no corresponding schema object.
+These are never migrated, or dropped, but they still take up space, and make
+the system catalogs larger.
+
+:func:`find_orphans` compares every schema in ``pg_namespace`` with those
+that the receivers of :data:`boardinghouse.signals.list_schemata` are
+responsible for (the template schema, each schema object, and the schemata
+of :mod:`boardinghouse.contrib.template` and :mod:`boardinghouse.contrib.demo`,
+along with any spare schemata). The system schemata, the public schema, and
+tombstones that are waiting to be reaped are never orphans.
+
+Only schemata with the prefix of a template, demo or spare schema are
+certainly boardinghouse's: other schemata with a valid schema name (see
+:data:`boardinghouse.models.schema_name_validator`) may be left over from a
+schema object, but may just as well have been created for some other purpose
+(``reporting``, or ``audit``), so :func:`find_unclaimed` lists them
+separately, and they are only orphans when they are named explicitly. A
+schema that an extension has been installed in is never an orphan.
+
+The ``boardinghouse_orphans`` command lists the orphans (and the unclaimed
+schemata), and with ``--reap``, drops the orphans (and any unclaimed schemata
+named on the command line) using :mod:`boardinghouse.reaper`.
+"""
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+from . import reaper, signals, spares
+
+NAMESPACES = """
+    SELECT n.nspname,
+           COALESCE(SUM(pg_catalog.pg_total_relation_size(c.oid)), 0)
+      FROM pg_catalog.pg_namespace n
+ LEFT JOIN pg_catalog.pg_class c ON (c.relnamespace = n.oid AND c.relkind IN ('r', 'm', 'S'))
+     WHERE n.nspname !~ '^pg_'
+       AND n.nspname <> 'information_schema'
+       AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_extension e WHERE e.extnamespace = n.oid)
+  GROUP BY n.nspname
+  ORDER BY n.nspname
+"""
+
+
+def _prefixes():
+    prefixes = [spares.PREFIX]
+    for name in ['BOARDINGHOUSE_TEMPLATE_PREFIX', 'BOARDINGHOUSE_DEMO_PREFIX']:
+        if getattr(settings, name, None):
+            prefixes.append(getattr(settings, name))
+    return prefixes
+
+
+def is_boardinghouse_schema(schema_name):
+    """
+    Does this schema name have the prefix of a schema that boardinghouse
+    creates (for a template, demo or spare schema)?
+    """
+    return schema_name.startswith(tuple(_prefixes()))
+
+
+def _is_valid_schema_name(schema_name):
+    from .models import schema_name_validator
+
+    try:
+        schema_name_validator(schema_name)
+    except ValidationError:
+        return False
+    return True
+
+
+def known_schemata():
+    """
+    The names of all of the schemata that something is responsible for.
+    """
+    known = set([settings.PUBLIC_SCHEMA])
+    for receiver, response in signals.list_schemata.send(sender=None):
+        known.update(response or [])
+    return known
+
+
+def _unknown_schemata(cursor):
+    cursor = cursor or connection.cursor()
+    cursor.execute(NAMESPACES)
+    known = known_schemata()
+    return [
+        (schema_name, int(size)) for schema_name, size in cursor.fetchall()
+        if schema_name not in known and not reaper.is_tombstone(schema_name)
+    ]
+
+
+def find_orphans(cursor=None, include=()):
+    """
+    Find the schemata in the database that nothing is responsible for.
+
+    Only schemata with a boardinghouse prefix are orphans, unless they
+    are named in include.
+
+    Returns a list of (schema name, size in bytes).
+    """
+    return [
+        (schema_name, size) for schema_name, size in _unknown_schemata(cursor)
+        if is_boardinghouse_schema(schema_name) or schema_name in include
+    ]
+
+
+def find_unclaimed(cursor=None):
+    """
+    Find the schemata in the database that nothing is responsible for, and
+    that have a valid schema name, but not a boardinghouse prefix.
+
+    These may be orphans, but are not dropped unless they are named.
+
+    Returns a list of (schema name, size in bytes).
+    """
+    return [
+        (schema_name, size) for schema_name, size in _unknown_schemata(cursor)
+        if not is_boardinghouse_schema(schema_name) and _is_valid_schema_name(schema_name)
+    ]
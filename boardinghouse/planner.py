@@ -0,0 +1,280 @@
+"""
+Estimating the cost of applying migrations to every schema.
+
+Before a migration is applied, the private statements that it will execute
+may be collected (without executing them), and classified by how much work
+Postgres will need to do in each schema:
+
+``rewrite``
+    The table will be rewritten (or every row updated). This takes time
+    proportional to the size of the table, and holds an exclusive lock
+    for all of that time.
+``index``
+    An index will be built, which also requires reading the whole table.
+``scan``
+    The table will be scanned (to validate a constraint).
+``catalog``
+    Only the system catalogs are changed.
+
+The size of each table, and an estimate of the number of rows in it, is
+fetched from ``pg_class`` for every schema, and a prediction of the time
+taken in each schema is made from a timing model. This model is a simple
+linear fit (per kind of statement) of the time taken against the size of
+the table, calibrated from :class:`boardinghouse.models.FanoutTiming`, which
+are recorded as statements are applied to each schema by the schema editor.
+Until there are enough timings, conservative defaults are used.
+"""
+from __future__ import unicode_literals
+
+import collections
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .schema import _table_exists
+
+REWRITE = 'rewrite'
+INDEX = 'index'
+SCAN = 'scan'
+CATALOG = 'catalog'
+
+#: Kinds of statement, most expensive first.
+KINDS = (REWRITE, INDEX, SCAN, CATALOG)
+
+#: (seconds, seconds per byte) to use for each kind until there are enough
+#: recorded timings.
+DEFAULT_COEFFICIENTS = {
+    REWRITE: (0.01, 1.0 / (50 * 1024 * 1024)),
+    INDEX: (0.01, 1.0 / (100 * 1024 * 1024)),
+    SCAN: (0.005, 1.0 / (200 * 1024 * 1024)),
+    CATALOG: (0.005, 0.0),
+}
+
+#: How many timings of a kind are required before we use them.
+MINIMUM_SAMPLES = 5
+
+ALTER_TYPE = re.compile(r'\bALTER\s+COLUMN\s+\S+\s+(SET\s+DATA\s+)?TYPE\b', re.IGNORECASE)
+ADD_COLUMN_DEFAULT = re.compile(r'\bADD\s+(COLUMN\s+)?\S+[^,]*\bDEFAULT\b', re.IGNORECASE)
+ADD_INDEXED_CONSTRAINT = re.compile(r'\bADD\s+(CONSTRAINT\s+\S+\s+)?(PRIMARY\s+KEY|UNIQUE)\b', re.IGNORECASE)
+ADD_VALIDATED_CONSTRAINT = re.compile(r'\bADD\s+(CONSTRAINT\s+\S+\s+)?(CHECK|FOREIGN\s+KEY)\b', re.IGNORECASE)
+SET_NOT_NULL = re.compile(r'\bSET\s+NOT\s+NULL\b', re.IGNORECASE)
+NOT_VALID = re.compile(r'\bNOT\s+VALID\b', re.IGNORECASE)
+CREATE_INDEX = re.compile(r'^\s*CREATE\s+(UNIQUE\s+)?INDEX\b', re.IGNORECASE)
+UPDATE_ROWS = re.compile(r'^\s*(UPDATE|DELETE)\b', re.IGNORECASE)
+
+Estimate = collections.namedtuple('Estimate', [
+    'migration', 'backwards', 'table', 'sql', 'kind',
+    'schemata', 'size', 'rows', 'seconds', 'slowest',
+])
+
+
+def classify(sql, server_version=None):
+    """
+    Classify a statement by the amount of work that it will cause (see the
+    module documentation).
+
+    Adding a column with a default value rewrites the table prior to
+    Postgres 11: pass in the server version (as in `connection.pg_version`)
+    if it is known.
+    """
+    if CREATE_INDEX.match(sql):
+        return INDEX
+    if UPDATE_ROWS.match(sql):
+        return REWRITE
+    if ALTER_TYPE.search(sql):
+        return REWRITE
+    if ADD_COLUMN_DEFAULT.search(sql) and (server_version or 0) < 110000:
+        return REWRITE
+    if ADD_INDEXED_CONSTRAINT.search(sql):
+        return INDEX
+    if ADD_VALIDATED_CONSTRAINT.search(sql) and not NOT_VALID.search(sql):
+        return SCAN
+    if SET_NOT_NULL.search(sql):
+        return SCAN
+    return CATALOG
+
+
+def fit(samples):
+    """
+    Least-squares fit of duration = a + b * size, for a sequence of
+    (size, duration) pairs. Returns (a, b).
+    """
+    samples = list(samples)
+    count = len(samples)
+    mean_size = sum(size for size, duration in samples) / float(count)
+    mean_duration = sum(duration for size, duration in samples) / float(count)
+    variance = sum((size - mean_size) ** 2 for size, duration in samples)
+    if not variance:
+        return mean_duration, 0.0
+    covariance = sum((size - mean_size) * (duration - mean_duration) for size, duration in samples)
+    slope = max(covariance / variance, 0.0)
+    return max(mean_duration - slope * mean_size, 0.0), slope
+
+
+class TimingModel(object):
+    """
+    Predicts the time a statement of a given kind will take on a table of
+    a given size.
+    """
+    def __init__(self, coefficients=None):
+        self.coefficients = dict(DEFAULT_COEFFICIENTS)
+        self.coefficients.update(coefficients or {})
+
+    @classmethod
+    def calibrate(cls):
+        """
+        Build a model from the recorded timings.
+        """
+        from .models import FanoutTiming
+
+        coefficients = {}
+        if _table_exists(FanoutTiming._meta.db_table):
+            for kind in KINDS:
+                samples = FanoutTiming.objects.filter(kind=kind).values_list('size', 'duration')
+                if len(samples) >= MINIMUM_SAMPLES:
+                    coefficients[kind] = fit(samples)
+        return cls(coefficients)
+
+    def predict(self, kind, size):
+        intercept, slope = self.coefficients[kind]
+        return intercept + slope * (size or 0)
+
+
+def fanout_schemata(cursor=None):
+    """
+    The names of the schemata that private statements will be applied to:
+    those that boardinghouse knows about (see
+    :data:`boardinghouse.signals.list_schemata`), except spares, that exist.
+    """
+    from .drift import _known_schemata
+
+    cursor = cursor or connection.cursor()
+    cursor.execute('SELECT nspname FROM pg_catalog.pg_namespace WHERE nspname = ANY(%s)', [_known_schemata()])
+    return sorted(row[0] for row in cursor.fetchall())
+
+
+def relation_sizes(tables, schemata=None, cursor=None):
+    """
+    Get the size (in bytes) and estimated number of rows of each of the
+    given tables, in each of schemata (or those that statements will be
+    applied to, see :func:`fanout_schemata`).
+
+    Returns a dict of {table: {schema: (size, rows)}}.
+    """
+    cursor = cursor or connection.cursor()
+    if schemata is None:
+        schemata = fanout_schemata(cursor)
+    cursor.execute('''SELECT c.relname,
+                             n.nspname,
+                             pg_catalog.pg_relation_size(c.oid),
+                             c.reltuples
+                        FROM pg_catalog.pg_class c
+                  INNER JOIN pg_catalog.pg_namespace n ON (n.oid = c.relnamespace)
+                       WHERE c.relkind = 'r'
+                         AND c.relname = ANY(%s)
+                         AND n.nspname = ANY(%s)''', [list(tables), list(schemata)])
+    sizes = collections.defaultdict(dict)
+    for table, schema_name, size, rows in cursor.fetchall():
+        sizes[table][schema_name] = (size, max(int(rows), 0))
+    return sizes
+
+
+def collect_fanout(executor, plan):
+    """
+    Collect the private statements that would be executed in each schema
+    by the migration plan, without executing anything.
+
+    Returns a list of (migration, backwards, [(table, sql), ...]).
+    """
+    collected = []
+    state = None
+    for migration, backwards in plan:
+        with executor.connection.schema_editor(collect_sql=True) as schema_editor:
+            schema_editor.fanout_plan = []
+            if state is None:
+                state = executor.loader.project_state((migration.app_label, migration.name), at_end=False)
+            if not backwards:
+                state = migration.apply(state, schema_editor, collect_sql=True)
+            else:
+                state = migration.unapply(state, schema_editor, collect_sql=True)
+        collected.append((migration, backwards, [
+            (table, sql) for table, sql, params in schema_editor.fanout_plan
+        ]))
+    return collected
+
+
+def plan_fanout(executor, plan, model=None):
+    """
+    Estimate the cost of each private statement in the migration plan.
+
+    Returns a list of :class:`Estimate`.
+    """
+    model = model or TimingModel.calibrate()
+    collected = collect_fanout(executor, plan)
+    schemata = fanout_schemata()
+    sizes = relation_sizes(set(
+        table for migration, backwards, statements in collected for table, sql in statements
+    ), schemata)
+    server_version = getattr(executor.connection, 'pg_version', None)
+
+    estimates = []
+    for migration, backwards, statements in collected:
+        for table, sql in statements:
+            kind = classify(sql, server_version)
+            # Tables that do not exist yet (or only in some schemata) are
+            # still created in every schema.
+            per_schema = dict(
+                (schema_name, sizes.get(table, {}).get(schema_name, (0, 0))) for schema_name in schemata
+            )
+            seconds = dict(
+                (schema_name, model.predict(kind, size))
+                for schema_name, (size, rows) in per_schema.items()
+            )
+            estimates.append(Estimate(
+                migration='{0}.{1}'.format(migration.app_label, migration.name),
+                backwards=backwards,
+                table=table,
+                sql=sql,
+                kind=kind,
+                schemata=len(per_schema),
+                size=sum(size for size, rows in per_schema.values()),
+                rows=sum(rows for size, rows in per_schema.values()),
+                seconds=sum(seconds.values()),
+                slowest=max(seconds.items(), key=lambda item: item[1]) if seconds else None,
+            ))
+    return estimates
+
+
+def record_timings(samples):
+    """
+    Store the time taken to apply statements to each schema, along with the
+    current size of the table in that schema.
+
+    Samples are (schema name, kind, table, duration): only the most recent
+    `BOARDINGHOUSE_FANOUT_TIMING_SAMPLES` timings of each kind are kept.
+    """
+    from .models import FanoutTiming
+
+    keep = settings.BOARDINGHOUSE_FANOUT_TIMING_SAMPLES
+    if not samples or not keep or not _table_exists(FanoutTiming._meta.db_table):
+        return
+
+    sizes = relation_sizes(
+        set(table for schema_name, kind, table, duration in samples),
+        set(schema_name for schema_name, kind, table, duration in samples),
+    )
+    FanoutTiming.objects.bulk_create([
+        FanoutTiming(
+            kind=kind,
+            size=sizes.get(table, {}).get(schema_name, (0, 0))[0],
+            rows=sizes.get(table, {}).get(schema_name, (0, 0))[1],
+            duration=duration,
+        )
+        for schema_name, kind, table, duration in samples
+    ])
+
+    for kind in set(kind for schema_name, kind, table, duration in samples):
+        oldest = FanoutTiming.objects.filter(kind=kind).order_by('-pk').values_list('pk', flat=True)[keep:keep + 1]
+        if oldest:
+            FanoutTiming.objects.filter(kind=kind, pk__lte=oldest[0]).delete()
@@ -0,0 +1,175 @@
+"""
+Creating the database schema for a new schema object in the background.
+
+Normally, the database schema is cloned from the template schema while
+whatever created the :class:`boardinghouse.models.Schema` waits. When
+:data:`boardinghouse.settings.BOARDINGHOUSE_ASYNC_PROVISIONING` is enabled, a
+new schema object is instead saved with a ``status`` of ``provisioning``, and a
+:class:`boardinghouse.models.ProvisioningTask` is queued for it. One or more
+``boardinghouse_provision_schemata`` workers claim these tasks (using
+``SELECT ... FOR UPDATE SKIP LOCKED``), create the schema, and mark it as
+``ready`` (or ``failed``). Schemata that failed may be queued again with
+:func:`retry` (or ``boardinghouse_provision_schemata --retry-failed``).
+
+Until then, attempting to activate the schema raises
+:class:`boardinghouse.exceptions.SchemaNotReady`, which the middleware turns
+into a ``503 Service Unavailable`` response.
+"""
+from __future__ import unicode_literals
+
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from . import clone, signals
+from .distributed import worker_name
+from .schema import _table_exists, get_schema_model
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+PROVISIONING = 'provisioning'
+READY = 'ready'
+FAILED = 'failed'
+
+
+def is_enabled():
+    if not settings.BOARDINGHOUSE_ASYNC_PROVISIONING:
+        return False
+    from .models import ProvisioningTask
+    return _table_exists(ProvisioningTask._meta.db_table)
+
+
+def is_provisioning(schema_name):
+    """
+    Is the named schema waiting to be provisioned?
+    """
+    return is_enabled() and get_schema_model().objects.filter(schema=schema_name, status=PROVISIONING).exists()
+
+
+def enqueue(schema_name, template_name, include_records=False):
+    from .models import ProvisioningTask
+    return ProvisioningTask.objects.create(
+        schema=schema_name,
+        template=template_name,
+        include_records=include_records,
+    )
+
+
+def enqueue_many(schema_names, template_name, include_records=False):
+    from .models import ProvisioningTask
+    return ProvisioningTask.objects.bulk_create([
+        ProvisioningTask(schema=schema_name, template=template_name, include_records=include_records)
+        for schema_name in schema_names
+    ])
+
+
+def retry(schema_names=None):
+    """
+    Queue the schemata that failed to be provisioned (or just those named)
+    to be provisioned again, from the template (and with the records, or not)
+    that was used the last time.
+
+    Returns the names of the schemata that were queued.
+    """
+    from .models import ProvisioningTask
+
+    Schema = get_schema_model()
+    failed = Schema.objects.filter(status=FAILED)
+    if schema_names is not None:
+        failed = failed.filter(schema__in=schema_names)
+
+    queued = []
+    with transaction.atomic():
+        for schema_name in failed.select_for_update().values_list('schema', flat=True):
+            last = ProvisioningTask.objects.filter(schema=schema_name).order_by('-pk').first()
+            if last is None:
+                enqueue(schema_name, settings.TEMPLATE_SCHEMA)
+            else:
+                enqueue(schema_name, last.template, last.include_records)
+            queued.append(schema_name)
+        Schema.objects.filter(schema__in=queued).update(status=PROVISIONING)
+
+    for schema_name in queued:
+        LOGGER.info('Schema queued for provisioning again: %s', schema_name)
+    return queued
+
+
+def claim(batch_size):
+    """
+    Claim (and lock, until the current transaction ends) up to batch_size
+    tasks that no other worker is working on.
+    """
+    from .models import ProvisioningTask
+
+    cursor = connection.cursor()
+    cursor.execute(
+        'SELECT id FROM {0} WHERE completed_at IS NULL '
+        'ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED'.format(ProvisioningTask._meta.db_table),
+        [batch_size]
+    )
+    return list(ProvisioningTask.objects.filter(pk__in=[row[0] for row in cursor.fetchall()]).order_by('pk'))
+
+
+def provision(task):
+    """
+    Create the schema for a task, and mark it as ready.
+    """
+    Schema = get_schema_model()
+
+    if not Schema.objects.filter(schema=task.schema).exists():
+        raise ValueError('Schema {0} no longer exists'.format(task.schema))
+
+    clone.create_schema(task.template, task.schema, task.include_records)
+    Schema.objects.filter(schema=task.schema).update(status=READY)
+    signals.schema_created.send(sender=Schema, schema=task.schema)
+
+
+def process_batch(batch_size=1, worker=None):
+    """
+    Claim a batch of tasks, and provision each of those schemata.
+
+    A failure in one schema marks that schema as failed, and does not
+    prevent the other schemata in the batch from being provisioned.
+
+    Returns a list of (schema name, error), where error is None on success.
+    """
+    worker = worker or worker_name()
+    results = []
+
+    with transaction.atomic():
+        for task in claim(batch_size):
+            error = None
+            try:
+                with transaction.atomic():
+                    provision(task)
+            except Exception as exc:
+                LOGGER.exception('Unable to provision schema %s', task.schema)
+                error = force_text(exc)
+                get_schema_model().objects.filter(schema=task.schema).update(status=FAILED)
+            else:
+                LOGGER.info('New schema created: %s', task.schema)
+            task.worker = worker
+            task.completed_at = timezone.now()
+            task.error = error or ''
+            task.save()
+            results.append((task.schema, error))
+
+    return results
+
+
+def work(batch_size=1, worker=None):
+    """
+    Process batches of tasks until there are none left to claim.
+
+    Returns a list of (schema name, error) for every task processed.
+    """
+    results = []
+    while True:
+        batch = process_batch(batch_size, worker)
+        if not batch:
+            return results
+        results.extend(batch)
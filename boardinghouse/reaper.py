@@ -0,0 +1,110 @@
+"""
+Dropping schemata in the background, a few at a time.
+
+Dropping a schema (``DROP SCHEMA ... CASCADE``) takes an exclusive lock on
+every object in it, and when many schemata are dropped at once (by
+``Schema.objects.filter(...).delete(drop=True)``, or ``cleanup_expired_demos``),
+those locks are held until the whole transaction commits, stalling other DDL.
+
+When :data:`boardinghouse.settings.BOARDINGHOUSE_DEFER_SCHEMA_DROP` is enabled,
+deleting a schema only renames the database schema to a tombstone (prefixed
+with ``__dropped_``), which is quick, and frees the name for reuse straight
+away. The ``boardinghouse_reap_schemata`` command then drops the tombstones in
+small batches, each in it's own transaction with a ``lock_timeout``, pausing
+between batches. A batch that cannot get the locks it needs in time is skipped,
+and will be tried again on the next run.
+"""
+from __future__ import unicode_literals
+
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+from .schema import _existing_schemata
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+PREFIX = '__dropped_'
+
+
+def is_tombstone(schema_name):
+    return schema_name.startswith(PREFIX)
+
+
+def is_enabled():
+    return bool(settings.BOARDINGHOUSE_DEFER_SCHEMA_DROP)
+
+
+def condemn(schemata, cursor=None):
+    """
+    Rename each of the schemata that exist to a tombstone, so they will be
+    dropped by :func:`reap`.
+
+    Returns the names of the tombstones.
+    """
+    cursor = cursor or connection.cursor()
+    existing = _existing_schemata(schemata, cursor)
+    renames = [
+        (schema_name, '{0}{1}_{2}'.format(PREFIX, uuid.uuid4().hex[:8], schema_name))
+        for schema_name in schemata if schema_name in existing
+    ]
+    if renames:
+        cursor.execute(';'.join([
+            'ALTER SCHEMA {0} RENAME TO {1}'.format(
+                connection.ops.quote_name(schema_name),
+                connection.ops.quote_name(tombstone),
+            ) for schema_name, tombstone in renames
+        ]))
+    for schema_name, tombstone in renames:
+        LOGGER.info('Schema %s condemned as %s', schema_name, tombstone)
+    return [tombstone for schema_name, tombstone in renames]
+
+
+def tombstones(cursor=None):
+    cursor = cursor or connection.cursor()
+    cursor.execute(
+        'SELECT nspname FROM pg_catalog.pg_namespace WHERE nspname LIKE %s ORDER BY oid',
+        [PREFIX.replace('_', '\\_') + '%']
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def reap(batch_size=10, pause=1.0, lock_timeout='1s', limit=None):
+    """
+    Drop the tombstones, batch_size at a time, pausing for pause seconds
+    between batches. Each batch is dropped in it's own transaction, which
+    gives up on any lock it has waited lock_timeout for.
+
+    Returns a tuple of (dropped, skipped).
+    """
+    cursor = connection.cursor()
+    pending = tombstones(cursor)
+    if limit is not None:
+        pending = pending[:limit]
+
+    dropped = skipped = 0
+    for start in range(0, len(pending), batch_size):
+        if start:
+            time.sleep(pause)
+        batch = pending[start:start + batch_size]
+        began = time.time()
+        try:
+            with transaction.atomic():
+                cursor.execute('SET LOCAL lock_timeout = %s', [lock_timeout])
+                cursor.execute(';'.join([
+                    'DROP SCHEMA IF EXISTS {0} CASCADE'.format(connection.ops.quote_name(tombstone))
+                    for tombstone in batch
+                ]))
+        except OperationalError:
+            LOGGER.warning('Unable to drop schemata %s within %s: skipping', ', '.join(batch), lock_timeout)
+            skipped += len(batch)
+        else:
+            dropped += len(batch)
+            LOGGER.info('Dropped %d schemata in %.3fs (%d of %d)',
+                        len(batch), time.time() - began, dropped + skipped, len(pending))
+
+    return dropped, skipped
@@ -2,14 +2,17 @@ import logging
 
 from django.conf import settings
 from django.core.cache import cache
-from django.db import connection, models
+from django.db import DEFAULT_DB_ALIAS, models
 from django.dispatch import receiver
 
-from boardinghouse import signals
+from boardinghouse import (
+    clone, distributed, hibernation, lazy, provisioning, reaper, rollups, signals, snapshot,
+)
 from boardinghouse.exceptions import TemplateSchemaActivation, Forbidden
+from boardinghouse.fanout import apply_to_schemata
 from boardinghouse.schema import (
-    _schema_exists, _schema_table_exists, activate_template_schema,
-    get_active_schema_name, get_schema_model, is_shared_model,
+    _schema_exists, _schema_table_exists, _table_exists, get_active_schema_name,
+    get_schema_model, is_shared_model,
 )
 
 LOGGER = logging.getLogger(__name__)
@@ -28,7 +31,9 @@ def create_schema(sender, instance, created, **kwargs):
 
     How do we indicate when we should be using a different template?
     """
-    if created:
+    # Schemata created by SchemaQuerySet.bulk_create have already been
+    # created (or queued) in one go.
+    if created and not getattr(instance, '_schema_created', False):
         schema_name = instance.schema
 
         # How can we work out what values need to go here?
@@ -37,17 +42,15 @@ def create_schema(sender, instance, created, **kwargs):
         template_name = getattr(instance, '_clone', settings.TEMPLATE_SCHEMA)
         include_records = bool(getattr(instance, '_clone', False))
 
-        cursor = connection.cursor()
-
-        if _schema_exists(schema_name):
+        if not getattr(instance, '_schema_exists_checked', False) and _schema_exists(schema_name):
             raise ValueError('Attempt to create an existing schema: {0}'.format(schema_name))
 
-        cursor.execute("SELECT clone_schema(%s, %s, %s)", [
-            template_name,
-            schema_name,
-            include_records
-        ])
-        cursor.close()
+        if getattr(instance, 'status', None) == provisioning.PROVISIONING:
+            provisioning.enqueue(schema_name, template_name, include_records)
+            LOGGER.info('New schema queued for provisioning: %s', schema_name)
+            return
+
+        clone.create_schema(template_name, schema_name, include_records)
 
         if schema_name != settings.TEMPLATE_SCHEMA:
             signals.schema_created.send(sender=get_schema_model(), schema=schema_name)
@@ -55,6 +58,15 @@ def create_schema(sender, instance, created, **kwargs):
         LOGGER.info('New schema created: %s', schema_name)
 
 
+@receiver(models.signals.post_save, sender=Schema, weak=False, dispatch_uid='wake-schema')
+def wake_schema(sender, instance, created, **kwargs):
+    """
+    Restore a hibernated schema when it is made active again.
+    """
+    if not created and instance.is_active and getattr(instance, 'status', None) == hibernation.HIBERNATED:
+        hibernation.wake(instance)
+
+
 @receiver(models.signals.post_delete, sender=Schema, weak=False)
 def drop_schema(sender, instance, **kwargs):
     signals.schemata_deleted.send(sender=sender, schemata=[instance.schema])
@@ -64,6 +76,10 @@ def drop_schema(sender, instance, **kwargs):
 def drop_schemata(sender, schemata, connection=None, **kwargs):
     from django import db
     cursor = (connection or db.connection).cursor()
+    # The schemata will be dropped later by the reaper.
+    if reaper.is_enabled():
+        reaper.condemn(schemata, cursor)
+        return
     # Is there a way to do this without opening up an SQL injection hole?
     # I guess we have to rely on the fact that schema.schema is always a valid name...?
     sql = ';'.join(['DROP SCHEMA IF EXISTS {0} CASCADE'.format(schema) for schema in schemata])
@@ -73,6 +89,18 @@ def drop_schemata(sender, schemata, connection=None, **kwargs):
             LOGGER.info('Schema dropped: %s', schema)
 
 
+@receiver(signals.schemata_deleted, weak=False)
+def forget_migration_state(sender, schemata, **kwargs):
+    from boardinghouse.models import SchemaMigrationState
+    if _table_exists(SchemaMigrationState._meta.db_table):
+        SchemaMigrationState.objects.filter(schema__in=schemata).delete()
+
+
+@receiver(signals.schemata_deleted, weak=False)
+def forget_rollups(sender, schemata, **kwargs):
+    rollups.forget_schemata(schemata)
+
+
 @receiver(models.signals.post_init, sender=None)
 def inject_schema_attribute(sender, instance, **kwargs):
     """
@@ -91,15 +119,80 @@ def inject_schema_attribute(sender, instance, **kwargs):
 @receiver(signals.schema_aware_operation)
 def execute_on_all_schemata(sender, db_table, function, **kwargs):
     if _schema_table_exists():
-        for each in get_schema_model().objects.all():
-            each.activate()
-            function(*kwargs.get('args', []), **kwargs.get('kwargs', {}))
+        schemata = get_schema_model().objects.all()
+        # Schemata that are still waiting to be provisioned will be cloned
+        # from the (migrated) template schema.
+        if provisioning.is_enabled():
+            schemata = schemata.filter(status=provisioning.READY)
+        # Hibernated schemata will be cloned from the template schema when
+        # they are woken.
+        elif hibernation.is_enabled():
+            schemata = schemata.exclude(status=hibernation.HIBERNATED)
+        if lazy.is_enabled(kwargs.get('schema_editor')):
+            lazy.apply_lazily(schemata, db_table, function, **kwargs)
+        else:
+            apply_to_schemata(schemata, function, **kwargs)
 
 
 @receiver(signals.schema_aware_operation)
 def execute_on_template_schema(sender, db_table, function, **kwargs):
-    activate_template_schema()
-    function(*kwargs.get('args', []), **kwargs.get('kwargs', {}))
+    apply_to_schemata([settings.TEMPLATE_SCHEMA], function, **kwargs)
+
+
+@receiver(signals.list_schemata, weak=False, dispatch_uid='list-schemata')
+def list_schemata(sender, **kwargs):
+    schemata = [settings.TEMPLATE_SCHEMA]
+    if _schema_table_exists():
+        schemata.extend(get_schema_model().objects.values_list('schema', flat=True))
+    return schemata
+
+
+@receiver(signals.list_schemata, weak=False, dispatch_uid='list-spare-schemata')
+def list_spare_schemata(sender, **kwargs):
+    from boardinghouse.models import SpareSchema
+    if _table_exists(SpareSchema._meta.db_table):
+        return SpareSchema.objects.values_list('schema', flat=True)
+    return []
+
+
+@receiver(signals.schema_post_activate, weak=False)
+def bring_schema_up_to_date(sender, schema_name, **kwargs):
+    """
+    When using lazy (or distributed) migrations, apply any statements that
+    the schema that has just been activated has missed.
+    """
+    if lazy.is_suspended():
+        return
+    if not settings.BOARDINGHOUSE_LAZY_MIGRATIONS and not settings.BOARDINGHOUSE_DISTRIBUTED_FANOUT:
+        return
+    if schema_name and schema_name != settings.TEMPLATE_SCHEMA:
+        lazy.catch_up(schema_name)
+
+
+@receiver(models.signals.post_migrate, weak=False, dispatch_uid='coordinate-fanout')
+def coordinate_distributed_fanout(sender, **kwargs):
+    """
+    When using distributed migrations, once ``migrate`` has finished, queue
+    up the lagging schemata for the workers, and help them out.
+    """
+    if sender.name != 'boardinghouse' or not distributed.is_enabled():
+        return
+    if kwargs.get('using', DEFAULT_DB_ALIAS) != DEFAULT_DB_ALIAS:
+        return
+    distributed.coordinate()
+
+
+@receiver(models.signals.post_migrate, weak=False, dispatch_uid='refresh-snapshots')
+def refresh_schema_snapshots(sender, **kwargs):
+    """
+    Once ``migrate`` has finished, discard the snapshots of schemata that it
+    changed, and take a new one of the template schema.
+    """
+    if sender.name != 'boardinghouse' or not snapshot.is_enabled():
+        return
+    if kwargs.get('using', DEFAULT_DB_ALIAS) != DEFAULT_DB_ALIAS:
+        return
+    snapshot.refresh()
 
 
 @receiver(signals.session_requesting_schema_change)
@@ -0,0 +1,347 @@
+"""
+Aggregates of a private table across every schema, kept in one shared table.
+
+Reporting on every schema at once (the number of orders placed in each
+schema on each day, say) means querying every schema. A rollup instead keeps
+those aggregates in a shared table, ``<name>``, with a row for each schema
+(the ``schema`` column), day (``day``, the date of the rollup's
+``date_column``, if it has one) and combination of the values of the
+rollup's dimension columns, holding the number of rows (``count``) and the
+sum of each of the rollup's measure columns (named after that column).
+
+A rollup is installed by the :class:`boardinghouse.operations.InstallRollup`
+migration operation, which creates the shared tables, and a trigger on the
+private table in every schema (including the template schema, so that
+schemata cloned from it get one too). Each insert, update or delete appends
+the change to the aggregates to a shared delta table (``<name>_delta``):
+these appends do not contend with each other the way that updating the
+aggregates directly would. :func:`refresh` (and the
+``boardinghouse_refresh_rollups`` command) folds the deltas into the
+aggregates.
+
+Only the records of tenants' schemata are aggregated: changes in the template
+schema, and in schemata with the prefix of a template, demo or spare schema,
+are ignored (by the trigger, and when seeding a rollup).
+
+Records that are copied into a new schema (when cloning a schema with it's
+records) do not fire the trigger, as they are copied before the triggers are
+created (or while they are disabled): instead,
+:func:`boardinghouse.clone.create_schema` adds the aggregates of the new
+schema's records to every rollup once it has been cloned (see
+:func:`seed_schema`). :func:`rebuild` recalculates a rollup from scratch.
+When a schema is deleted (or hibernated), it's aggregates are removed.
+"""
+from __future__ import unicode_literals
+
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .schema import _table_exists
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+SCHEMA = 'schema'
+DAY = 'day'
+COUNT = 'count'
+
+FUNCTION = """
+CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+BEGIN
+  IF {excluded} THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP = 'UPDATE' AND {unchanged} THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    INSERT INTO {delta} ({columns}) VALUES (TG_TABLE_SCHEMA, {removed});
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO {delta} ({columns}) VALUES (TG_TABLE_SCHEMA, {added});
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+TRIGGER = 'CREATE TRIGGER {trigger} AFTER INSERT OR UPDATE OR DELETE ON {source} ' \
+          'FOR EACH ROW EXECUTE PROCEDURE {function}()'
+
+FOLD = """
+WITH folded AS (
+    DELETE FROM {delta} RETURNING *
+), grouped AS (
+    SELECT {keys}, {sums} FROM folded GROUP BY {keys}
+), updated AS (
+    UPDATE {table} AS r SET {increments} FROM grouped AS g WHERE {match} RETURNING r.*
+), inserted AS (
+    INSERT INTO {table} ({columns})
+    SELECT {columns} FROM grouped AS g WHERE NOT EXISTS (SELECT 1 FROM updated AS r WHERE {match})
+    RETURNING 1
+)
+SELECT (SELECT COUNT(*) FROM folded), (SELECT COUNT(*) FROM inserted)
+"""
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def shared_table(name):
+    return '{0}.{1}'.format(_quote(settings.PUBLIC_SCHEMA), _quote(name))
+
+
+def _split(columns):
+    return [column for column in columns.split(',') if column]
+
+
+def _literal(value):
+    return "'{0}'".format(value.replace("'", "''"))
+
+
+def _excluded(expression):
+    """
+    A condition (and it's params) that is true when the schema named by
+    expression is not a tenant's schema: the template schema, or one with the
+    prefix of a template, demo or spare schema.
+    """
+    from .orphans import _prefixes
+
+    prefixes = _prefixes()
+    sql = ' OR '.join(
+        ['{0} = %s'.format(expression)] + ['strpos({0}, %s) = 1'.format(expression)] * len(prefixes)
+    )
+    return '({0})'.format(sql), [settings.TEMPLATE_SCHEMA] + prefixes
+
+
+def execute(sql, params=None):
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    cursor.close()
+
+
+def delta_table(rollup):
+    return '{0}_delta'.format(rollup.name)
+
+
+def key_columns(rollup):
+    """
+    The columns of the rollup table that the aggregates are grouped by.
+    """
+    return [SCHEMA] + ([DAY] if rollup.date_column else []) + _split(rollup.dimensions)
+
+
+def measure_columns(rollup):
+    """
+    The columns of the rollup table that hold the aggregates.
+    """
+    return [COUNT] + _split(rollup.measures)
+
+
+def _key_values(rollup, row):
+    values = ['{0}.{1}'.format(row, _quote(column)) for column in _split(rollup.dimensions)]
+    if rollup.date_column:
+        values.insert(0, '{0}.{1}::date'.format(row, _quote(rollup.date_column)))
+    return values
+
+
+def _measure_values(rollup, row, sign):
+    return ['{0}1'.format(sign)] + [
+        '{0}COALESCE({1}.{2}, 0)'.format(sign, row, _quote(column)) for column in _split(rollup.measures)
+    ]
+
+
+def install_sql(rollup, types):
+    """
+    The statements that create the shared tables and trigger function of a
+    rollup. types maps each dimension column to it's database type.
+    """
+    columns = ['{0} varchar(63) NOT NULL'.format(_quote(SCHEMA))]
+    if rollup.date_column:
+        columns.append('{0} date'.format(_quote(DAY)))
+    columns.extend('{0} {1}'.format(_quote(column), types[column]) for column in _split(rollup.dimensions))
+    columns.append('{0} bigint NOT NULL'.format(_quote(COUNT)))
+    columns.extend('{0} numeric NOT NULL'.format(_quote(column)) for column in _split(rollup.measures))
+
+    tracked = [rollup.date_column] if rollup.date_column else []
+    tracked += _split(rollup.dimensions) + _split(rollup.measures)
+    if tracked:
+        unchanged = 'ROW({0}) IS NOT DISTINCT FROM ROW({1})'.format(
+            ', '.join('OLD.{0}'.format(_quote(column)) for column in tracked),
+            ', '.join('NEW.{0}'.format(_quote(column)) for column in tracked),
+        )
+    else:
+        unchanged = 'TRUE'
+
+    excluded, params = _excluded('TG_TABLE_SCHEMA')
+
+    return [
+        'CREATE TABLE {0} ({1})'.format(shared_table(rollup.name), ', '.join(columns)),
+        'CREATE INDEX {0} ON {1} ({2})'.format(
+            _quote('{0}_schema'.format(rollup.name)), shared_table(rollup.name), _quote(SCHEMA)
+        ),
+        'CREATE TABLE {0} ({1})'.format(shared_table(delta_table(rollup)), ', '.join(columns)),
+        FUNCTION.format(
+            function=shared_table(delta_table(rollup)),
+            excluded=excluded % tuple(_literal(param) for param in params),
+            unchanged=unchanged,
+            delta=shared_table(delta_table(rollup)),
+            columns=', '.join(_quote(column) for column in key_columns(rollup) + measure_columns(rollup)),
+            removed=', '.join(_key_values(rollup, 'OLD') + _measure_values(rollup, 'OLD', '-')),
+            added=', '.join(_key_values(rollup, 'NEW') + _measure_values(rollup, 'NEW', '')),
+        ),
+    ]
+
+
+def trigger_sql(rollup):
+    """
+    The statement that creates the trigger on the private table (in the
+    active schema).
+    """
+    return TRIGGER.format(
+        trigger=_quote(delta_table(rollup)),
+        source=_quote(rollup.source),
+        function=shared_table(delta_table(rollup)),
+    )
+
+
+def uninstall_sql(rollup):
+    return [
+        'DROP FUNCTION IF EXISTS {0}() CASCADE'.format(shared_table(delta_table(rollup))),
+        'DROP TABLE IF EXISTS {0}'.format(shared_table(delta_table(rollup))),
+        'DROP TABLE IF EXISTS {0}'.format(shared_table(rollup.name)),
+    ]
+
+
+def seed_sql(rollup, schema_name=None):
+    """
+    The statement that adds the aggregates of the records in the private
+    table (in schema_name, or the active schema) to the delta table.
+    """
+    if schema_name is None:
+        schema, source = 'current_schema()', _quote(rollup.source)
+    else:
+        schema, source = _literal(schema_name), '{0}.{1}'.format(_quote(schema_name), _quote(rollup.source))
+    keys = [schema] + _key_values(rollup, source)
+    sums = ['COUNT(*)'] + [
+        'COALESCE(SUM({0}), 0)'.format(_quote(column)) for column in _split(rollup.measures)
+    ]
+    group_by = ', '.join(str(position) for position in range(2, len(keys) + 1))
+    excluded, params = _excluded(schema)
+    return (
+        'INSERT INTO {delta} ({columns}) SELECT {values} FROM {source} '
+        'WHERE NOT {excluded} {group_by}HAVING COUNT(*) > 0'.format(
+            delta=shared_table(delta_table(rollup)),
+            columns=', '.join(_quote(column) for column in key_columns(rollup) + measure_columns(rollup)),
+            values=', '.join(keys + sums),
+            source=source,
+            excluded=excluded,
+            group_by='GROUP BY {0} '.format(group_by) if group_by else '',
+        ),
+        params
+    )
+
+
+def seed_schema(schema_name):
+    """
+    Add the aggregates of the records in schema_name (which have been copied
+    into it, rather than written) to every rollup.
+    """
+    from .models import Rollup
+
+    if not _table_exists(Rollup._meta.db_table):
+        return
+    for rollup in Rollup.objects.all():
+        execute(*seed_sql(rollup, schema_name))
+
+
+def _lock(rollup, cursor):
+    # Only one refresh (or rebuild) at a time: readers are not blocked.
+    cursor.execute('LOCK TABLE {0} IN SHARE ROW EXCLUSIVE MODE'.format(shared_table(rollup.name)))
+
+
+def _fold(rollup, cursor):
+    keys = key_columns(rollup)
+    measures = measure_columns(rollup)
+    cursor.execute(FOLD.format(
+        delta=shared_table(delta_table(rollup)),
+        table=shared_table(rollup.name),
+        keys=', '.join(_quote(column) for column in keys),
+        sums=', '.join('SUM({0}) AS {0}'.format(_quote(column)) for column in measures),
+        increments=', '.join('{0} = r.{0} + g.{0}'.format(_quote(column)) for column in measures),
+        match=' AND '.join(
+            'r.{0} = g.{0}'.format(_quote(column)) if column == SCHEMA else
+            'r.{0} IS NOT DISTINCT FROM g.{0}'.format(_quote(column))
+            for column in keys
+        ),
+        columns=', '.join(_quote(column) for column in keys + measures),
+    ))
+    folded, inserted = cursor.fetchone()
+    cursor.execute('DELETE FROM {0} WHERE {1} = 0'.format(shared_table(rollup.name), _quote(COUNT)))
+    return folded
+
+
+def refresh(rollups=None):
+    """
+    Fold the deltas of each rollup (or all of them) into it's aggregates.
+
+    Returns a list of (rollup name, number of deltas folded).
+    """
+    from .models import Rollup
+
+    if rollups is None:
+        rollups = Rollup.objects.all() if _table_exists(Rollup._meta.db_table) else []
+
+    results = []
+    for rollup in rollups:
+        with transaction.atomic():
+            cursor = connection.cursor()
+            _lock(rollup, cursor)
+            folded = _fold(rollup, cursor)
+            Rollup.objects.filter(pk=rollup.pk).update(refreshed_at=timezone.now())
+        LOGGER.info('Folded %d deltas into rollup %s', folded, rollup.name)
+        results.append((rollup.name, folded))
+    return results
+
+
+def rebuild(rollup, schemata=None):
+    """
+    Recalculate a rollup from the records in each of schemata (or every
+    schema that is ready).
+    """
+    from .fanout import apply_to_schemata
+    from .provisioning import READY
+    from .schema import deactivate_schema, get_schema_model
+
+    if schemata is None:
+        schemata = get_schema_model().objects.filter(status=READY)
+
+    with transaction.atomic():
+        cursor = connection.cursor()
+        _lock(rollup, cursor)
+        cursor.execute('DELETE FROM {0}'.format(shared_table(delta_table(rollup))))
+        cursor.execute('DELETE FROM {0}'.format(shared_table(rollup.name)))
+        apply_to_schemata(schemata, execute, args=seed_sql(rollup))
+        deactivate_schema()
+        _fold(rollup, cursor)
+
+
+def forget_schemata(schemata):
+    """
+    Remove the aggregates (and deltas) of each of schemata from every rollup.
+    """
+    from .models import Rollup
+
+    if not schemata or not _table_exists(Rollup._meta.db_table):
+        return
+
+    cursor = connection.cursor()
+    for rollup in Rollup.objects.all():
+        for table in [rollup.name, delta_table(rollup)]:
+            cursor.execute('DELETE FROM {0} WHERE {1} = ANY(%s)'.format(
+                shared_table(table), _quote(SCHEMA)
+            ), [list(schemata)])
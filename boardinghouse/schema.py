@@ -11,7 +11,7 @@ from django.db import connection
 from django.db.migrations.operations.base import Operation
 from django.utils.translation import lazy
 
-from .exceptions import TemplateSchemaActivation, SchemaNotFound
+from .exceptions import TemplateSchemaActivation, SchemaNotFound, SchemaNotReady
 from .signals import find_schema
 
 LOGGER = logging.getLogger(__name__)
@@ -70,6 +70,24 @@ def _schema_exists(schema_name, cursor=None):
         cursor.close()
 
 
+def _existing_schemata(schema_names, cursor=None):
+    """
+    Which of schema_names already exist in the database (in one query)?
+    """
+    if cursor:
+        cursor.execute('''SELECT schema_name
+                            FROM information_schema.schemata
+                           WHERE schema_name = ANY(%s)''',
+                       [list(schema_names)])
+        return set(row[0] for row in cursor.fetchall())
+
+    cursor = connection.cursor()
+    try:
+        return _existing_schemata(schema_names, cursor)
+    finally:
+        cursor.close()
+
+
 def get_active_schema_name():
     """
     Get the currently active schema.
@@ -142,6 +160,9 @@ def activate_schema(schema_name):
     _set_search_path(schema_name)
     found_schema = _get_search_path()
     if found_schema != schema_name:
+        from .provisioning import is_provisioning
+        if is_provisioning(schema_name):
+            raise SchemaNotReady('Schema "{0}" is still being provisioned'.format(schema_name))
         raise SchemaNotFound('Schema activation failed. Expected "{0}", saw "{1}"'.format(
             schema_name, found_schema,
         ))
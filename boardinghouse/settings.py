@@ -1,3 +1,5 @@
+import datetime
+
 SHARED_MODELS = []
 """
 Models that should be in the public/shared schema,
@@ -38,3 +40,139 @@ The model that will store the actual schema objects. This should be a
 subclass of :class:`boardinghouse.models.AbstractSchema`, or expose the
 same methods.
 """
+
+BOARDINGHOUSE_FANOUT_LOCK_TIMEOUT = None
+"""
+The ``lock_timeout`` to apply to each private statement as it is executed
+in each schema during a migration, as a Postgres interval (``'2s'``).
+
+When this is set, a statement that is queued behind a long running query
+in a busy schema will give up, rather than blocking all other queries on
+that table until it acquires the lock.
+"""
+
+BOARDINGHOUSE_FANOUT_STATEMENT_TIMEOUT = None
+"""
+The ``statement_timeout`` to apply to each private statement as it is
+executed in each schema during a migration, as a Postgres interval.
+"""
+
+BOARDINGHOUSE_FANOUT_RETRIES = 0
+"""
+How many times a private statement that failed to acquire a lock within
+``BOARDINGHOUSE_FANOUT_LOCK_TIMEOUT`` should be retried in that schema.
+"""
+
+BOARDINGHOUSE_FANOUT_RETRY_DELAY = 0.5
+"""
+The base delay (in seconds) before retrying a statement that failed to
+acquire a lock. This doubles with each attempt, and a random amount of it
+is used, so that retries in different processes do not line up.
+"""
+
+BOARDINGHOUSE_FANOUT_REPORT_SIZE = 10
+"""
+How many of the schemata that spent the longest waiting for locks (see
+:mod:`boardinghouse.fanout`) to log at the end of each migration.
+"""
+
+BOARDINGHOUSE_CONCURRENT_INDEXES = False
+"""
+Create private indexes using ``CREATE INDEX CONCURRENTLY`` in each schema,
+when they are created outside of a transaction (in a migration with
+``atomic = False``). This means that writes to the table are not blocked
+while the index is built.
+"""
+
+BOARDINGHOUSE_CONCURRENT_INDEX_WORKERS = 1
+"""
+How many schemata should have an index built concurrently at the same time.
+Each worker uses it's own database connection.
+"""
+
+BOARDINGHOUSE_LAZY_MIGRATIONS = False
+"""
+Only apply private statements to active schemata that have been activated
+recently during ``migrate``: other schemata will have them applied when
+they are next activated. See :mod:`boardinghouse.lazy`.
+"""
+
+BOARDINGHOUSE_LAZY_MIGRATION_WINDOW = datetime.timedelta(days=7)
+"""
+How recently a schema must have been activated for it to be migrated
+immediately when ``BOARDINGHOUSE_LAZY_MIGRATIONS`` is enabled.
+"""
+
+BOARDINGHOUSE_FANOUT_TIMING_SAMPLES = 1000
+"""
+How many timings of each kind of private statement to keep, for estimating
+the cost of future migrations (see :mod:`boardinghouse.planner`). Set to 0
+to disable recording timings.
+"""
+
+BOARDINGHOUSE_DISTRIBUTED_FANOUT = False
+"""
+Defer private statements executed during ``migrate`` (except in the template
+schema), and once it has finished, queue up every schema for migration by
+``boardinghouse_fanout_worker`` processes. See :mod:`boardinghouse.distributed`.
+"""
+
+BOARDINGHOUSE_DISTRIBUTED_FANOUT_BATCH_SIZE = 10
+"""
+How many schemata a worker claims (and migrates in one transaction) at a time.
+"""
+
+BOARDINGHOUSE_DISTRIBUTED_FANOUT_POLL_INTERVAL = 1.0
+"""
+How many seconds a worker waits before looking for more tasks, when there
+are none.
+"""
+
+BOARDINGHOUSE_CLONE_WORKERS = 1
+"""
+How many database connections to use to copy the records of a schema that
+is created as a clone of another schema (rather than of the template schema),
+and to clone the template schema into schemata that are created in bulk.
+See :mod:`boardinghouse.clone`.
+"""
+
+BOARDINGHOUSE_SPARE_SCHEMATA = 0
+"""
+How many spare schemata the ``boardinghouse_refill_spares`` command should
+keep cloned from the template schema, so that creating a schema just renames
+one of them. See :mod:`boardinghouse.spares`.
+"""
+
+BOARDINGHOUSE_SCHEMA_SNAPSHOTS = False
+"""
+Create new schemata by executing a stored snapshot of the statements that
+re-create the template schema (or the schema being cloned), rather than
+introspecting it each time. See :mod:`boardinghouse.snapshot`.
+"""
+
+BOARDINGHOUSE_ASYNC_PROVISIONING = False
+"""
+Create the database schema for a new schema object in the background, using
+``boardinghouse_provision_schemata`` workers, rather than while the object is
+being saved. See :mod:`boardinghouse.provisioning`.
+"""
+
+BOARDINGHOUSE_DEFER_SCHEMA_DROP = False
+"""
+Rename the database schema of a deleted schema to a tombstone, rather than
+dropping it, and leave the ``boardinghouse_reap_schemata`` command to drop
+the tombstones a few at a time. See :mod:`boardinghouse.reaper`.
+"""
+
+BOARDINGHOUSE_HIBERNATION_PATH = None
+"""
+The directory that the records of hibernated schemata are archived in. When
+this is set, inactive schemata may be hibernated (see
+:mod:`boardinghouse.hibernation`).
+"""
+
+BOARDINGHOUSE_GATHER_WORKERS = 4
+"""
+How many database connections :func:`boardinghouse.gather.gather` uses to
+execute a query against each of a number of schemata at once.
+"""
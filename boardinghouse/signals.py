@@ -11,6 +11,13 @@ Signals that are fired as part of the django-boardinghouse project.
     Sent when a new schema object has been created in the database. Accepts a
     single argument, the (internal) name of the schema.
 
+.. data:: schemata_created
+
+    Sent once when a number of schema objects have been created in the
+    database by :meth:`boardinghouse.models.SchemaQuerySet.bulk_create`
+    (after :data:`schema_created` has been sent for each of them). Accepts a
+    single argument, a list of the (internal) names of the schemata.
+
 .. data:: schema_pre_activate
 
     Sent just before a schema will be activated. May be used to abort this by
@@ -41,11 +48,19 @@ Signals that are fired as part of the django-boardinghouse project.
     are applied to :class:`boardinghouse.contrib.template.models.SchemaTemplate`
     instances.
 
+.. data:: list_schemata
+
+    Sent to find out which database schemata are in use. Each receiver should
+    return an iterable of the (internal) names of the schemata it is
+    responsible for: any other schemata in the database are orphans (see
+    :mod:`boardinghouse.orphans`).
+
 """
 
 from django.dispatch import Signal
 
 schema_created = Signal(providing_args=["schema"])
+schemata_created = Signal(providing_args=["schemata"])
 schemata_deleted = Signal(providing_args=["schemata"])
 
 schema_pre_activate = Signal(providing_args=["schema"])
@@ -57,3 +72,5 @@ session_schema_changed = Signal(providing_args=["user", "schema", "session"])
 schema_aware_operation = Signal(providing_args=['db_table', 'sql', 'params', 'execute'])
 
 find_schema = Signal(providing_args=['schema'])
+
+list_schemata = Signal()
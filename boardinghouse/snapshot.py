@@ -0,0 +1,342 @@
+"""
+Snapshots of the DDL that creates a copy of a schema.
+
+The ``clone_schema()`` database function walks the system catalogs of the
+source schema every time it is called, but the structure of the template
+schema (and of each :class:`boardinghouse.contrib.template.models.SchemaTemplate`)
+only changes when migrations are run. When
+:data:`boardinghouse.settings.BOARDINGHOUSE_SCHEMA_SNAPSHOTS` is enabled, the
+statements that re-create a source schema are generated once, and stored in a
+:class:`boardinghouse.models.SchemaSnapshot` (along with the fingerprint of
+the source schema, see :mod:`boardinghouse.drift`). Each new schema is then
+created by executing that script, with the new schema's name substituted in,
+in a single round trip.
+
+A snapshot is generated the first time a schema is cloned from a source, and
+after each ``migrate``, the snapshots of any source schemata that have changed
+are discarded, and that of the template schema is generated again. A snapshot
+is only used while it's fingerprint still matches the source schema (as with
+:mod:`boardinghouse.spares`): otherwise it is generated again.
+
+The script creates the same sequences, tables (columns, defaults, collations
+and constraints), indexes (with the same names), triggers, views and
+functions as the database function. Column storage, statistics targets and
+comments are not included.
+"""
+from __future__ import unicode_literals
+
+import logging
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import drift
+from .schema import _table_exists
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+#: Stands in for the (quoted) name of the new schema in a snapshot.
+PLACEHOLDER = '__boardinghouse_schema__'
+
+SEQUENCES = """
+    SELECT c.relname,
+           pg_catalog.format_type(s.seqtypid, NULL),
+           s.seqincrement, s.seqmin, s.seqmax, s.seqstart, s.seqcache, s.seqcycle
+      FROM pg_catalog.pg_class c
+INNER JOIN pg_catalog.pg_sequence s ON (s.seqrelid = c.oid)
+     WHERE c.relnamespace = %s
+       AND c.relkind = 'S'
+  ORDER BY c.oid
+"""
+
+COLUMNS = """
+    SELECT c.relname,
+           a.attname,
+           pg_catalog.format_type(a.atttypid, a.atttypmod),
+           a.attnotnull,
+           pg_catalog.pg_get_expr(d.adbin, d.adrelid),
+           CASE WHEN a.attcollation <> t.typcollation
+                THEN quote_ident(cn.nspname) || '.' || quote_ident(co.collname)
+           END
+      FROM pg_catalog.pg_class c
+INNER JOIN pg_catalog.pg_attribute a ON (a.attrelid = c.oid)
+INNER JOIN pg_catalog.pg_type t ON (t.oid = a.atttypid)
+ LEFT JOIN pg_catalog.pg_attrdef d ON (d.adrelid = a.attrelid AND d.adnum = a.attnum)
+ LEFT JOIN pg_catalog.pg_collation co ON (co.oid = a.attcollation)
+ LEFT JOIN pg_catalog.pg_namespace cn ON (cn.oid = co.collnamespace)
+     WHERE c.relnamespace = %s
+       AND c.relkind = 'r'
+       AND a.attnum > 0
+       AND NOT a.attisdropped
+  ORDER BY c.oid, a.attnum
+"""
+
+CONSTRAINTS = """
+    SELECT c.relname, r.conname, pg_catalog.pg_get_constraintdef(r.oid, true)
+      FROM pg_catalog.pg_constraint r
+INNER JOIN pg_catalog.pg_class c ON (c.oid = r.conrelid)
+     WHERE c.relnamespace = %s
+       AND c.relkind = 'r'
+       AND r.contype = ANY(%s)
+  ORDER BY c.oid, r.oid
+"""
+
+INDEXES = """
+    SELECT pg_catalog.pg_get_indexdef(x.indexrelid)
+      FROM pg_catalog.pg_index x
+INNER JOIN pg_catalog.pg_class c ON (c.oid = x.indrelid)
+     WHERE c.relnamespace = %s
+       AND c.relkind = 'r'
+       AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_constraint r WHERE r.conindid = x.indexrelid AND r.conrelid = c.oid)
+  ORDER BY c.oid, x.indexrelid
+"""
+
+SEQUENCE_OWNERS = """
+    SELECT s.relname, c.relname, a.attname
+      FROM pg_catalog.pg_class s
+INNER JOIN pg_catalog.pg_depend d ON (d.classid = 'pg_catalog.pg_class'::regclass
+                                  AND d.objid = s.oid
+                                  AND d.refclassid = 'pg_catalog.pg_class'::regclass
+                                  AND d.deptype = 'a')
+INNER JOIN pg_catalog.pg_class c ON (c.oid = d.refobjid)
+INNER JOIN pg_catalog.pg_attribute a ON (a.attrelid = c.oid AND a.attnum = d.refobjsubid)
+     WHERE s.relnamespace = %s
+       AND s.relkind = 'S'
+       AND c.relnamespace = s.relnamespace
+  ORDER BY s.oid
+"""
+
+TRIGGERS = """
+    SELECT pg_catalog.pg_get_triggerdef(t.oid, false)
+      FROM pg_catalog.pg_trigger t
+INNER JOIN pg_catalog.pg_class c ON (c.oid = t.tgrelid)
+     WHERE c.relnamespace = %s
+       AND c.relkind = 'r'
+       AND NOT t.tgisinternal
+  ORDER BY t.oid
+"""
+
+VIEWS = """
+    SELECT relname, pg_catalog.pg_get_viewdef(oid)
+      FROM pg_catalog.pg_class
+     WHERE relnamespace = %s
+       AND relkind = 'v'
+  ORDER BY oid
+"""
+
+FUNCTIONS = """
+    SELECT pg_catalog.pg_get_functiondef(p.oid)
+      FROM pg_catalog.pg_proc p
+     WHERE p.pronamespace = %s
+       AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_aggregate WHERE aggfnoid = p.oid)
+  ORDER BY p.oid
+"""
+
+
+def is_enabled():
+    if not settings.BOARDINGHOUSE_SCHEMA_SNAPSHOTS:
+        return False
+    from .models import SchemaSnapshot
+    return _table_exists(SchemaSnapshot._meta.db_table)
+
+
+def _join(statements):
+    return ''.join('{0};\n'.format(statement.rstrip().rstrip(';')) for statement in statements)
+
+
+def _sequences(cursor, source, namespace):
+    quote = connection.ops.quote_name
+
+    if connection.pg_version >= 100000:
+        cursor.execute(SEQUENCES, [namespace])
+        sequences = cursor.fetchall()
+    else:
+        cursor.execute("SELECT relname FROM pg_catalog.pg_class WHERE relnamespace = %s AND relkind = 'S' ORDER BY oid",
+                       [namespace])
+        sequences = []
+        for name in [row[0] for row in cursor.fetchall()]:
+            cursor.execute('SELECT increment_by, min_value, max_value, start_value, cache_value, is_cycled '
+                           'FROM {0}.{1}'.format(quote(source), quote(name)))
+            sequences.append((name, None) + cursor.fetchone())
+
+    return [
+        'CREATE SEQUENCE {0}.{1}{2} INCREMENT BY {3} MINVALUE {4} MAXVALUE {5} START WITH {6} CACHE {7} {8}'.format(
+            PLACEHOLDER, quote(name), ' AS {0}'.format(data_type) if data_type else '',
+            increment, minimum, maximum, start, cache, 'CYCLE' if cycle else 'NO CYCLE'
+        )
+        for name, data_type, increment, minimum, maximum, start, cache, cycle in sequences
+    ]
+
+
+def _tables(cursor, namespace):
+    quote = connection.ops.quote_name
+    tables = []
+    columns = {}
+
+    cursor.execute(COLUMNS, [namespace])
+    for table, column, data_type, not_null, default, collation in cursor.fetchall():
+        if table not in columns:
+            tables.append(table)
+            columns[table] = []
+        columns[table].append(' '.join(filter(None, [
+            quote(column),
+            data_type,
+            collation and 'COLLATE {0}'.format(collation),
+            default and 'DEFAULT {0}'.format(default),
+            not_null and 'NOT NULL',
+        ])))
+
+    return tables, [
+        'CREATE TABLE {0}.{1} ({2})'.format(PLACEHOLDER, quote(table), ', '.join(columns[table]))
+        for table in tables
+    ]
+
+
+def _constraints(cursor, namespace, kinds):
+    quote = connection.ops.quote_name
+    cursor.execute(CONSTRAINTS, [namespace, list(kinds)])
+    return [
+        'ALTER TABLE {0}.{1} ADD CONSTRAINT {2} {3}'.format(PLACEHOLDER, quote(table), quote(name), definition)
+        for table, name, definition in cursor.fetchall()
+    ]
+
+
+def _requalify(script, qualifier):
+    """
+    Replace the (quoted) qualifier of each identifier in script with the
+    placeholder, leaving the same text within other identifiers alone.
+    """
+    pattern = r'(?<![\w$".]){0}(?=\.[\w"])'.format(re.escape(qualifier))
+    return re.sub(pattern, PLACEHOLDER, script, flags=re.UNICODE)
+
+
+def generate(source):
+    """
+    Generate the statements that re-create the schema source.
+
+    Returns a tuple of three scripts: creating the tables (and sequences),
+    copying the records from source into them, and finishing them off (indexes,
+    foreign keys, triggers, views and functions).
+    """
+    quote = connection.ops.quote_name
+    cursor = connection.cursor()
+
+    cursor.execute('SELECT oid, quote_ident(nspname) FROM pg_catalog.pg_namespace WHERE nspname = %s', [source])
+    namespace, qualifier = cursor.fetchone()
+
+    # References to objects in the source schema are only qualified when
+    # it is not in our search path. The savepoint means that our search path
+    # is restored if anything fails (and the transaction is not left aborted).
+    cursor.execute('SHOW search_path')
+    search_path = cursor.fetchone()[0]
+
+    with transaction.atomic():
+        cursor.execute('SET search_path TO {0}'.format(quote(settings.PUBLIC_SCHEMA)))
+        sequences = _sequences(cursor, source, namespace)
+        tables, create_tables = _tables(cursor, namespace)
+        structure = ['CREATE SCHEMA {0}'.format(PLACEHOLDER)] + sequences + create_tables + \
+            _constraints(cursor, namespace, 'c')
+
+        records = [
+            'INSERT INTO {0}.{1} SELECT * FROM {2}.{1}'.format(PLACEHOLDER, quote(table), quote(source))
+            for table in tables
+        ]
+        cursor.execute("SELECT relname FROM pg_catalog.pg_class WHERE relnamespace = %s AND relkind = 'S' ORDER BY oid",
+                       [namespace])
+        records.extend([
+            "SELECT setval('{0}.{1}', last_value, is_called) FROM {2}.{1}".format(PLACEHOLDER, quote(row[0]), quote(source))
+            for row in cursor.fetchall()
+        ])
+
+        finish = _constraints(cursor, namespace, 'pux')
+        cursor.execute(INDEXES, [namespace])
+        finish.extend(row[0] for row in cursor.fetchall())
+        finish.extend(_constraints(cursor, namespace, 'f'))
+        cursor.execute(SEQUENCE_OWNERS, [namespace])
+        finish.extend(
+            'ALTER SEQUENCE {0}.{1} OWNED BY {0}.{2}.{3}'.format(PLACEHOLDER, quote(sequence), quote(table), quote(column))
+            for sequence, table, column in cursor.fetchall()
+        )
+        cursor.execute(TRIGGERS, [namespace])
+        finish.extend(row[0] for row in cursor.fetchall())
+        cursor.execute(VIEWS, [namespace])
+        finish.extend(
+            'CREATE VIEW {0}.{1} AS {2}'.format(PLACEHOLDER, quote(view), definition)
+            for view, definition in cursor.fetchall()
+        )
+        cursor.execute(FUNCTIONS, [namespace])
+        finish.extend(row[0] for row in cursor.fetchall())
+        cursor.execute('SET search_path TO {0}'.format(search_path))
+
+    # The records are (deliberately) still copied from the source schema.
+    return (
+        _requalify(_join(structure), qualifier),
+        _join(records),
+        _requalify(_join(finish), qualifier),
+    )
+
+
+def get_snapshot(source):
+    """
+    Get the snapshot of the current structure of the schema source,
+    generating (and storing) it if there is not one yet.
+
+    A snapshot whose fingerprint no longer matches source (because it was
+    changed outside of ``migrate``, or ``migrate`` has not finished yet) is
+    never used, and is replaced.
+    """
+    from .models import SchemaSnapshot
+
+    fingerprint = drift.fingerprints(None, [source]).get(source, '')
+    snapshot = SchemaSnapshot.objects.filter(source=source, fingerprint=fingerprint).order_by('-id').first()
+    if snapshot is None:
+        structure, records, finish = generate(source)
+        SchemaSnapshot.objects.filter(source=source).delete()
+        snapshot = SchemaSnapshot.objects.create(
+            source=source,
+            fingerprint=fingerprint,
+            structure=structure,
+            records=records,
+            finish=finish,
+        )
+        LOGGER.info('Generated snapshot of schema %s', source)
+    return snapshot
+
+
+def clone_schema(source, dest, include_records=False):
+    """
+    Create the schema dest as a copy of source, by executing the snapshot
+    of source.
+    """
+    clone_schemata(source, [dest], include_records)
+
+
+def clone_schemata(source, dests, include_records=False):
+    """
+    Create each of the schemata in dests as a copy of source, by executing
+    the snapshot of source once for each of them (in a single round trip).
+    """
+    snapshot = get_snapshot(source)
+    script = snapshot.structure + (snapshot.records if include_records else '') + snapshot.finish
+    connection.cursor().execute(''.join([
+        script.replace(PLACEHOLDER, connection.ops.quote_name(dest)) for dest in dests
+    ]))
+
+
+def refresh():
+    """
+    Discard the snapshots of any source schemata that have changed (or no
+    longer exist), and generate a new snapshot of the template schema.
+    """
+    from .models import SchemaSnapshot
+
+    snapshots = list(SchemaSnapshot.objects.all())
+    found = drift.fingerprints(None, set(snapshot.source for snapshot in snapshots))
+    stale = [snapshot.pk for snapshot in snapshots if found.get(snapshot.source) != snapshot.fingerprint]
+    SchemaSnapshot.objects.filter(pk__in=stale).delete()
+    if stale:
+        LOGGER.info('Discarded %d schema snapshots', len(stale))
+
+    get_snapshot(settings.TEMPLATE_SCHEMA)
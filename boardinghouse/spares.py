@@ -0,0 +1,128 @@
+"""
+A pool of spare schemata, cloned from the template schema ahead of time.
+
+Cloning the template schema takes longer the more tables it has, and happens
+while whatever created the :class:`boardinghouse.models.Schema` waits. When
+:data:`boardinghouse.settings.BOARDINGHOUSE_SPARE_SCHEMATA` is set, the
+``boardinghouse_refill_spares`` command keeps that many spare schemata cloned
+from the template schema: creating a schema then claims one of them, and
+renames it.
+
+Each spare records the fingerprint of it's structure (see
+:mod:`boardinghouse.drift`) when it is created, and may only be claimed while
+that still matches the template schema. Spares that have been left behind by
+a migration are dropped when the pool is next refilled.
+"""
+from __future__ import unicode_literals
+
+import logging
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import drift
+from .schema import _table_exists
+
+LOGGER = logging.getLogger(__name__)
+LOGGER.addHandler(logging.NullHandler())
+
+PREFIX = '__spare_'
+
+
+def is_spare(schema_name):
+    return schema_name.startswith(PREFIX)
+
+
+def is_enabled():
+    if not settings.BOARDINGHOUSE_SPARE_SCHEMATA:
+        return False
+    from .models import SpareSchema
+    return _table_exists(SpareSchema._meta.db_table)
+
+
+def _fingerprint(schema_name, cursor=None):
+    return drift.fingerprints(cursor, [schema_name]).get(schema_name)
+
+
+def claim(schema_name):
+    """
+    Rename a spare schema that matches the template schema to schema_name.
+
+    Returns False if there were none available.
+    """
+    return bool(claim_many([schema_name]))
+
+
+def claim_many(schema_names):
+    """
+    Rename spare schemata that match the template schema to as many of
+    schema_names as there are spares available.
+
+    Returns the list of schema names that were claimed.
+    """
+    from .models import SpareSchema
+
+    if not is_enabled() or not schema_names:
+        return []
+
+    cursor = connection.cursor()
+    with transaction.atomic():
+        cursor.execute(
+            'SELECT id, schema FROM {0} WHERE fingerprint = %s '
+            'ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED'.format(SpareSchema._meta.db_table),
+            [_fingerprint(settings.TEMPLATE_SCHEMA, cursor), len(schema_names)]
+        )
+        rows = cursor.fetchall()
+        if len(rows) < len(schema_names):
+            LOGGER.warning('Not enough spare schemata available: cloning %s instead', settings.TEMPLATE_SCHEMA)
+        if not rows:
+            return []
+        claimed = list(zip([row[1] for row in rows], schema_names))
+        cursor.execute(';'.join([
+            'ALTER SCHEMA {0} RENAME TO {1}'.format(
+                connection.ops.quote_name(spare),
+                connection.ops.quote_name(schema_name),
+            ) for spare, schema_name in claimed
+        ]))
+        SpareSchema.objects.filter(pk__in=[row[0] for row in rows]).delete()
+
+    for spare, schema_name in claimed:
+        LOGGER.debug('Claimed spare schema %s as %s', spare, schema_name)
+    return [schema_name for spare, schema_name in claimed]
+
+
+def refill(size=None):
+    """
+    Drop the spare schemata that no longer match the template schema, and
+    clone new ones until there are size (or the configured number of) spares.
+
+    Returns a tuple of (created, discarded).
+    """
+    from .models import SpareSchema
+
+    size = settings.BOARDINGHOUSE_SPARE_SCHEMATA if size is None else size
+    cursor = connection.cursor()
+    fingerprint = _fingerprint(settings.TEMPLATE_SCHEMA, cursor)
+
+    discarded = 0
+    for spare in SpareSchema.objects.exclude(fingerprint=fingerprint):
+        with transaction.atomic():
+            cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(connection.ops.quote_name(spare.schema)))
+            spare.delete()
+        LOGGER.info('Discarded spare schema %s', spare.schema)
+        discarded += 1
+
+    created = 0
+    while SpareSchema.objects.filter(fingerprint=fingerprint).count() < size:
+        schema_name = PREFIX + uuid.uuid4().hex[:16]
+        with transaction.atomic():
+            cursor.execute('SELECT clone_schema(%s, %s)', [settings.TEMPLATE_SCHEMA, schema_name])
+            SpareSchema.objects.create(schema=schema_name, fingerprint=_fingerprint(schema_name, cursor))
+        LOGGER.info('Created spare schema %s', schema_name)
+        created += 1
+        # The template schema has changed since we started.
+        if created > size:
+            break
+
+    return created, discarded
@@ -0,0 +1,263 @@
+CREATE OR REPLACE FUNCTION clone_schema(
+  source_schema   text,
+  dest_schema     text,
+  include_records boolean
+) RETURNS void AS $$
+
+-- This version works directly from the system catalogs (pg_class,
+-- pg_attribute, pg_attrdef, pg_sequence, pg_constraint, pg_trigger and
+-- pg_depend), rather than information_schema, and finds each kind of object
+-- for every table in one query, rather than one query per table.
+--
+-- Tables are created without their indexes, and any records are loaded into
+-- them before the indexes (and the constraints that are backed by an index)
+-- are built, rather than maintaining every index row by row. The indexes keep
+-- the names they have in the source schema.
+
+DECLARE
+  source_oid            oid;
+  dest_oid              oid;
+  source_qualifier      text;
+  dest_qualifier        text;
+  "sequence"            record;
+  object                text;
+  sql_                  text;
+
+BEGIN
+  -- I seemed to be getting errors if I didn't do this.
+  SET search_path TO public;
+
+  -- Check that the source_schema exists.
+  SELECT oid INTO source_oid
+    FROM pg_catalog.pg_namespace
+   WHERE nspname = source_schema;
+  IF NOT FOUND THEN
+         RAISE NOTICE 'Source schema % does not exist.', source_schema;
+         RETURN;
+  END IF;
+
+  -- Check that the dest_schema does not yet exist.
+  PERFORM nspname
+     FROM pg_catalog.pg_namespace
+    WHERE nspname = dest_schema;
+  IF FOUND THEN
+     RAISE NOTICE 'Destination schema % already exists', dest_schema;
+     RETURN;
+  END IF;
+
+  RAISE INFO 'CREATE SCHEMA %', dest_schema;
+  EXECUTE format('CREATE SCHEMA %I', dest_schema);
+
+  SELECT oid INTO dest_oid
+    FROM pg_catalog.pg_namespace
+   WHERE nspname = dest_schema;
+
+  -- References to objects in the source schema are qualified (as it is not
+  -- in our search path), and need to refer to the destination schema.
+  source_qualifier := quote_ident(source_schema) || '.';
+  dest_qualifier := quote_ident(dest_schema) || '.';
+
+  -- Create sequences.
+  -- We want to do this before creating tables, because then we can refer to these
+  -- sequences within the table definitions.
+  IF current_setting('server_version_num')::integer >= 100000 THEN
+    FOR "sequence" IN
+      SELECT c.relname AS name,
+             pg_catalog.format_type(s.seqtypid, NULL) AS data_type,
+             s.seqincrement AS increment_by,
+             s.seqmin AS min_value,
+             s.seqmax AS max_value,
+             s.seqstart AS start_value,
+             s.seqcache AS cache_value,
+             s.seqcycle AS is_cycled,
+             pg_catalog.pg_sequence_last_value(c.oid) AS last_value
+        FROM pg_catalog.pg_class c
+  INNER JOIN pg_catalog.pg_sequence s ON (s.seqrelid = c.oid)
+       WHERE c.relnamespace = source_oid
+         AND c.relkind = 'S'
+    LOOP
+      sql_ := format('CREATE SEQUENCE %I.%I AS %s INCREMENT BY %s MINVALUE %s MAXVALUE %s START WITH %s CACHE %s %s',
+                     dest_schema, "sequence".name, "sequence".data_type,
+                     "sequence".increment_by, "sequence".min_value, "sequence".max_value,
+                     "sequence".start_value, "sequence".cache_value,
+                     CASE WHEN "sequence".is_cycled THEN 'CYCLE' ELSE 'NO CYCLE' END);
+      RAISE DEBUG '%', sql_;
+      EXECUTE sql_;
+      -- The last value is NULL if the sequence has never been used.
+      IF include_records AND "sequence".last_value IS NOT NULL THEN
+        PERFORM setval(format('%I.%I', dest_schema, "sequence".name), "sequence".last_value, true);
+      END IF;
+    END LOOP;
+  ELSE
+    -- Before Postgres 10, the sequence parameters are only available from
+    -- the sequence itself.
+    FOR object IN
+      SELECT relname
+        FROM pg_catalog.pg_class
+       WHERE relnamespace = source_oid
+         AND relkind = 'S'
+    LOOP
+      EXECUTE format('SELECT last_value, max_value, start_value, increment_by, min_value,
+                             cache_value, is_cycled, is_called
+                        FROM %I.%I', source_schema, object)
+         INTO "sequence";
+      sql_ := format('CREATE SEQUENCE %I.%I INCREMENT BY %s MINVALUE %s MAXVALUE %s START WITH %s CACHE %s %s',
+                     dest_schema, object,
+                     "sequence".increment_by, "sequence".min_value, "sequence".max_value,
+                     "sequence".start_value, "sequence".cache_value,
+                     CASE WHEN "sequence".is_cycled THEN 'CYCLE' ELSE 'NO CYCLE' END);
+      RAISE DEBUG '%', sql_;
+      EXECUTE sql_;
+      IF include_records THEN
+        PERFORM setval(format('%I.%I', dest_schema, object), "sequence".last_value, "sequence".is_called);
+      END IF;
+    END LOOP;
+  END IF;
+
+  -- Create tables, and bulk load any records into them while they have no indexes.
+  FOR object IN
+    SELECT relname
+      FROM pg_catalog.pg_class
+     WHERE relnamespace = source_oid
+       AND relkind = 'r'
+  ORDER BY oid
+  LOOP
+    RAISE DEBUG 'CREATE TABLE %.% (LIKE %.% INCLUDING ALL EXCLUDING INDEXES)', dest_schema, object, source_schema, object;
+    EXECUTE format('CREATE TABLE %I.%I (LIKE %I.%I INCLUDING ALL EXCLUDING INDEXES)', dest_schema, object, source_schema, object);
+
+    IF include_records THEN
+      EXECUTE format('INSERT INTO %I.%I SELECT * FROM %I.%I', dest_schema, object, source_schema, object);
+    END IF;
+  END LOOP;
+
+  -- Now build the primary key, unique and exclusion constraints, followed by
+  -- the remaining indexes.
+  FOR sql_ IN
+    SELECT statement
+      FROM (
+        SELECT 1 AS stage, c.oid AS relid, r.oid AS objid,
+               format('ALTER TABLE %I.%I ADD CONSTRAINT %I %s',
+                      dest_schema, c.relname, r.conname,
+                      replace(pg_catalog.pg_get_constraintdef(r.oid, true), source_qualifier, dest_qualifier)) AS statement
+          FROM pg_catalog.pg_constraint r
+    INNER JOIN pg_catalog.pg_class c ON (c.oid = r.conrelid)
+         WHERE c.relnamespace = source_oid
+           AND c.relkind = 'r'
+           AND r.contype IN ('p', 'u', 'x')
+     UNION ALL
+        SELECT 2, c.oid, i.indexrelid,
+               replace(pg_catalog.pg_get_indexdef(i.indexrelid), source_qualifier, dest_qualifier)
+          FROM pg_catalog.pg_index i
+    INNER JOIN pg_catalog.pg_class c ON (c.oid = i.indrelid)
+         WHERE c.relnamespace = source_oid
+           AND c.relkind = 'r'
+           AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_constraint WHERE conindid = i.indexrelid AND conrelid = c.oid)
+      ) indexes
+  ORDER BY stage, relid, objid
+  LOOP
+    RAISE DEBUG '%', sql_;
+    EXECUTE sql_;
+  END LOOP;
+
+  -- Ensure any default values that refer to the old schema now refer to the new schema.
+  FOR sql_ IN
+    SELECT format('ALTER TABLE %I.%I ALTER COLUMN %I SET DEFAULT %s',
+                  dest_schema, c.relname, a.attname,
+                  replace(pg_catalog.pg_get_expr(d.adbin, d.adrelid), source_qualifier, dest_qualifier))
+      FROM pg_catalog.pg_class c
+INNER JOIN pg_catalog.pg_attrdef d ON (d.adrelid = c.oid)
+INNER JOIN pg_catalog.pg_attribute a ON (a.attrelid = d.adrelid AND a.attnum = d.adnum)
+     WHERE c.relnamespace = dest_oid
+       AND c.relkind = 'r'
+       AND strpos(pg_catalog.pg_get_expr(d.adbin, d.adrelid), source_qualifier) > 0
+  LOOP
+    RAISE DEBUG '%', sql_;
+    EXECUTE sql_;
+  END LOOP;
+
+  -- Ensure any triggers also come across, referring to the new schema.
+  FOR sql_ IN
+    SELECT replace(pg_catalog.pg_get_triggerdef(t.oid, false), source_qualifier, dest_qualifier)
+      FROM pg_catalog.pg_trigger t
+INNER JOIN pg_catalog.pg_class c ON (c.oid = t.tgrelid)
+     WHERE c.relnamespace = source_oid
+       AND c.relkind = 'r'
+       AND NOT t.tgisinternal
+  LOOP
+    RAISE DEBUG '%', sql_;
+    EXECUTE sql_;
+  END LOOP;
+
+  -- Change the ownership of any sequences (to the column they belong to).
+  -- This enables the use of pg_get_serial_sequence, for instance, to get the
+  -- name of a the sequence by table column.
+  -- Does not support sequences in use by multiple columns.
+  FOR sql_ IN
+    SELECT format('ALTER SEQUENCE %I.%I OWNED BY %I.%I.%I',
+                  dest_schema, s.relname, dest_schema, MIN(c.relname), MIN(a.attname))
+      FROM pg_catalog.pg_class s
+INNER JOIN pg_catalog.pg_depend dep ON (dep.refclassid = 'pg_catalog.pg_class'::regclass
+                                    AND dep.refobjid = s.oid
+                                    AND dep.classid = 'pg_catalog.pg_attrdef'::regclass)
+INNER JOIN pg_catalog.pg_attrdef d ON (d.oid = dep.objid)
+INNER JOIN pg_catalog.pg_class c ON (c.oid = d.adrelid)
+INNER JOIN pg_catalog.pg_attribute a ON (a.attrelid = d.adrelid AND a.attnum = d.adnum)
+     WHERE s.relnamespace = dest_oid
+       AND s.relkind = 'S'
+       AND c.relnamespace = dest_oid
+  GROUP BY s.relname
+    HAVING COUNT(*) = 1
+  LOOP
+    EXECUTE sql_;
+  END LOOP;
+
+  -- Copy across any foreign key constraints. This happens after creating
+  -- all of the tables.
+  FOR sql_ IN
+    SELECT format('ALTER TABLE %I.%I ADD CONSTRAINT %I %s',
+                  dest_schema, c.relname, r.conname,
+                  replace(pg_catalog.pg_get_constraintdef(r.oid, true), source_qualifier, dest_qualifier))
+      FROM pg_catalog.pg_constraint r
+INNER JOIN pg_catalog.pg_class c ON (c.oid = r.conrelid)
+     WHERE c.relnamespace = source_oid
+       AND r.contype = 'f'
+  LOOP
+    RAISE DEBUG '%', sql_;
+    EXECUTE sql_;
+  END LOOP;
+
+  -- Create views (in the order they were created, as they may refer to one another).
+  FOR sql_ IN
+    SELECT format('CREATE VIEW %I.%I AS %s',
+                  dest_schema, relname,
+                  replace(pg_catalog.pg_get_viewdef(oid), source_qualifier, dest_qualifier))
+      FROM pg_catalog.pg_class
+     WHERE relnamespace = source_oid
+       AND relkind = 'v'
+  ORDER BY oid
+  LOOP
+    RAISE DEBUG '%', sql_;
+    EXECUTE sql_;
+  END LOOP;
+
+  -- Create functions. This is in here for completeness, although I'm not sure
+  -- it's the best idea to have functions in the client schema. I guess you
+  -- could have that as a way of having different business logic per-schema,
+  -- but that seems like a tricky thing to manage.
+  FOR sql_ IN
+    SELECT replace(pg_catalog.pg_get_functiondef(p.oid), source_qualifier, dest_qualifier)
+      FROM pg_catalog.pg_proc p
+     WHERE p.pronamespace = source_oid
+       AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_aggregate WHERE aggfnoid = p.oid)
+  LOOP
+    EXECUTE sql_;
+  END LOOP;
+
+END;
+
+$$ LANGUAGE plpgsql VOLATILE;
+
+CREATE OR REPLACE FUNCTION clone_schema(source_schema text, dest_schema text)
+RETURNS void AS $$
+  SELECT clone_schema($1, $2, false);
+$$ LANGUAGE sql VOLATILE;
@@ -0,0 +1,20 @@
+CREATE OR REPLACE FUNCTION clone_schemata(
+  source_schema   text,
+  dest_schemata   text[],
+  include_records boolean
+) RETURNS void AS $$
+
+-- Clone source_schema into each of dest_schemata, in a single call (and
+-- transaction), rather than making a round trip for each new schema.
+
+DECLARE
+  dest_schema text;
+
+BEGIN
+  FOREACH dest_schema IN ARRAY dest_schemata
+  LOOP
+    PERFORM clone_schema(source_schema, dest_schema, include_records);
+  END LOOP;
+END;
+
+$$ LANGUAGE plpgsql VOLATILE;
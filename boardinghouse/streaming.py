@@ -0,0 +1,91 @@
+"""
+Streaming the objects from each of a number of schemata, without holding
+them all in memory.
+
+Exporting every schema's records (to build a search index, for instance)
+by activating each schema in turn, and iterating over a queryset, loads all
+of that schema's objects into memory at once. :func:`iterate_across_schemata`
+instead declares a server-side cursor for the queryset in each schema, and
+fetches ``chunk_size`` rows at a time from it, so only one chunk is in memory
+however many objects each schema has, and however many schemata there are.
+
+Each schema is active (and each cursor is within a transaction) while it's
+objects are being yielded, so related objects may be fetched from them.
+Each object has it's ``_schema`` attribute set to the name of the schema it
+came from.
+
+The objects are built from the rows fetched from the cursor by column name
+(using ``raw()``), so querysets that use ``select_related()``,
+``prefetch_related()`` or ``extra()`` (which would be silently ignored, or
+overwrite the model's attributes) may not be streamed.
+"""
+from __future__ import unicode_literals
+
+import uuid
+
+from django.db import connections, transaction
+
+from .provisioning import READY
+from .schema import activate_schema, deactivate_schema, get_active_schema_name, get_schema_model
+
+
+def _iterate_cursor(queryset, chunk_size):
+    """
+    Declare a cursor for queryset (which must be within a transaction), and
+    fetch it's objects chunk_size at a time.
+    """
+    connection = connections[queryset.db]
+    name = connection.ops.quote_name('stream_{0}'.format(uuid.uuid4().hex))
+    sql, params = queryset.query.sql_with_params()
+
+    cursor = connection.cursor()
+    cursor.execute('DECLARE {0} NO SCROLL CURSOR FOR {1}'.format(name, sql), params)
+    try:
+        while True:
+            count = 0
+            chunk = queryset.model._base_manager.raw(
+                'FETCH FORWARD {0:d} FROM {1}'.format(chunk_size, name), using=queryset.db
+            )
+            for obj in chunk:
+                count += 1
+                yield obj
+            if count < chunk_size:
+                return
+    finally:
+        cursor.execute('CLOSE {0}'.format(name))
+        cursor.close()
+
+
+def iterate_across_schemata(queryset_factory, schemata=None, chunk_size=2000):
+    """
+    Activate each of schemata (schema objects or names, or all active
+    schemata that are ready), and yield the objects from the queryset that
+    queryset_factory() returns, fetching chunk_size rows at a time.
+
+    The previously active schema (if any) is activated again once all of
+    the objects have been yielded.
+    """
+    if schemata is None:
+        schemata = get_schema_model().objects.active().filter(status=READY)
+
+    previous = get_active_schema_name()
+    try:
+        for schema in schemata:
+            schema_name = getattr(schema, 'schema', schema)
+            activate_schema(schema_name)
+            queryset = queryset_factory()
+            if getattr(queryset, '_fields', None) is not None:
+                raise ValueError('Only querysets of model instances may be streamed.')
+            # The objects are built from each row by column name, which
+            # can only be done for the columns of the model (and annotations).
+            if queryset.query.select_related or queryset.query.extra or queryset._prefetch_related_lookups:
+                raise ValueError('Querysets using select_related(), prefetch_related() or extra() may not be streamed.')
+            with transaction.atomic(using=queryset.db):
+                for obj in _iterate_cursor(queryset, chunk_size):
+                    obj._schema = schema_name
+                    yield obj
+    finally:
+        if previous:
+            activate_schema(previous)
+        else:
+            deactivate_schema()
@@ -25,6 +25,9 @@ DATABASES = {
 }
 
 ROOT_URLCONF = 'tests.urls'
+
+# Don't leave timings from creating the test database lying around.
+BOARDINGHOUSE_FANOUT_TIMING_SAMPLES = 0
 STATIC_URL = '/static/'
 
 MIDDLEWARE = (
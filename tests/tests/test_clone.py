@@ -0,0 +1,131 @@
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from boardinghouse.clone import clone_schema, create_schemata
+from boardinghouse.drift import describe
+from boardinghouse.schema import get_schema_model
+
+Schema = get_schema_model()
+
+INDEXES = "SELECT indexname, replace(indexdef, schemaname || '.', '') FROM pg_indexes WHERE schemaname = %s ORDER BY indexname"
+
+
+class TestCloneSchema(TestCase):
+    def test_within_transaction_uses_database_function(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO __template__.tests_awaremodel (name, status, factor) VALUES ('a', true, 1)")
+
+        clone_schema('__template__', 'copy', workers=4)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT name FROM copy.tests_awaremodel')
+            self.assertEqual([('a',)], cursor.fetchall())
+
+
+class TestParallelCloneSchema(TransactionTestCase):
+    available_apps = [
+        'boardinghouse',
+        'tests',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.contenttypes',
+    ]
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO __template__.tests_awaremodel (name, status, factor) "
+                "SELECT 'r' || n, true, n FROM generate_series(1, 100) n"
+            )
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM __template__.tests_awaremodel')
+            for schema in ['serial', 'parallel']:
+                cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(schema))
+
+    def test_matches_database_function(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT clone_schema('__template__', 'serial', true)")
+        clone_schema('__template__', 'parallel', workers=3)
+
+        items = describe(['serial', 'parallel'])
+        self.assertEqual(set(items['serial']), set(items['parallel']))
+
+        with connection.cursor() as cursor:
+            cursor.execute(INDEXES, ['serial'])
+            indexes = cursor.fetchall()
+            cursor.execute(INDEXES, ['parallel'])
+            self.assertEqual(indexes, cursor.fetchall())
+
+            cursor.execute('SELECT name, factor FROM parallel.tests_awaremodel ORDER BY id')
+            records = cursor.fetchall()
+            cursor.execute('SELECT name, factor FROM serial.tests_awaremodel ORDER BY id')
+            self.assertEqual(cursor.fetchall(), records)
+            self.assertEqual(100, len(records))
+
+            cursor.execute("SELECT nextval('parallel.tests_awaremodel_id_seq'), nextval('serial.tests_awaremodel_id_seq')")
+            parallel, serial = cursor.fetchone()
+            self.assertEqual(serial, parallel)
+
+    def test_failure_drops_schema(self):
+        # The existing records do not satisfy this, but it will be checked
+        # when they are copied.
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE __template__.tests_awaremodel ADD CONSTRAINT small_factor CHECK (factor < 50) NOT VALID')
+
+        try:
+            with self.assertRaises(Exception):
+                clone_schema('__template__', 'parallel', workers=3)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('ALTER TABLE __template__.tests_awaremodel DROP CONSTRAINT small_factor')
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_namespace WHERE nspname = 'parallel'")
+            self.assertIsNone(cursor.fetchone())
+
+    @override_settings(BOARDINGHOUSE_CLONE_WORKERS=3)
+    def test_creating_cloned_schema(self):
+        schema = Schema(name='Parallel', schema='parallel')
+        schema._clone = '__template__'
+        schema.save()
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM parallel.tests_awaremodel')
+            self.assertEqual(100, cursor.fetchone()[0])
+
+
+class TestCreateSchemata(TransactionTestCase):
+    available_apps = TestParallelCloneSchema.available_apps
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for schema in ['a', 'b', 'c', 'd']:
+                cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(schema))
+
+    def test_parallel_chunks(self):
+        create_schemata('__template__', ['a', 'b', 'c', 'd'], workers=2)
+
+        items = describe(['__template__', 'a', 'b', 'c', 'd'])
+        for schema in ['a', 'b', 'c', 'd']:
+            self.assertEqual(set(items['__template__']), set(items[schema]))
+
+    def test_failure_drops_schemata(self):
+        # Names starting with pg_ are reserved, so only one chunk fails.
+        with self.assertRaises(Exception):
+            create_schemata('__template__', ['a', 'b', 'c', 'pg_reserved'], workers=2)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_namespace WHERE nspname IN ('a', 'b', 'c', 'pg_reserved')")
+            self.assertEqual([], cursor.fetchall())
+
+    @override_settings(BOARDINGHOUSE_CLONE_WORKERS=2)
+    def test_failure_deletes_schema_objects(self):
+        with self.assertRaises(Exception):
+            Schema.objects.mass_create('a', 'b', 'c', 'pg_reserved')
+
+        self.assertFalse(Schema.objects.exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_namespace WHERE nspname IN ('a', 'b', 'c', 'pg_reserved')")
+            self.assertEqual([], cursor.fetchall())
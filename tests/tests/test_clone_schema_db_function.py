@@ -1,6 +1,6 @@
 from django.test import TestCase
 from django.db.migrations.state import ProjectState
-from django.db import connection, migrations, transaction
+from django.db import IntegrityError, connection, migrations, transaction
 
 from boardinghouse.models import Schema
 
@@ -62,3 +62,37 @@ class TestCloneSchemaDBFunction(TestCase):
         with connection.cursor() as cursor:
             cursor.execute('SELECT "{0}".spam_and_eggs()'.format(schema.schema))
             self.assertTrue(cursor.fetchone()[0])
+
+    def test_cloned_sequences_belong_to_new_schema(self):
+        Schema.objects.create(name='a', schema='a')
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_get_serial_sequence('a.tests_awaremodel', 'id')")
+            self.assertEqual('a.tests_awaremodel_id_seq', cursor.fetchone()[0])
+            cursor.execute("SELECT pg_get_expr(adbin, adrelid) FROM pg_attrdef WHERE adrelid = 'a.tests_awaremodel'::regclass")
+            self.assertEqual("nextval('a.tests_awaremodel_id_seq'::regclass)", cursor.fetchone()[0])
+
+    def test_cloning_with_records_copies_sequence_values(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO __template__.tests_awaremodel (name, status, factor) VALUES ('a', true, 1), ('b', true, 2)")
+            cursor.execute("SELECT clone_schema('__template__', 'copy', true)")
+            cursor.execute('SELECT COUNT(*) FROM copy.tests_awaremodel')
+            self.assertEqual(2, cursor.fetchone()[0])
+            cursor.execute('SELECT MAX(id) FROM copy.tests_awaremodel')
+            last_id = cursor.fetchone()[0]
+            cursor.execute("SELECT nextval('copy.tests_awaremodel_id_seq')")
+            self.assertEqual(last_id + 1, cursor.fetchone()[0])
+
+    def test_cloned_indexes_keep_their_names(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO __template__.tests_awaremodel (name, status, factor) VALUES ('a', true, 1)")
+            cursor.execute("SELECT clone_schema('__template__', 'copy', true)")
+            query = "SELECT indexname, replace(indexdef, schemaname || '.', '') FROM pg_indexes WHERE schemaname = %s ORDER BY indexname"
+            cursor.execute(query, ['__template__'])
+            template_indexes = cursor.fetchall()
+            cursor.execute(query, ['copy'])
+            self.assertEqual(template_indexes, cursor.fetchall())
+
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    cursor.execute("INSERT INTO copy.tests_awaremodel (name, status, factor) VALUES ('a', true, 1)")
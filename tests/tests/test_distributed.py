@@ -0,0 +1,99 @@
+import threading
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from boardinghouse import distributed, lazy
+from boardinghouse.models import FanoutTask, MigrationStatement
+from boardinghouse.schema import activate_schema, deactivate_schema, get_schema_model
+
+from .test_lazy import add_column, has_column
+
+Schema = get_schema_model()
+
+
+@override_settings(BOARDINGHOUSE_DISTRIBUTED_FANOUT=True)
+class TestDistributedFanout(TestCase):
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+        activate_schema('a')
+        deactivate_schema()
+
+    def test_only_template_is_migrated(self):
+        add_column()
+        self.assertTrue(MigrationStatement.objects.exists())
+        self.assertTrue(has_column('__template__'))
+        self.assertFalse(has_column('a'))
+        self.assertFalse(has_column('b'))
+
+    def test_enqueue(self):
+        add_column()
+        run, count = distributed.enqueue()
+        self.assertEqual(3, count)
+        self.assertEqual(set(['a', 'b', 'c']), set(FanoutTask.objects.filter(run=run).values_list('schema', flat=True)))
+        # Schemata that are already waiting are not queued again.
+        self.assertEqual(0, distributed.enqueue()[1])
+
+    def test_process_batch(self):
+        add_column()
+        distributed.enqueue()
+        self.assertEqual([('a', None), ('b', None)], distributed.process_batch(2, 'test'))
+        self.assertTrue(has_column('a'))
+        self.assertTrue(has_column('b'))
+        self.assertFalse(has_column('c'))
+        self.assertEqual(['c'], list(FanoutTask.objects.filter(completed_at=None).values_list('schema', flat=True)))
+        self.assertEqual(['c'], list(lazy.lagging_schemata()))
+
+    def test_failures_are_recorded(self):
+        add_column()
+        distributed.enqueue()
+        connection.cursor().execute('ALTER TABLE b.tests_awaremodel ADD COLUMN lazy integer')
+        results = dict(distributed.work())
+        self.assertIsNone(results['a'])
+        self.assertIn('lazy', results['b'])
+        self.assertEqual(['b'], list(FanoutTask.objects.exclude(error='').values_list('schema', flat=True)))
+
+    def test_coordinate(self):
+        add_column()
+        self.assertEqual([], distributed.coordinate())
+        self.assertTrue(has_column('c'))
+        self.assertFalse(FanoutTask.objects.exists())
+
+    def test_only_one_coordinator(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            cursor = connection.cursor()
+            cursor.execute('SELECT pg_advisory_lock(%s)', [distributed.COORDINATOR_LOCK])
+            locked.set()
+            release.wait()
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [distributed.COORDINATOR_LOCK])
+            connection.close()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait()
+        try:
+            add_column()
+            self.assertIsNone(distributed.coordinate())
+            self.assertFalse(has_column('c'))
+        finally:
+            release.set()
+            thread.join()
+
+    def test_worker_command(self):
+        add_column()
+        distributed.enqueue()
+        output = StringIO()
+        call_command('boardinghouse_fanout_worker', once=True, stdout=output)
+        self.assertIn('Migrated c', output.getvalue())
+        self.assertTrue(has_column('c'))
+
+    def test_lagging_schema_is_migrated_when_activated(self):
+        add_column()
+        activate_schema('b')
+        deactivate_schema()
+        self.assertTrue(has_column('b'))
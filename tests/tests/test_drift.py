@@ -0,0 +1,178 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils.six import StringIO
+
+from boardinghouse.drift import describe, find_drift, fingerprints, plan_repair, repair
+from boardinghouse.schema import get_schema_model
+
+Schema = get_schema_model()
+
+
+class TestDrift(TestCase):
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b')
+
+    def test_new_schemata_have_not_drifted(self):
+        found = fingerprints()
+        self.assertEqual(found['__template__'], found['a'])
+        self.assertEqual(found['__template__'], found['b'])
+        self.assertEqual([], find_drift())
+
+    def test_schema_name_is_not_part_of_description(self):
+        items = describe(['__template__', 'a'])
+        self.assertEqual(set(items['__template__']), set(items['a']))
+        self.assertTrue([item for item in items['a'] if item.startswith('column tests_awaremodel.factor ')])
+
+    def test_extra_index(self):
+        connection.cursor().execute('CREATE INDEX tests_awaremodel_drift ON b.tests_awaremodel (factor)')
+        drifted = find_drift()
+        self.assertEqual(['b'], [drift.schema for drift in drifted])
+        self.assertEqual([], drifted[0].missing)
+        self.assertEqual(
+            ['index CREATE INDEX ON tests_awaremodel USING btree (factor)'],
+            drifted[0].extra
+        )
+
+    def test_missing_column(self):
+        connection.cursor().execute('ALTER TABLE a.tests_awaremodel DROP COLUMN status')
+        drift = find_drift()[0]
+        self.assertEqual('a', drift.schema)
+        self.assertEqual(['column tests_awaremodel.status boolean NOT NULL'], drift.missing)
+
+    def test_only_named_schemata_are_checked(self):
+        connection.cursor().execute('ALTER TABLE a.tests_awaremodel DROP COLUMN status')
+        self.assertEqual([], find_drift(['b']))
+
+    def test_unknown_schemata_are_not_checked(self):
+        cursor = connection.cursor()
+        cursor.execute('CREATE SCHEMA reporting')
+        cursor.execute('CREATE TABLE reporting.tests_awaremodel (id integer)')
+        self.assertEqual([], find_drift())
+        self.assertEqual({}, repair())
+        cursor.execute("SELECT column_name FROM information_schema.columns "
+                       "WHERE table_schema = 'reporting' AND table_name = 'tests_awaremodel'")
+        self.assertEqual([('id',)], cursor.fetchall())
+
+    def test_command(self):
+        output = StringIO()
+        call_command('boardinghouse_drift', stdout=output)
+        self.assertEqual('No schemata have drifted from __template__.\n', output.getvalue())
+
+        connection.cursor().execute('ALTER TABLE a.tests_awaremodel DROP COLUMN status')
+        output = StringIO()
+        call_command('boardinghouse_drift', stdout=output)
+        self.assertEqual(
+            'a:\n'
+            '  - column tests_awaremodel.status boolean NOT NULL\n'
+            '1 schemata have drifted from __template__.\n',
+            output.getvalue()
+        )
+
+
+class TestRepair(TestCase):
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b')
+
+    def execute(self, sql):
+        connection.cursor().execute(sql)
+
+    def test_plan_missing_column(self):
+        items = describe(['__template__'])['__template__']
+        expected = dict(items)
+        del items['column tests_awaremodel.status boolean NOT NULL']
+        self.assertEqual(
+            (['ALTER TABLE "tests_awaremodel" ADD COLUMN "status" boolean NOT NULL'], []),
+            plan_repair(expected, items)
+        )
+
+    def test_repair_columns(self):
+        self.execute('ALTER TABLE a.tests_awaremodel DROP COLUMN status')
+        self.execute('ALTER TABLE a.tests_awaremodel ALTER COLUMN factor TYPE integer')
+        self.execute('ALTER TABLE a.tests_awaremodel ALTER COLUMN name DROP NOT NULL')
+        results = repair()
+        self.assertEqual(['a'], list(results))
+        self.assertIsNone(results['a'].error)
+        self.assertEqual([], find_drift())
+
+    def test_repair_indexes_and_constraints(self):
+        self.execute('CREATE INDEX tests_awaremodel_drift ON b.tests_awaremodel (factor)')
+        self.execute('ALTER TABLE b.tests_awaremodel DROP CONSTRAINT tests_awaremodel_factor_check')
+        self.execute('ALTER TABLE a.tests_awaremodel ADD CONSTRAINT tests_awaremodel_other CHECK (factor < 100)')
+        repair()
+        self.assertEqual([], find_drift())
+
+    def test_repair_missing_table(self):
+        self.execute('DROP TABLE b.tests_modela CASCADE')
+        result = repair()['b']
+        self.assertEqual('CREATE TABLE "tests_modela" (LIKE "__template__"."tests_modela" INCLUDING ALL)',
+                         result.statements[0])
+        self.assertEqual([], find_drift())
+
+    def test_created_sequences_are_moved_past_existing_values(self):
+        for i in range(3):
+            self.execute('INSERT INTO a.tests_modela DEFAULT VALUES')
+        self.execute('DROP SEQUENCE a.tests_modela_id_seq CASCADE')
+        result = repair()['a']
+        self.assertEqual(
+            "SELECT setval('tests_modela_id_seq', COALESCE(MAX(\"id\"), 0) + 1, false) FROM \"tests_modela\"",
+            result.statements[-1]
+        )
+        self.execute('INSERT INTO a.tests_modela DEFAULT VALUES')
+        cursor = connection.cursor()
+        cursor.execute('SELECT MAX(id) FROM a.tests_modela')
+        self.assertEqual(4, cursor.fetchone()[0])
+        self.assertEqual([], find_drift())
+
+    def test_extra_columns_are_not_dropped(self):
+        self.execute('ALTER TABLE a.tests_awaremodel ADD COLUMN extra integer')
+        result = repair()['a']
+        self.assertEqual([], result.statements)
+        self.assertEqual(['column tests_awaremodel.extra integer'], result.unrepaired)
+        self.assertEqual(['a'], [drift.schema for drift in find_drift()])
+
+    def test_failures_are_reported(self):
+        self.execute("INSERT INTO a.tests_awaremodel (name, status, factor) VALUES ('x', true, 1)")
+        self.execute('ALTER TABLE a.tests_awaremodel DROP COLUMN status')
+        self.execute('ALTER TABLE b.tests_awaremodel DROP COLUMN status')
+        results = repair()
+        self.assertIn('status', results['a'].error)
+        self.assertIsNone(results['b'].error)
+        self.assertEqual(['a'], [drift.schema for drift in find_drift()])
+
+    def test_command(self):
+        self.execute('ALTER TABLE a.tests_awaremodel DROP COLUMN status')
+        output = StringIO()
+        call_command('boardinghouse_drift', repair=True, stdout=output)
+        self.assertEqual(
+            'a:\n'
+            '  ALTER TABLE "tests_awaremodel" ADD COLUMN "status" boolean NOT NULL\n',
+            output.getvalue()
+        )
+
+
+class TestParallelRepair(TransactionTestCase):
+    available_apps = [
+        'boardinghouse',
+        'tests',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.contenttypes',
+    ]
+
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for schema in Schema.objects.all():
+                cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(schema.schema))
+
+    def test_schemata_are_repaired_in_parallel(self):
+        with connection.cursor() as cursor:
+            for schema_name in ['a', 'b', 'c']:
+                cursor.execute('ALTER TABLE {0}.tests_awaremodel DROP COLUMN status'.format(schema_name))
+        self.assertEqual(3, len(find_drift()))
+        results = repair(workers=2)
+        self.assertEqual(['a', 'b', 'c'], sorted(results))
+        self.assertEqual([], find_drift())
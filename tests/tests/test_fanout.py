@@ -0,0 +1,331 @@
+import time
+
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
+from django.db import DatabaseError, connection, migrations
+from django.db.migrations.migration import Migration
+from django.db.migrations.state import ProjectState
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from boardinghouse.backends.postgres.schema import get_index_validity
+from boardinghouse.management.commands import migrate
+from boardinghouse.fanout import (
+    DEFERRED, LOCK_NOT_AVAILABLE, SUCCEEDED, FanoutReport, _activate, _digest, apply_to_schemata,
+    current_migration, migrating, parallel,
+)
+from boardinghouse.models import MigrationProgress
+from boardinghouse.schema import activate_schema, deactivate_schema, get_active_schema_name, get_schema_model
+from boardinghouse.signals import schema_aware_operation
+
+Schema = get_schema_model()
+
+
+def send_operation(function):
+    def code(apps, schema_editor):
+        schema_aware_operation.send(sender=None,
+                                    db_table='tests_awaremodel',
+                                    function=function,
+                                    args=['arg'])
+    return code
+
+
+def lock_timeout():
+    class LockNotAvailable(Exception):
+        pgcode = LOCK_NOT_AVAILABLE
+
+    error = DatabaseError('canceling statement due to lock timeout')
+    error.__cause__ = LockNotAvailable()
+    return error
+
+
+def current_timeouts():
+    cursor = connection.cursor()
+    cursor.execute("SELECT current_setting('lock_timeout'), current_setting('statement_timeout')")
+    return cursor.fetchone()
+
+
+class TestApplyToSchemata(TestCase):
+    def test_function_is_called_in_each_schema(self):
+        Schema.objects.mass_create('a', 'b')
+        function = Mock()
+        apply_to_schemata(Schema.objects.all(), function, args=['arg'])
+        self.assertEqual(2, function.call_count)
+
+    def test_progress_is_not_recorded_outside_migration(self):
+        Schema.objects.mass_create('a', 'b')
+        apply_to_schemata(Schema.objects.all(), Mock(), args=['arg'])
+        self.assertFalse(MigrationProgress.objects.exists())
+
+
+class TestResumableFanout(TransactionTestCase):
+    available_apps = [
+        'boardinghouse',
+        'tests',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.contenttypes',
+    ]
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for schema_name in ['a', 'b', 'c']:
+                cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(schema_name))
+
+    def apply(self, operations, atomic=False):
+        migration = Migration('0001_resume', 'tests')
+        migration.atomic = atomic
+        migration.operations = operations
+        # The progress is cleared once the schema editor exits within the
+        # migration, so leave that until afterwards.
+        with connection.schema_editor(atomic=atomic) as editor:
+            with migrating(migration):
+                migration.apply(ProjectState(), editor)
+
+    def test_completed_schemata_are_skipped(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+        MigrationProgress.objects.create(
+            migration='tests.0001_resume',
+            operation=0,
+            statement=_digest(['arg'], {}),
+            schema='b',
+            status=SUCCEEDED,
+        )
+        function = Mock()
+        self.apply([migrations.RunPython(send_operation(function))])
+        # a, c, __template__
+        self.assertEqual(3, function.call_count)
+
+    def test_progress_is_recorded_for_each_schema(self):
+        Schema.objects.mass_create('a')
+        self.apply([migrations.RunPython(send_operation(Mock()))])
+        self.assertEqual(
+            ['__template__', 'a'],
+            sorted(MigrationProgress.objects.filter(status=SUCCEEDED).values_list('schema', flat=True))
+        )
+
+    def test_progress_is_cleared_once_applied(self):
+        Schema.objects.mass_create('a')
+        migration = Migration('0001_resume', 'tests')
+        migration.atomic = False
+        migration.operations = [migrations.RunPython(send_operation(Mock()))]
+        with migrating(migration), connection.schema_editor(atomic=False) as editor:
+            migration.apply(ProjectState(), editor)
+            self.assertTrue(MigrationProgress.objects.exists())
+        self.assertFalse(MigrationProgress.objects.exists())
+
+    def test_progress_is_not_recorded_for_atomic_migrations(self):
+        Schema.objects.mass_create('a')
+        self.apply([migrations.RunPython(send_operation(Mock()))], atomic=True)
+        self.assertFalse(MigrationProgress.objects.exists())
+
+    def test_failed_schemata_are_retried(self):
+        Schema.objects.mass_create('a', 'b')
+        MigrationProgress.objects.create(
+            migration='tests.0001_resume',
+            operation=0,
+            statement=_digest(['arg'], {}),
+            schema='b',
+            status='failed',
+        )
+        function = Mock()
+        self.apply([migrations.RunPython(send_operation(function))])
+        self.assertEqual(3, function.call_count)
+
+
+class TestMigrationTracking(TestCase):
+    def test_operation_is_tracked(self):
+        seen = []
+
+        def code(apps, schema_editor):
+            seen.append(current_migration()[1:])
+
+        migration = Migration('0001_tracked', 'tests')
+        migration.operations = [migrations.RunPython(code, code), migrations.RunPython(code, code)]
+        with migrating(migration):
+            self.assertEqual((migration, DEFERRED, False), current_migration())
+            with connection.schema_editor() as editor:
+                migration.apply(ProjectState(), editor)
+        with migrating(migration, backwards=True), connection.schema_editor() as editor:
+            migration.unapply(ProjectState(), editor)
+
+        self.assertEqual([(0, False), (1, False), (1, True), (0, True)], seen)
+        self.assertIsNone(current_migration())
+        self.assertNotIn('database_forwards', vars(migration.operations[0]))
+
+    def test_migrate_command_tracks_migrations(self):
+        seen = []
+        command = migrate.Command()
+        command.verbosity = 0
+        migration = Migration('0001_tracked', 'tests')
+        command.migration_progress_callback('apply_start', migration)
+        seen.append(current_migration())
+        command.migration_progress_callback('apply_success', migration)
+        seen.append(current_migration())
+        self.assertEqual([(migration, DEFERRED, False), None], seen)
+
+
+@override_settings(BOARDINGHOUSE_FANOUT_LOCK_TIMEOUT='2s',
+                   BOARDINGHOUSE_FANOUT_STATEMENT_TIMEOUT='1min',
+                   BOARDINGHOUSE_FANOUT_RETRIES=2,
+                   BOARDINGHOUSE_FANOUT_RETRY_DELAY=0)
+class TestFanoutTimeouts(TestCase):
+    def test_timeouts_are_applied_in_each_schema(self):
+        Schema.objects.mass_create('a')
+        seen = []
+        apply_to_schemata(Schema.objects.all(), lambda: seen.append(current_timeouts()))
+        self.assertEqual([('2s', '1min')], seen)
+
+    def test_timeouts_are_restored(self):
+        Schema.objects.mass_create('a')
+        before = current_timeouts()
+        apply_to_schemata(Schema.objects.all(), Mock())
+        self.assertEqual(before, current_timeouts())
+
+    def test_lock_timeout_is_retried(self):
+        Schema.objects.mass_create('a')
+        function = Mock(side_effect=[lock_timeout(), lock_timeout(), None])
+        apply_to_schemata(Schema.objects.all(), function)
+        self.assertEqual(3, function.call_count)
+
+    def test_lock_timeout_raises_when_retries_exhausted(self):
+        Schema.objects.mass_create('a')
+        function = Mock(side_effect=lock_timeout())
+        with self.assertRaises(DatabaseError):
+            apply_to_schemata(Schema.objects.all(), function)
+        self.assertEqual(3, function.call_count)
+
+    def test_other_errors_are_not_retried(self):
+        Schema.objects.mass_create('a')
+        function = Mock(side_effect=DatabaseError('boom'))
+        with self.assertRaises(DatabaseError):
+            apply_to_schemata(Schema.objects.all(), function)
+        self.assertEqual(1, function.call_count)
+
+    def test_retries_are_reported(self):
+        Schema.objects.mass_create('a', 'b')
+        editor = Mock(fanout_report=FanoutReport())
+        function = Mock(side_effect=[lock_timeout(), None, None])
+        apply_to_schemata(Schema.objects.all(), function, schema_editor=editor)
+        self.assertEqual(
+            {'a': 1, 'b': 0},
+            {name: retries for name, waited, retries, duration in editor.fanout_report.most_blocked()}
+        )
+
+    @override_settings(BOARDINGHOUSE_FANOUT_RETRY_DELAY=0.05)
+    def test_lock_waits_are_reported(self):
+        Schema.objects.mass_create('a', 'b')
+        editor = Mock(fanout_report=FanoutReport())
+
+        def function():
+            if get_active_schema_name() == 'b' and not function.failed:
+                function.failed = True
+                time.sleep(0.05)
+                raise lock_timeout()
+            if get_active_schema_name() == 'a':
+                time.sleep(0.2)
+        function.failed = False
+
+        apply_to_schemata(Schema.objects.all(), function, schema_editor=editor)
+        report = editor.fanout_report
+        self.assertEqual(['b', 'a'], [name for name, waited, retries, duration in report.most_blocked()])
+        self.assertLessEqual(0.05, report.waits['b'])
+        self.assertEqual(0.0, report.waits['a'])
+        self.assertLess(report.durations['b'], report.durations['a'])
+
+
+class TestFanoutReport(TestCase):
+    def test_most_blocked_schemata_first(self):
+        report = FanoutReport()
+        report.add('a', 0.5)
+        report.add('b', 2.0, 3, 1.5)
+        report.add('a', 1.0)
+        report.add('c', 1.0, 1, 0.5)
+        report.add('d', 0.1)
+        self.assertEqual([('b', 1.5, 3, 2.0), ('c', 0.5, 1, 1.0), ('a', 0.0, 0, 1.5)], report.most_blocked(3))
+
+    def test_lock_waits_are_not_sampled(self):
+        report = FanoutReport()
+        report.statement = ('add_column', 'tests_awaremodel')
+        report.add('a', 2.0, 1, 1.5)
+        self.assertEqual([('a', 'add_column', 'tests_awaremodel', 0.5)], report.samples)
+
+
+def index_validity(schema_name, index_name):
+    _activate(schema_name)
+    try:
+        return get_index_validity(connection.cursor(), index_name)
+    finally:
+        deactivate_schema()
+
+
+@override_settings(BOARDINGHOUSE_CONCURRENT_INDEXES=True,
+                   BOARDINGHOUSE_CONCURRENT_INDEX_WORKERS=2)
+class TestConcurrentIndexes(TransactionTestCase):
+    available_apps = [
+        'boardinghouse',
+        'tests',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.contenttypes',
+    ]
+
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for schema in Schema.objects.all():
+                cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(schema.schema))
+            cursor.execute('DROP INDEX IF EXISTS __template__.tests_awaremodel_factor')
+
+    def create_index(self, unique=''):
+        with connection.schema_editor(atomic=False) as editor:
+            editor.execute('CREATE {0}INDEX "tests_awaremodel_factor" ON "tests_awaremodel" ("factor")'.format(unique))
+
+    def test_parallel_uses_a_connection_per_worker(self):
+        seen = []
+
+        def backend_pid():
+            cursor = connection.cursor()
+            cursor.execute('SELECT pg_backend_pid(), current_schema()')
+            seen.append(cursor.fetchone())
+
+        backend_pid()
+        main_pid = seen.pop()[0]
+
+        results = parallel(['a', 'b', 'c'], backend_pid, workers=2)
+        self.assertEqual([None, None, None], [exc for schema, duration, retries, waited, exc in results])
+        self.assertEqual(['a', 'b', 'c'], sorted(schema for pid, schema in seen))
+        self.assertNotIn(main_pid, [pid for pid, schema in seen])
+
+    def test_index_is_created_in_all_schemata(self):
+        self.create_index()
+        for schema_name in ['__template__', 'a', 'b', 'c']:
+            self.assertTrue(index_validity(schema_name, 'tests_awaremodel_factor'))
+
+    def test_invalid_index_is_replaced(self):
+        activate_schema('b')
+        connection.cursor().execute("INSERT INTO tests_awaremodel (name, status, factor) VALUES ('x', false, 1), ('y', false, 1)")
+        with self.assertRaises(DatabaseError):
+            connection.cursor().execute('CREATE UNIQUE INDEX CONCURRENTLY "tests_awaremodel_factor" ON "tests_awaremodel" ("factor")')
+        connection.cursor().execute("DELETE FROM tests_awaremodel WHERE name = 'y'")
+        deactivate_schema()
+        self.assertFalse(index_validity('b', 'tests_awaremodel_factor'))
+
+        self.create_index(unique='UNIQUE ')
+
+        self.assertTrue(index_validity('b', 'tests_awaremodel_factor'))
+
+    def test_failed_index_is_removed(self):
+        activate_schema('c')
+        connection.cursor().execute("INSERT INTO tests_awaremodel (name, status, factor) VALUES ('x', false, 1), ('y', false, 1)")
+        deactivate_schema()
+
+        with self.assertRaises(DatabaseError):
+            self.create_index(unique='UNIQUE ')
+
+        self.assertIsNone(index_validity('c', 'tests_awaremodel_factor'))
+        self.assertTrue(index_validity('a', 'tests_awaremodel_factor'))
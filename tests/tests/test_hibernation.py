@@ -0,0 +1,218 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from boardinghouse import hibernation, provisioning
+from boardinghouse.operations import RunPythonPerSchema
+from boardinghouse.schema import _get_search_path, _schema_exists, get_schema_model
+from boardinghouse.signals import schema_aware_operation
+
+from ..models import AwareModel, CoReferentialModelA, CoReferentialModelB
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+Schema = get_schema_model()
+
+
+def create_object(apps, schema_editor):
+    AwareModel.objects.create(name='migrated')
+
+
+class TestHibernation(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.settings = override_settings(BOARDINGHOUSE_HIBERNATION_PATH=self.path)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.path)
+
+    def test_hibernate_and_wake(self):
+        schema = Schema.objects.create(name='a', schema='a')
+        schema.activate()
+        AwareModel.objects.create(name='tab\there', status=True, factor=1)
+        last = AwareModel.objects.create(name='back\\slash', status=False, factor=2)
+        a = CoReferentialModelA.objects.create(name='a')
+        b = CoReferentialModelB.objects.create(name='b', other=a)
+        a.other = b
+        a.save()
+        schema.deactivate()
+
+        schema.delete()
+        # The foreign keys are checked when the test transaction would commit,
+        # which is too late to drop those tables.
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        hibernation.hibernate(schema)
+
+        self.assertFalse(_schema_exists('a'))
+        self.assertTrue(os.path.exists(hibernation.archive_path('a')))
+        self.assertEqual(hibernation.HIBERNATED, Schema.objects.get(schema='a').status)
+
+        schema = Schema.objects.get(schema='a')
+        schema.is_active = True
+        schema.save()
+
+        self.assertEqual(provisioning.READY, schema.status)
+        # The archive is only removed once the woken schema is committed.
+        self.assertTrue(os.path.exists(hibernation.archive_path('a')))
+
+        schema.activate()
+        self.assertEqual(
+            [('tab\there', True, 1), ('back\\slash', False, 2)],
+            list(AwareModel.objects.order_by('id').values_list('name', 'status', 'factor'))
+        )
+        self.assertEqual('b', CoReferentialModelA.objects.get().other.name)
+        self.assertEqual(last.pk + 1, AwareModel.objects.create(name='c', status=True, factor=3).pk)
+
+    def hibernate(self, schema_name):
+        schema = Schema.objects.create(name=schema_name, schema=schema_name)
+        schema.activate()
+        AwareModel.objects.create(name='x', status=True, factor=1)
+        schema.deactivate()
+        schema.delete()
+        hibernation.hibernate(schema)
+        return Schema.objects.get(schema=schema_name)
+
+    def wake(self, schema):
+        schema.is_active = True
+        schema.save()
+        schema.activate()
+
+    def test_applied_migrations_are_recorded(self):
+        self.hibernate('a')
+        with gzip.open(hibernation.archive_path('a'), 'rb') as fp:
+            header = fp.readline()
+        self.assertTrue(header.startswith(hibernation.MIGRATIONS))
+        self.assertIn(b'["boardinghouse", "0001_initial"]', header)
+
+    def test_new_columns_are_given_model_defaults(self):
+        schema = Schema.objects.create(name='a', schema='a')
+        schema.activate()
+        AwareModel.objects.create(name='x', status=True, factor=1)
+        schema.deactivate()
+        # The archive will not have factor, as if it was added since.
+        connection.cursor().execute('ALTER TABLE a.tests_awaremodel DROP COLUMN factor')
+        schema.delete()
+        hibernation.hibernate(schema)
+
+        self.wake(Schema.objects.get(schema='a'))
+        self.assertEqual([('x', 7)], list(AwareModel.objects.values_list('name', 'factor')))
+
+    def test_new_columns_without_defaults(self):
+        schema = self.hibernate('a')
+        connection.cursor().execute('ALTER TABLE __template__.tests_awaremodel ADD COLUMN extra integer NOT NULL')
+
+        schema.is_active = True
+        with self.assertRaises(ValueError) as context:
+            schema.save()
+        self.assertIn('tests_awaremodel.extra', str(context.exception))
+
+        schema = Schema.objects.get(schema='a')
+        self.assertFalse(schema.is_active)
+        self.assertEqual(hibernation.HIBERNATED, schema.status)
+        self.assertFalse(_schema_exists('a'))
+        self.assertTrue(os.path.exists(hibernation.archive_path('a')))
+
+    def test_data_migrations_are_run(self):
+        operation = RunPythonPerSchema(create_object)
+        schema = self.hibernate('a')
+        with patch('boardinghouse.hibernation.data_migrations', return_value=[('tests.0002_data', 0)]), \
+                patch('boardinghouse.lazy._load_operation', return_value=(operation, None)):
+            self.wake(schema)
+        self.assertEqual(['migrated', 'x'], sorted(AwareModel.objects.values_list('name', flat=True)))
+
+    def test_applied_since(self):
+        applied = [key for key in MigrationRecorder(connection).applied_migrations() if key[0] != 'tests']
+        self.assertEqual([('tests', '0001_initial')], hibernation.applied_since(applied))
+        self.assertEqual([], hibernation.data_migrations([('tests', '0001_initial')]))
+
+    def test_hibernated_schemata_are_not_migrated(self):
+        Schema.objects.mass_create('a', 'b')
+        schema = Schema.objects.get(schema='a')
+        schema.delete()
+        hibernation.hibernate(schema)
+
+        applied = []
+        schema_aware_operation.send(
+            sender=self,
+            db_table='tests_awaremodel',
+            function=lambda: applied.append(_get_search_path()),
+        )
+        self.assertEqual(['__template__', 'b'], sorted(applied))
+
+    def test_only_inactive_schemata(self):
+        schema = Schema.objects.create(name='a', schema='a')
+
+        with self.assertRaises(ValueError):
+            hibernation.hibernate(schema)
+
+    def test_schemata_activated_since_are_not_hibernated(self):
+        schema = Schema.objects.create(name='a', schema='a')
+        schema.delete()
+        Schema.objects.filter(pk=schema.pk).update(is_active=True)
+
+        with self.assertRaises(ValueError):
+            hibernation.hibernate(schema)
+        self.assertTrue(_schema_exists('a'))
+
+    def test_stale_archives_are_removed(self):
+        self.wake(self.hibernate('a'))
+        self.hibernate('b')
+        self.assertEqual(['a'], hibernation.remove_stale_archives())
+        self.assertFalse(os.path.exists(hibernation.archive_path('a')))
+        self.assertTrue(os.path.exists(hibernation.archive_path('b')))
+
+    def test_command(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+        Schema.objects.filter(schema__in=['a', 'b']).delete()
+
+        call_command('boardinghouse_hibernate', verbosity=0)
+        self.assertEqual(['a', 'b'], sorted(
+            Schema.objects.filter(status=hibernation.HIBERNATED).values_list('schema', flat=True)
+        ))
+
+        call_command('boardinghouse_hibernate', 'a', wake=True, verbosity=0)
+        self.assertTrue(_schema_exists('a'))
+        self.assertTrue(Schema.objects.get(schema='a').is_active)
+        self.assertFalse(_schema_exists('b'))
+
+
+class TestWakeCommitted(TransactionTestCase):
+    available_apps = [
+        'boardinghouse',
+        'tests',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.contenttypes',
+    ]
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.settings = override_settings(BOARDINGHOUSE_HIBERNATION_PATH=self.path)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.path)
+        with connection.cursor() as cursor:
+            cursor.execute('DROP SCHEMA IF EXISTS a CASCADE')
+
+    def test_archive_is_removed_once_committed(self):
+        schema = Schema.objects.create(name='a', schema='a')
+        schema.delete()
+        hibernation.hibernate(schema)
+        schema.is_active = True
+        schema.save()
+        self.assertTrue(_schema_exists('a'))
+        self.assertFalse(os.path.exists(hibernation.archive_path('a')))
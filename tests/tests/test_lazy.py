@@ -0,0 +1,98 @@
+import datetime
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from boardinghouse.models import MigrationStatement, SchemaMigrationState
+from boardinghouse.schema import activate_schema, deactivate_schema, get_schema_model
+
+Schema = get_schema_model()
+
+ADD_COLUMN = 'ALTER TABLE tests_awaremodel ADD COLUMN lazy integer DEFAULT %s'
+
+
+def has_column(schema_name):
+    cursor = connection.cursor()
+    cursor.execute('''SELECT 1
+                        FROM information_schema.columns
+                       WHERE table_schema = %s
+                         AND table_name = 'tests_awaremodel'
+                         AND column_name = 'lazy' ''', [schema_name])
+    return bool(cursor.fetchone())
+
+
+def add_column():
+    with connection.schema_editor() as editor:
+        editor.execute(ADD_COLUMN, [3])
+
+
+@override_settings(BOARDINGHOUSE_LAZY_MIGRATIONS=True)
+class TestLazyMigrations(TestCase):
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+        activate_schema('a')
+        deactivate_schema()
+
+    def test_statement_is_recorded(self):
+        add_column()
+        statement = MigrationStatement.objects.get()
+        self.assertEqual('tests_awaremodel', statement.db_table)
+        self.assertEqual(ADD_COLUMN % 3, statement.sql)
+
+    def test_only_recent_schemata_are_migrated(self):
+        add_column()
+        self.assertTrue(has_column('__template__'))
+        self.assertTrue(has_column('a'))
+        self.assertFalse(has_column('b'))
+        self.assertFalse(has_column('c'))
+
+    def test_inactive_schemata_are_not_migrated(self):
+        Schema.objects.filter(schema='a').update(is_active=False)
+        add_column()
+        self.assertFalse(has_column('a'))
+
+    def test_old_activations_are_not_migrated(self):
+        SchemaMigrationState.objects.filter(schema='a').update(
+            last_activated=timezone.now() - datetime.timedelta(days=30)
+        )
+        add_column()
+        self.assertFalse(has_column('a'))
+
+    def test_schema_is_migrated_when_activated(self):
+        add_column()
+        activate_schema('b')
+        deactivate_schema()
+        self.assertTrue(has_column('b'))
+        state = SchemaMigrationState.objects.get(schema='b')
+        self.assertEqual(MigrationStatement.objects.get().pk, state.statement_id)
+        self.assertIsNotNone(state.last_activated)
+
+    def test_lagging_schema_is_not_migrated_eagerly(self):
+        add_column()
+        activate_schema('b')
+        deactivate_schema()
+        SchemaMigrationState.objects.filter(schema='b').update(statement_id=0)
+        with connection.schema_editor() as editor:
+            editor.execute('ALTER TABLE tests_awaremodel ADD COLUMN other integer')
+        self.assertEqual(0, SchemaMigrationState.objects.get(schema='b').statement_id)
+
+    def test_catch_up_command(self):
+        add_column()
+        call_command('boardinghouse_catch_up', stdout=StringIO())
+        self.assertTrue(has_column('b'))
+        self.assertTrue(has_column('c'))
+        self.assertIsNone(SchemaMigrationState.objects.get(schema='c').last_activated)
+
+    def test_deleting_schema_removes_state(self):
+        add_column()
+        Schema.objects.filter(schema='c').delete(drop=True)
+        self.assertFalse(SchemaMigrationState.objects.filter(schema='c').exists())
+
+    @override_settings(BOARDINGHOUSE_LAZY_MIGRATIONS=False)
+    def test_disabled(self):
+        add_column()
+        self.assertFalse(MigrationStatement.objects.exists())
+        self.assertTrue(has_column('c'))
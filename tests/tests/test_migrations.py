@@ -13,8 +13,9 @@ from django.utils import six
 
 from boardinghouse.schema import get_schema_model, get_template_schema
 from boardinghouse.schema import activate_template_schema, deactivate_schema
-from boardinghouse.backends.postgres.schema import get_constraints
+from boardinghouse.backends.postgres.schema import get_constraint_snapshot, get_constraints
 from boardinghouse.operations import AddField
+from boardinghouse.signals import schema_aware_operation
 
 Schema = get_schema_model()
 template_schema = get_template_schema()
@@ -557,6 +558,102 @@ class TestMigrations(MigrationTestBase):
             self.assertEqual(1, len(editor._constraint_names(SelfReferentialModel, foreign_key=True)))
 
 
+class TestConstraintSnapshot(TestCase):
+    def test_snapshot_matches_get_constraints(self):
+        with connection.cursor() as cursor:
+            snapshot = get_constraint_snapshot(cursor)
+            for table in ['tests_awaremodel', 'tests_naivemodel']:
+                self.assertEqual(get_constraints(cursor, table), snapshot[table])
+
+    def test_snapshot_for_one_table(self):
+        with connection.cursor() as cursor:
+            snapshot = get_constraint_snapshot(cursor, table_name='tests_awaremodel')
+        self.assertEqual(['tests_awaremodel'], list(snapshot))
+
+    def test_constraint_names_use_one_query(self):
+        from ..models import AwareModel, NaiveModel
+
+        with connection.schema_editor() as editor:
+            with self.assertNumQueries(1):
+                editor._constraint_names(AwareModel, primary_key=True)
+                editor._constraint_names(NaiveModel, primary_key=True)
+                editor._constraint_names(AwareModel, check=True)
+
+    def test_snapshot_is_invalidated_by_ddl(self):
+        from ..models import AwareModel, NaiveModel
+
+        with connection.schema_editor() as editor:
+            self.assertEqual(['tests_awaremodel_factor_check'], editor._constraint_names(AwareModel, check=True))
+            editor.execute('ALTER TABLE tests_awaremodel ADD CONSTRAINT tests_awaremodel_name_check CHECK (name <> %s)', ['x'])
+            six.assertCountEqual(self, [
+                'tests_awaremodel_factor_check',
+                'tests_awaremodel_name_check',
+            ], editor._constraint_names(AwareModel, check=True))
+            self.assertIn('tests_naivemodel', editor._constraint_snapshot)
+            editor.execute('ALTER TABLE tests_awaremodel RENAME CONSTRAINT tests_awaremodel_name_check TO tests_awaremodel_name_check2')
+            self.assertIsNone(editor._constraint_snapshot)
+            self.assertEqual(['tests_naivemodel_pkey'], editor._constraint_names(NaiveModel, primary_key=True))
+
+
+class TestDeferredSQL(TestCase):
+    def indexes(self, schema_name):
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = %s AND indexname LIKE 'tests_awaremodel_deferred%%'",
+            [schema_name]
+        )
+        return sorted(row[0] for row in cursor.fetchall())
+
+    def execute_deferred(self, statements):
+        sent = []
+
+        def receiver(sender, db_table, function, **kwargs):
+            sent.append(kwargs['args'][0])
+
+        schema_aware_operation.connect(receiver)
+        try:
+            with connection.schema_editor() as editor:
+                editor.deferred_sql.extend(statements)
+        finally:
+            schema_aware_operation.disconnect(receiver)
+        return sent
+
+    def test_private_statements_are_sent_once_per_schema(self):
+        Schema.objects.mass_create('a', 'b')
+        sent = self.execute_deferred([
+            'CREATE INDEX tests_awaremodel_deferred_a ON tests_awaremodel (factor)',
+            'CREATE INDEX tests_awaremodel_deferred_b ON tests_awaremodel (status)',
+            'CREATE INDEX tests_awaremodel_deferred_a ON tests_awaremodel (factor)',
+        ])
+
+        self.assertEqual([
+            'CREATE INDEX tests_awaremodel_deferred_a ON tests_awaremodel (factor);\n'
+            'CREATE INDEX tests_awaremodel_deferred_b ON tests_awaremodel (status)'
+        ], sent)
+        for schema_name in ['__template__', 'a', 'b']:
+            self.assertEqual(
+                ['tests_awaremodel_deferred_a', 'tests_awaremodel_deferred_b'],
+                self.indexes(schema_name)
+            )
+
+    def test_statements_are_grouped_by_table(self):
+        sent = self.execute_deferred([
+            'CREATE INDEX tests_awaremodel_deferred_a ON tests_awaremodel (factor)',
+            'CREATE INDEX tests_modela_deferred ON tests_modela (id)',
+            'CREATE INDEX tests_awaremodel_deferred_b ON tests_awaremodel (status)',
+        ])
+        self.assertEqual([
+            'CREATE INDEX tests_awaremodel_deferred_a ON tests_awaremodel (factor);\n'
+            'CREATE INDEX tests_awaremodel_deferred_b ON tests_awaremodel (status);\n'
+            'CREATE INDEX tests_modela_deferred ON tests_modela (id)'
+        ], sent)
+
+    def test_duplicates_are_removed_in_order(self):
+        with connection.schema_editor(collect_sql=True) as editor:
+            editor.deferred_sql.extend(['SELECT 1', 'SELECT 2', 'SELECT 1', 'SELECT 3', 'SELECT 2'])
+        self.assertEqual(['SELECT 1;', 'SELECT 2;', 'SELECT 3;'], editor.collected_sql)
+
+
 class TestBoardinghouseMigrations(TestCase):
     def test_0002_patch_admin_reverse(self):
         Schema.objects.mass_create('a', 'b', 'c')
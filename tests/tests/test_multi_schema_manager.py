@@ -1,7 +1,16 @@
-from django.test import TestCase
+import pickle
 
+from django.db import connection
+from django.db.utils import NotSupportedError
+from django.db.models import Avg, Count, F, Max, Sum
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from boardinghouse.base import MultiSchemaQuerySet
+from boardinghouse.clone import create_schemata
+from boardinghouse.gather import _get_keys, _get_ordering, _prepare, gather
 from boardinghouse.schema import get_schema_model
-from ..models import AwareModel
+from ..models import AwareModel, CoReferentialModelA, CoReferentialModelB
 
 Schema = get_schema_model()
 
@@ -46,3 +55,231 @@ class TestMultiSchemaManager(TestCase):
         self.assertEqual(objects[0], objects[0])
         self.assertNotEqual(objects[0]._schema, None)
         self.assertNotEqual(objects[0]._schema, objects[1]._schema, 'MultiSchemaManager should tag _schema attribute on models.')
+
+
+class TestMultiSchemaQuerySet(TestCase):
+    def setUp(self):
+        self.a, self.b = Schema.objects.mass_create('a', 'b')
+        for schema, factors in [(self.a, [1, 4, 5]), (self.b, [2, 3, 6])]:
+            schema.activate()
+            for factor in factors:
+                AwareModel.objects.create(name='{0}{1}'.format(schema.schema, factor), factor=factor)
+        self.b.deactivate()
+
+    def test_returns_instances_with_schema(self):
+        objects = AwareModel.objects.from_schemata(self.a, self.b).filter(factor__gt=1)
+
+        self.assertTrue(all(isinstance(obj, AwareModel) for obj in objects))
+        self.assertEqual(
+            set([('a', 'a4'), ('a', 'a5'), ('b', 'b2'), ('b', 'b3'), ('b', 'b6')]),
+            set((obj._schema, obj.name) for obj in objects)
+        )
+        self.assertEqual(5, objects.count())
+
+    def test_ordering_and_limits(self):
+        objects = AwareModel.objects.from_schemata(self.a, self.b).order_by('-factor')
+        self.assertEqual([6, 5, 4, 3, 2, 1], [obj.factor for obj in objects])
+        self.assertEqual([5, 4, 3], [obj.factor for obj in objects[1:4]])
+        self.assertEqual(['b6', 'a5'], list(objects.values_list('name', flat=True)[:2]))
+
+    def test_parameters_and_expressions(self):
+        objects = AwareModel.objects.from_schemata(self.a, self.b).filter(
+            name__startswith='b', factor__lt=F('id') + 5,
+        ).order_by('factor')
+        self.assertEqual(['b2', 'b3', 'b6'], [obj.name for obj in objects])
+
+    def test_subqueries_are_qualified(self):
+        self.a.activate()
+        AwareModel.objects.filter(factor=5).update(status=True)
+        self.b.activate()
+        AwareModel.objects.filter(factor=2).update(status=True)
+        self.b.deactivate()
+
+        objects = AwareModel.objects.from_schemata(self.a, self.b).filter(
+            pk__in=AwareModel.objects.filter(status=True).values('pk')
+        ).order_by('name')
+        self.assertEqual(['a5', 'b2'], [obj.name for obj in objects])
+
+    def test_joins(self):
+        for schema in [self.a, self.b]:
+            schema.activate()
+            other = CoReferentialModelB.objects.create(name='other')
+            CoReferentialModelA.objects.create(name=schema.schema, other=other)
+        self.b.deactivate()
+
+        objects = MultiSchemaQuerySet(CoReferentialModelA).select_related('other').filter(
+            other__name='other'
+        ).from_schemata(Schema.objects.all()).order_by('name')
+        self.assertEqual([('a', 'other'), ('b', 'other')], [(obj.name, obj.other.name) for obj in objects])
+        self.assertEqual(['a', 'b'], [obj._schema for obj in objects])
+
+    def test_aggregates(self):
+        objects = AwareModel.objects.from_schemata(self.a, self.b)
+        self.assertEqual(
+            {'total': 21, 'largest': 6, 'count': 6},
+            objects.aggregate(total=Sum('factor'), largest=Max('factor'), count=Count('id'))
+        )
+        self.assertEqual({'total': 15}, objects.filter(factor__gt=3).aggregate(total=Sum('factor')))
+        self.assertEqual({'total': 11}, objects.order_by('-factor')[:2].aggregate(total=Sum('factor')))
+        self.assertEqual(
+            {'total': None},
+            AwareModel.objects.from_schemata(Schema.objects.none()).aggregate(total=Sum('factor'))
+        )
+        self.assertEqual(
+            {'average': 3.5, 'scaled': 42, 'count': 6},
+            objects.aggregate(average=Avg('factor'), scaled=Sum(F('factor') * 2), count=Count('*'))
+        )
+        self.assertEqual(
+            {'largest': 3},
+            objects.values('status').annotate(rows=Count('id')).aggregate(largest=Max('rows'))
+        )
+
+    def test_writing_is_not_supported(self):
+        objects = AwareModel.objects.from_schemata(self.a, self.b).filter(factor=1)
+        self.a.activate()
+
+        for method, args in [
+            ('update', {'status': True}),
+            ('delete', {}),
+            ('create', {'name': 'new'}),
+            ('get_or_create', {'name': 'new'}),
+            ('update_or_create', {'name': 'new'}),
+        ]:
+            with self.assertRaises(NotSupportedError):
+                getattr(objects, method)(**args)
+        with self.assertRaises(NotSupportedError):
+            objects.bulk_create([AwareModel(name='new')])
+
+        self.assertEqual(3, AwareModel.objects.count())
+        self.assertFalse(AwareModel.objects.filter(status=True, factor=1).exists())
+        # Reading, chaining and pickling still work.
+        self.assertEqual(['a1'], [obj.name for obj in objects.all().order_by('name')])
+        self.assertEqual(['a1'], [obj.name for obj in pickle.loads(pickle.dumps(objects))])
+        self.assertEqual(3, AwareModel.objects.all().count())
+
+    def test_no_schemata(self):
+        self.assertEqual([], list(AwareModel.objects.from_schemata(Schema.objects.none())))
+
+
+class TestGather(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c = Schema.objects.mass_create('a', 'b', 'c')
+        for schema, factors in [(self.a, [1, 4, 5]), (self.b, [2, 3, 6]), (self.c, [])]:
+            schema.activate()
+            for factor in factors:
+                AwareModel.objects.create(name='{0}{1}'.format(schema.schema, factor), factor=factor)
+        self.b.deactivate()
+
+    def test_merges_ordered_results(self):
+        objects = list(AwareModel.objects.gather(Schema.objects.all(), workers=1))
+        self.assertEqual(6, len(objects))
+
+        objects = gather(AwareModel.objects.order_by('-factor'), ['a', 'b', 'c'])
+        self.assertEqual(
+            [('b', 6), ('a', 5), ('a', 4), ('b', 3), ('b', 2), ('a', 1)],
+            [(obj._schema, obj.factor) for obj in objects]
+        )
+        self.assertFalse(any(hasattr(obj, '_gather_order_0') for obj in objects))
+
+    def test_text_is_ordered_by_codepoint(self):
+        for schema, names in [(self.a, ['b', 'A']), (self.b, ['a', 'B', 'C'])]:
+            schema.activate()
+            for name in names:
+                AwareModel.objects.create(name=name)
+        self.b.deactivate()
+
+        queryset = AwareModel.objects.filter(name__in=['a', 'b', 'A', 'B', 'C']).order_by('name')
+        self.assertEqual(['A', 'B', 'C', 'a', 'b'], [obj.name for obj in gather(queryset, ['a', 'b'])])
+        self.assertEqual(['b', 'a', 'C', 'B', 'A'], [obj.name for obj in gather(queryset.reverse(), ['a', 'b'])])
+        self.assertIn('COLLATE "C"', str(_prepare(queryset, _get_keys(queryset, _get_ordering(queryset))).query))
+
+    def test_limit(self):
+        objects = gather(AwareModel.objects.order_by('factor'), ['a', 'b'], limit=4)
+        self.assertEqual(['a1', 'b2', 'b3', 'a4'], [obj.name for obj in objects])
+        self.assertEqual([], list(gather(AwareModel.objects.all(), ['a', 'b'], limit=0)))
+
+    def test_chunks(self):
+        objects = gather(AwareModel.objects.order_by('-factor'), ['a', 'b', 'c'], chunk_size=1)
+        self.assertEqual([6, 5, 4, 3, 2, 1], [obj.factor for obj in objects])
+
+        # Ties are broken by the primary key, so no rows are skipped.
+        objects = gather(AwareModel.objects.order_by('status'), ['a', 'b'], chunk_size=2)
+        self.assertEqual(['a1', 'a4', 'a5', 'b2', 'b3', 'b6'], sorted(obj.name for obj in objects))
+
+        objects = gather(AwareModel.objects.all(), ['a', 'b'], chunk_size=2)
+        self.assertEqual(['a1', 'a4', 'a5', 'b2', 'b3', 'b6'], [obj.name for obj in objects])
+
+    def test_chunks_with_nulls(self):
+        for schema in [self.a, self.b]:
+            schema.activate()
+            other = CoReferentialModelB.objects.create(name='other')
+            for name in ['x', 'y']:
+                CoReferentialModelA.objects.create(name=schema.schema + name)
+            CoReferentialModelA.objects.create(name=schema.schema + 'z', other=other)
+        self.b.deactivate()
+
+        queryset = CoReferentialModelA.objects.order_by('other', 'name')
+        self.assertEqual(
+            ['az', 'bz', 'ax', 'ay', 'bx', 'by'],
+            [obj.name for obj in gather(queryset, ['a', 'b'], chunk_size=1)]
+        )
+        self.assertEqual(
+            ['by', 'bx', 'ay', 'ax', 'bz', 'az'],
+            [obj.name for obj in gather(queryset.reverse(), ['a', 'b'], chunk_size=1)]
+        )
+
+    def test_rows_are_fetched_as_they_are_consumed(self):
+        objects = gather(AwareModel.objects.order_by('factor'), ['a', 'b', 'c'], chunk_size=1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual('a1', next(objects).name)
+        # The first chunk of each schema.
+        self.assertEqual(3, len([query for query in queries if 'tests_awaremodel' in query['sql']]))
+        objects.close()
+
+    def test_invalid_querysets(self):
+        with self.assertRaises(ValueError):
+            list(gather(AwareModel.objects.all()[:2], ['a']))
+        with self.assertRaises(ValueError):
+            list(gather(AwareModel.objects.order_by('?'), ['a']))
+        with self.assertRaises(ValueError):
+            list(gather(AwareModel.objects.values('name'), ['a']))
+
+
+class TestGatherConcurrently(TransactionTestCase):
+    available_apps = [
+        'boardinghouse',
+        'tests',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.contenttypes',
+    ]
+
+    def setUp(self):
+        create_schemata('__template__', list('abcde'))
+        with connection.cursor() as cursor:
+            for index, schema in enumerate('abcde'):
+                cursor.execute(
+                    'INSERT INTO {0}.tests_awaremodel (name, status, factor) '
+                    'VALUES (%s, false, %s), (%s, false, %s)'.format(schema),
+                    ['first', index, 'second', index + 10]
+                )
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for schema in 'abcde':
+                cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(schema))
+
+    def test_merges_ordered_results(self):
+        objects = list(gather(AwareModel.objects.order_by('factor'), 'abcde', workers=3))
+        self.assertEqual([0, 1, 2, 3, 4, 10, 11, 12, 13, 14], [obj.factor for obj in objects])
+        self.assertEqual(list('abcde') * 2, [obj._schema for obj in objects])
+
+        objects = list(gather(AwareModel.objects.order_by('-factor'), 'abcde', workers=3, chunk_size=1))
+        self.assertEqual([14, 13, 12, 11, 10, 4, 3, 2, 1, 0], [obj.factor for obj in objects])
+
+        objects = list(gather(AwareModel.objects.all(), 'abcde', workers=2, chunk_size=1))
+        self.assertEqual(sorted('abcde' * 2), [obj._schema for obj in objects])
+
+    def test_limit_stops_early(self):
+        objects = list(gather(AwareModel.objects.all(), 'abcde', limit=3, workers=2))
+        self.assertEqual(3, len(objects))
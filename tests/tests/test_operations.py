@@ -0,0 +1,155 @@
+from django.db import connection, migrations
+from django.db.migrations.migration import Migration
+from django.db.migrations.state import ProjectState
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from boardinghouse.fanout import migrating
+from boardinghouse.lazy import _load_operation
+from boardinghouse.models import MigrationStatement
+from boardinghouse.operations import RunPythonPerSchema
+from boardinghouse.schema import activate_schema, deactivate_schema, get_schema_model
+
+from ..models import AwareModel
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+Schema = get_schema_model()
+
+
+def create_object(apps, schema_editor):
+    AwareModel.objects.create(name='x')
+
+
+def delete_objects(apps, schema_editor):
+    AwareModel.objects.all().delete()
+
+
+def create_objects_in_chunks(apps, schema_editor):
+    for name in ['x', 'y', 'z']:
+        AwareModel.objects.create(name=name)
+        yield
+
+
+def names(schema_name):
+    cursor = connection.cursor()
+    cursor.execute('SELECT name FROM {0}.tests_awaremodel ORDER BY name'.format(schema_name))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def apply(operation, atomic=True):
+    migration = Migration('0001_per_schema', 'tests')
+    migration.atomic = atomic
+    migration.operations = [operation]
+    with migrating(migration), connection.schema_editor(atomic=atomic) as editor:
+        migration.apply(ProjectState(), editor)
+    return migration
+
+
+class TestRunPythonPerSchema(TestCase):
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b')
+
+    def test_code_is_run_in_every_schema(self):
+        apply(RunPythonPerSchema(create_object))
+        for schema_name in ['__template__', 'a', 'b']:
+            self.assertEqual(['x'], names(schema_name))
+
+    def test_progress(self):
+        seen = []
+        apply(RunPythonPerSchema(create_object, progress=lambda *args: seen.append(args)))
+        self.assertEqual([1, 2, 3], [count for schema_name, count in seen])
+        self.assertEqual(set(['__template__', 'a', 'b']), set(schema_name for schema_name, count in seen))
+
+    def test_generator(self):
+        apply(RunPythonPerSchema(create_objects_in_chunks))
+        self.assertEqual(['x', 'y', 'z'], names('a'))
+
+    def test_reverse(self):
+        migration = apply(RunPythonPerSchema(create_object, delete_objects))
+        with connection.schema_editor() as editor:
+            migration.unapply(ProjectState(), editor)
+        self.assertEqual([], names('b'))
+
+    def test_deconstruct(self):
+        name, args, kwargs = RunPythonPerSchema(create_object, workers=4).deconstruct()
+        self.assertEqual('RunPythonPerSchema', name)
+        self.assertEqual(4, kwargs['workers'])
+
+
+def create_lazy_object(apps, schema_editor):
+    # Fails unless the statement recorded before it has been applied.
+    AwareModel.objects.create(name='x')
+    connection.cursor().execute('UPDATE tests_awaremodel SET lazy = 7')
+
+
+@override_settings(BOARDINGHOUSE_LAZY_MIGRATIONS=True)
+class TestLazyRunPythonPerSchema(TestCase):
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b')
+        activate_schema('a')
+        deactivate_schema()
+
+    def test_code_is_replayed_in_order(self):
+        with connection.schema_editor() as editor:
+            editor.execute('ALTER TABLE tests_awaremodel ADD COLUMN lazy integer')
+        operation = RunPythonPerSchema(create_lazy_object)
+        apply(operation)
+
+        statement = MigrationStatement.objects.last()
+        self.assertEqual(('tests.0001_per_schema', 0, False),
+                         (statement.migration, statement.operation, statement.backwards))
+        self.assertEqual(['x'], names('a'))
+        self.assertEqual([], names('b'))
+
+        with patch('boardinghouse.lazy._load_operation', return_value=(operation, None)) as load:
+            activate_schema('b')
+            deactivate_schema()
+        load.assert_called_once_with('tests.0001_per_schema', 0)
+        cursor = connection.cursor()
+        cursor.execute('SELECT name, lazy FROM b.tests_awaremodel')
+        self.assertEqual([('x', 7)], cursor.fetchall())
+
+    def test_load_operation(self):
+        operation, apps = _load_operation('boardinghouse.0007_lazy_migrations', 1)
+        self.assertIsInstance(operation, migrations.CreateModel)
+        self.assertEqual('SchemaMigrationState', operation.name)
+        apps.get_model('boardinghouse', 'MigrationStatement')
+        with self.assertRaises(LookupError):
+            apps.get_model('boardinghouse', 'SchemaMigrationState')
+
+
+class TestParallelRunPythonPerSchema(TransactionTestCase):
+    available_apps = [
+        'boardinghouse',
+        'tests',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.contenttypes',
+    ]
+
+    def setUp(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            for schema in Schema.objects.all():
+                cursor.execute('DROP SCHEMA IF EXISTS {0} CASCADE'.format(schema.schema))
+            cursor.execute('DELETE FROM __template__.tests_awaremodel')
+
+    def test_schemata_are_migrated_in_parallel(self):
+        apply(RunPythonPerSchema(create_objects_in_chunks, workers=2), atomic=False)
+        for schema_name in ['__template__', 'a', 'b', 'c']:
+            self.assertEqual(['x', 'y', 'z'], names(schema_name))
+
+    def test_chunks_are_committed(self):
+        def fail_after_chunk(apps, schema_editor):
+            AwareModel.objects.create(name='x')
+            yield
+            raise ValueError('Oops')
+
+        with self.assertRaises(ValueError):
+            apply(RunPythonPerSchema(fail_after_chunk), atomic=False)
+        self.assertIn(['x'], [names(schema_name) for schema_name in ['__template__', 'a', 'b', 'c']])
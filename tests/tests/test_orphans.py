@@ -0,0 +1,119 @@
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from boardinghouse import reaper, spares
+from boardinghouse.contrib.template.models import SchemaTemplate
+from boardinghouse.orphans import find_orphans, find_unclaimed
+from boardinghouse.schema import _schema_exists, get_schema_model
+
+Schema = get_schema_model()
+
+
+def _relocatable_extension():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT DISTINCT name FROM pg_catalog.pg_available_extension_versions '
+            'WHERE relocatable AND NOT installed AND requires IS NULL ORDER BY name LIMIT 1'
+        )
+        row = cursor.fetchone()
+    return row and row[0]
+
+
+class TestOrphans(TestCase):
+    def test_no_orphans(self):
+        Schema.objects.mass_create('a', 'b')
+        SchemaTemplate.objects.create(name='Template')
+
+        self.assertEqual([], find_orphans())
+
+    @override_settings(BOARDINGHOUSE_SPARE_SCHEMATA=1)
+    def test_spares_and_tombstones_are_not_orphans(self):
+        spares.refill()
+        Schema.objects.create(name='a', schema='a')
+        reaper.condemn(['a'])
+
+        self.assertEqual([], find_orphans())
+
+    def test_orphans(self):
+        Schema.objects.mass_create('a', 'b')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT clone_schema('__template__', '__spare_lost')")
+            cursor.execute('INSERT INTO __spare_lost.tests_awaremodel (name, status, factor) VALUES (\'a\', true, 1)')
+            cursor.execute('CREATE SCHEMA __tmpl_empty')
+        Schema.objects.filter(schema='b').delete()
+
+        orphans = dict(find_orphans())
+        self.assertEqual(['__spare_lost', '__tmpl_empty'], sorted(orphans))
+        self.assertEqual(0, orphans['__tmpl_empty'])
+        self.assertLess(0, orphans['__spare_lost'])
+
+    def test_unclaimed_schemata_are_not_orphans(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA reporting')
+            cursor.execute('CREATE SCHEMA audit')
+
+        self.assertEqual([], find_orphans())
+        self.assertEqual(['audit', 'reporting'], [name for name, size in find_unclaimed()])
+        self.assertEqual(['audit'], [name for name, size in find_orphans(include=['audit'])])
+
+    def test_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA __spare_lost')
+            cursor.execute('CREATE SCHEMA reporting')
+
+        stdout = StringIO()
+        call_command('boardinghouse_orphans', stdout=stdout)
+        self.assertIn('__spare_lost\t', stdout.getvalue())
+        self.assertIn('reporting\t', stdout.getvalue())
+        self.assertIn('(unclaimed)', stdout.getvalue())
+        self.assertTrue(_schema_exists('__spare_lost'))
+
+        call_command('boardinghouse_orphans', reap=True, pause=0, stdout=StringIO())
+        self.assertFalse(_schema_exists('__spare_lost'))
+        self.assertTrue(_schema_exists('reporting'))
+        self.assertEqual([], reaper.tombstones())
+        self.assertEqual([], find_orphans())
+
+    def test_command_reaps_named_schemata(self):
+        Schema.objects.create(name='a', schema='a')
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA reporting')
+            cursor.execute('CREATE SCHEMA lost')
+
+        with self.assertRaises(CommandError):
+            call_command('boardinghouse_orphans', 'a', reap=True, pause=0, stdout=StringIO())
+        self.assertTrue(_schema_exists('a'))
+
+        call_command('boardinghouse_orphans', 'lost', reap=True, pause=0, stdout=StringIO())
+        self.assertFalse(_schema_exists('lost'))
+        self.assertTrue(_schema_exists('reporting'))
+
+    def test_foreign_schemata_are_not_orphans(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA "Audit"')
+            cursor.execute('CREATE SCHEMA _dba')
+            cursor.execute('CREATE SCHEMA __spare_lost')
+
+        self.assertEqual(['__spare_lost'], [name for name, size in find_orphans()])
+        self.assertEqual([], find_unclaimed())
+
+        call_command('boardinghouse_orphans', reap=True, pause=0, stdout=StringIO())
+        self.assertTrue(_schema_exists('Audit'))
+        self.assertTrue(_schema_exists('_dba'))
+        self.assertFalse(_schema_exists('__spare_lost'))
+
+    def test_extension_schemata_are_not_orphans(self):
+        extension = _relocatable_extension()
+        if not extension:
+            self.skipTest('No relocatable extension is available')
+
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA extensions')
+            cursor.execute('CREATE EXTENSION "{0}" SCHEMA extensions'.format(extension))
+
+        self.assertEqual([], find_orphans())
+
+        call_command('boardinghouse_orphans', reap=True, pause=0, stdout=StringIO())
+        self.assertTrue(_schema_exists('extensions'))
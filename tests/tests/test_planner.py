@@ -0,0 +1,149 @@
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.recorder import MigrationRecorder
+from django.test import TestCase, override_settings
+from django.utils.six import StringIO
+
+from boardinghouse.models import FanoutTiming
+from boardinghouse.planner import (
+    CATALOG, INDEX, REWRITE, SCAN, TimingModel, classify, fanout_schemata, fit, plan_fanout, record_timings,
+    relation_sizes,
+)
+from boardinghouse.schema import get_schema_model
+
+Schema = get_schema_model()
+
+
+class TestClassify(TestCase):
+    def test_rewrites(self):
+        self.assertEqual(REWRITE, classify('ALTER TABLE "a" ALTER COLUMN "b" TYPE bigint USING "b"::bigint'))
+        self.assertEqual(REWRITE, classify('ALTER TABLE "a" ADD COLUMN "b" integer DEFAULT 1 NOT NULL', 90600))
+        self.assertEqual(REWRITE, classify('UPDATE "a" SET "b" = 1'))
+
+    def test_default_does_not_rewrite_from_postgres_11(self):
+        self.assertEqual(CATALOG, classify('ALTER TABLE "a" ADD COLUMN "b" integer DEFAULT 1 NOT NULL', 110000))
+
+    def test_indexes(self):
+        self.assertEqual(INDEX, classify('CREATE INDEX "a_b" ON "a" ("b")'))
+        self.assertEqual(INDEX, classify('ALTER TABLE "a" ADD CONSTRAINT "a_b_uniq" UNIQUE ("b")'))
+
+    def test_scans(self):
+        self.assertEqual(SCAN, classify('ALTER TABLE "a" ALTER COLUMN "b" SET NOT NULL'))
+        self.assertEqual(SCAN, classify(
+            'ALTER TABLE "a" ADD CONSTRAINT "a_b_fk" FOREIGN KEY ("b") REFERENCES "c" ("id") DEFERRABLE INITIALLY DEFERRED'
+        ))
+        self.assertEqual(CATALOG, classify('ALTER TABLE "a" ADD CONSTRAINT "a_b_check" CHECK ("b" > 0) NOT VALID'))
+
+    def test_catalog(self):
+        self.assertEqual(CATALOG, classify('ALTER TABLE "a" DROP COLUMN "b" CASCADE'))
+        self.assertEqual(CATALOG, classify('ALTER TABLE "a" RENAME COLUMN "b" TO "c"'))
+
+
+@override_settings(BOARDINGHOUSE_FANOUT_TIMING_SAMPLES=100)
+class TestTimingModel(TestCase):
+    def test_fit(self):
+        intercept, slope = fit([(0, 1.0), (10, 2.0), (20, 3.0)])
+        self.assertAlmostEqual(1.0, intercept)
+        self.assertAlmostEqual(0.1, slope)
+
+    def test_fit_without_variance(self):
+        self.assertEqual((2.0, 0.0), fit([(5, 1.0), (5, 3.0)]))
+
+    def test_defaults_until_calibrated(self):
+        model = TimingModel.calibrate()
+        self.assertEqual(TimingModel().coefficients, model.coefficients)
+
+    def test_calibrated_from_timings(self):
+        FanoutTiming.objects.bulk_create([
+            FanoutTiming(kind=REWRITE, size=size, rows=0, duration=1.0 + size / 100.0)
+            for size in range(0, 1000, 100)
+        ])
+        model = TimingModel.calibrate()
+        self.assertAlmostEqual(11.0, model.predict(REWRITE, 1000))
+
+    def test_record_timings(self):
+        Schema.objects.mass_create('a')
+        record_timings([('a', SCAN, 'tests_awaremodel', 0.5)])
+        timing = FanoutTiming.objects.get()
+        self.assertEqual(SCAN, timing.kind)
+        self.assertEqual(0.5, timing.duration)
+
+    def test_timings_are_recorded_by_schema_editor(self):
+        Schema.objects.mass_create('a', 'b')
+        with connection.schema_editor() as editor:
+            editor.execute('ALTER TABLE "tests_awaremodel" ALTER COLUMN "factor" SET NOT NULL')
+        self.assertEqual([SCAN, SCAN, SCAN], list(FanoutTiming.objects.values_list('kind', flat=True)))
+
+    def test_deferred_scripts_are_timed_by_kind(self):
+        Schema.objects.mass_create('a')
+        with connection.schema_editor() as editor:
+            editor.deferred_sql.append('CREATE INDEX "tests_awaremodel_factor" ON "tests_awaremodel" ("factor")')
+            editor.deferred_sql.append('CREATE INDEX "tests_awaremodel_status" ON "tests_awaremodel" ("status")')
+        self.assertEqual([INDEX, INDEX], list(FanoutTiming.objects.values_list('kind', flat=True)))
+
+    def test_mixed_deferred_scripts_are_not_timed(self):
+        Schema.objects.mass_create('a')
+        with connection.schema_editor() as editor:
+            editor.deferred_sql.append('CREATE INDEX "tests_awaremodel_factor" ON "tests_awaremodel" ("factor")')
+            editor.deferred_sql.append('ALTER TABLE "tests_awaremodel" ALTER COLUMN "factor" SET NOT NULL')
+        self.assertFalse(FanoutTiming.objects.exists())
+        self.assertTrue(editor.fanout_report.durations)
+
+    @override_settings(BOARDINGHOUSE_FANOUT_TIMING_SAMPLES=2)
+    def test_old_timings_are_discarded(self):
+        record_timings([('a', SCAN, 'tests_awaremodel', duration) for duration in [1.0, 2.0, 3.0]])
+        self.assertEqual([2.0, 3.0], sorted(FanoutTiming.objects.values_list('duration', flat=True)))
+
+
+class TestPlanFanout(TestCase):
+    def test_relation_sizes(self):
+        Schema.objects.mass_create('a', 'b')
+        sizes = relation_sizes(['tests_awaremodel'])
+        self.assertEqual(set(['__template__', 'a', 'b']), set(sizes['tests_awaremodel']))
+
+    def test_only_known_schemata_are_sized(self):
+        Schema.objects.mass_create('a')
+        connection.cursor().execute('CREATE SCHEMA reporting; CREATE TABLE reporting.tests_awaremodel (id integer)')
+        self.assertEqual(['__template__', 'a'], fanout_schemata())
+        self.assertEqual(set(['__template__', 'a']), set(relation_sizes(['tests_awaremodel'])['tests_awaremodel']))
+
+    def test_new_tables_are_estimated_in_every_schema(self):
+        Schema.objects.mass_create('a', 'b')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE __template__.tests_awaremodel, a.tests_awaremodel, b.tests_awaremodel')
+        MigrationRecorder(connection).record_unapplied('tests', '0001_initial')
+
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan([('tests', '0001_initial')])
+        estimate = [
+            estimate for estimate in plan_fanout(executor, plan)
+            if estimate.sql.startswith('CREATE TABLE "tests_awaremodel"')
+        ][0]
+        self.assertEqual(3, estimate.schemata)
+        self.assertEqual(0, estimate.size)
+
+    def test_private_statements_are_collected_not_executed(self):
+        Schema.objects.mass_create('a')
+        with connection.schema_editor(collect_sql=True) as editor:
+            editor.fanout_plan = []
+            editor.execute('ALTER TABLE "tests_awaremodel" ALTER COLUMN "factor" TYPE bigint')
+        self.assertEqual(
+            [('tests_awaremodel', 'ALTER TABLE "tests_awaremodel" ALTER COLUMN "factor" TYPE bigint', None)],
+            editor.fanout_plan
+        )
+        self.assertEqual([], editor.collected_sql)
+
+    def test_command(self):
+        Schema.objects.mass_create('a')
+        output = StringIO()
+        call_command('boardinghouse_plan_fanout', 'tests', 'zero', stdout=output)
+        output = output.getvalue()
+        self.assertIn('tests.0001_initial (backwards)', output)
+        self.assertIn('[catalog] DROP TABLE "tests_awaremodel" CASCADE', output)
+        self.assertIn('Total: ', output)
+
+    def test_command_nothing_to_do(self):
+        output = StringIO()
+        call_command('boardinghouse_plan_fanout', stdout=output)
+        self.assertEqual('No migrations to apply.\n', output.getvalue())
@@ -0,0 +1,107 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from boardinghouse import provisioning
+from boardinghouse.exceptions import SchemaNotReady
+from boardinghouse.models import ProvisioningTask
+from boardinghouse.schema import _schema_exists, activate_schema, get_schema_model
+from boardinghouse.signals import schema_created
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+Schema = get_schema_model()
+
+
+@override_settings(BOARDINGHOUSE_ASYNC_PROVISIONING=True)
+class TestProvisioning(TestCase):
+    def test_creating_schema_queues_it(self):
+        schema = Schema.objects.create(name='a', schema='a')
+
+        self.assertEqual(provisioning.PROVISIONING, schema.status)
+        self.assertFalse(_schema_exists('a'))
+        self.assertEqual(['a'], list(ProvisioningTask.objects.values_list('schema', flat=True)))
+
+        with self.assertRaises(SchemaNotReady):
+            activate_schema('a')
+
+    def test_worker_provisions_schema(self):
+        created = []
+
+        def receiver(sender, schema, **kwargs):
+            created.append(schema)
+
+        schema_created.connect(receiver)
+        try:
+            Schema.objects.mass_create('a', 'b')
+            self.assertEqual([], created)
+            self.assertEqual([('a', None), ('b', None)], provisioning.work())
+        finally:
+            schema_created.disconnect(receiver)
+
+        self.assertEqual(['a', 'b'], created)
+        for schema in Schema.objects.all():
+            self.assertEqual(provisioning.READY, schema.status)
+            schema.activate()
+        self.assertFalse(ProvisioningTask.objects.filter(completed_at=None).exists())
+        self.assertEqual([], provisioning.work())
+
+    def test_deleted_schema_fails(self):
+        Schema.objects.create(name='a', schema='a')
+        Schema.objects.filter(schema='a').delete(drop=True)
+
+        (schema_name, error), = provisioning.work()
+        self.assertEqual('a', schema_name)
+        self.assertIn('no longer exists', error)
+        self.assertFalse(_schema_exists('a'))
+
+    def test_retry_failed(self):
+        Schema.objects.create(name='a', schema='a')
+        with patch('boardinghouse.clone.create_schema', side_effect=ValueError('Oops')):
+            self.assertEqual([('a', 'Oops')], provisioning.work())
+        self.assertEqual(provisioning.FAILED, Schema.objects.get(schema='a').status)
+
+        self.assertEqual([], provisioning.retry(['b']))
+        self.assertEqual(['a'], provisioning.retry())
+        self.assertEqual(provisioning.PROVISIONING, Schema.objects.get(schema='a').status)
+
+        self.assertEqual([('a', None)], provisioning.work())
+        self.assertEqual(provisioning.READY, Schema.objects.get(schema='a').status)
+        self.assertTrue(_schema_exists('a'))
+
+    def test_command_retries_failed(self):
+        Schema.objects.create(name='a', schema='a')
+        Schema.objects.filter(schema='a').update(status=provisioning.FAILED)
+        ProvisioningTask.objects.update(completed_at=timezone.now(), error='Oops')
+
+        output = StringIO()
+        call_command('boardinghouse_provision_schemata', retry_failed=True, once=True, stdout=output)
+        self.assertEqual('Queued 1 failed schemata again\nProvisioned a\n', output.getvalue())
+        self.assertEqual(provisioning.READY, Schema.objects.get(schema='a').status)
+
+    def test_middleware_responds_with_service_unavailable(self):
+        User.objects.create_superuser(username='su', password='su', email='su@example.com')
+        self.client.login(username='su', password='su')
+        Schema.objects.create(name='a', schema='a')
+
+        response = self.client.get('/', HTTP_X_CHANGE_SCHEMA='a')
+        self.assertEqual(503, response.status_code)
+        self.assertEqual('5', response['Retry-After'])
+
+        provisioning.work()
+        response = self.client.get('/')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'a', response.content)
+
+    @override_settings(BOARDINGHOUSE_ASYNC_PROVISIONING=False)
+    def test_disabled(self):
+        schema = Schema.objects.create(name='a', schema='a')
+
+        self.assertEqual(provisioning.READY, schema.status)
+        self.assertTrue(_schema_exists('a'))
+        self.assertFalse(ProvisioningTask.objects.exists())
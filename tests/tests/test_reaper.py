@@ -0,0 +1,83 @@
+import psycopg2
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from boardinghouse import reaper
+from boardinghouse.drift import find_drift
+from boardinghouse.schema import _schema_exists, get_schema_model
+
+Schema = get_schema_model()
+
+
+@override_settings(BOARDINGHOUSE_DEFER_SCHEMA_DROP=True)
+class TestReaper(TestCase):
+    def test_dropping_schemata_condemns_them(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+        Schema.objects.filter(schema__in=['a', 'b']).delete(drop=True)
+
+        self.assertFalse(_schema_exists('a'))
+        self.assertFalse(_schema_exists('b'))
+        tombstones = reaper.tombstones()
+        self.assertEqual(2, len(tombstones))
+        self.assertTrue(all(reaper.is_tombstone(tombstone) for tombstone in tombstones))
+
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE __template__.tests_awaremodel ADD COLUMN extra INTEGER')
+        self.assertEqual(['c'], [drift.schema for drift in find_drift()])
+
+        # The name may be used again straight away.
+        Schema.objects.create(name='a', schema='a')
+
+        self.assertEqual((2, 0), reaper.reap(batch_size=1, pause=0))
+        self.assertEqual([], reaper.tombstones())
+
+    def test_deleting_schema_object(self):
+        Schema.objects.create(name='a', schema='a')
+        Schema.objects.get(schema='a').delete(drop=True)
+
+        self.assertFalse(_schema_exists('a'))
+        self.assertEqual(1, len(reaper.tombstones()))
+
+    def test_command(self):
+        Schema.objects.mass_create('a', 'b', 'c')
+        Schema.objects.all().delete(drop=True)
+
+        call_command('boardinghouse_reap_schemata', batch_size=2, pause=0, limit=2, verbosity=0)
+        self.assertEqual(1, len(reaper.tombstones()))
+        call_command('boardinghouse_reap_schemata', pause=0, verbosity=0)
+        self.assertEqual([], reaper.tombstones())
+
+    @override_settings(BOARDINGHOUSE_DEFER_SCHEMA_DROP=False)
+    def test_disabled(self):
+        Schema.objects.create(name='a', schema='a')
+        Schema.objects.get(schema='a').delete(drop=True)
+
+        self.assertFalse(_schema_exists('a'))
+        self.assertEqual([], reaper.tombstones())
+
+
+class TestReaperLockTimeout(TransactionTestCase):
+    available_apps = [
+        'boardinghouse',
+        'tests',
+        'django.contrib.auth',
+        'django.contrib.admin',
+        'django.contrib.contenttypes',
+    ]
+
+    def test_locked_schema_is_skipped(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA condemned; CREATE TABLE condemned.foo (id INTEGER)')
+            tombstone, = reaper.condemn(['condemned'], cursor)
+
+        other = psycopg2.connect(**connection.get_connection_params())
+        try:
+            other.cursor().execute('LOCK TABLE {0}.foo'.format(connection.ops.quote_name(tombstone)))
+            self.assertEqual((0, 1), reaper.reap(lock_timeout='100ms'))
+        finally:
+            other.close()
+
+        self.assertEqual((1, 0), reaper.reap())
+        self.assertEqual([], reaper.tombstones())
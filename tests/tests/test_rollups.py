@@ -0,0 +1,137 @@
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.state import ProjectState
+from django.test import TestCase
+
+from boardinghouse import clone, provisioning, rollups
+from boardinghouse.contrib.template.models import SchemaTemplate
+from boardinghouse.models import Rollup
+from boardinghouse.operations import InstallRollup
+from boardinghouse.schema import _table_exists, get_schema_model
+
+from ..models import AwareModel
+
+Schema = get_schema_model()
+
+
+def totals():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT schema, status, count, factor FROM public.factors ORDER BY schema, status')
+        return [(schema, status, count, int(factor)) for schema, status, count, factor in cursor.fetchall()]
+
+
+class TestRollups(TestCase):
+    def setUp(self):
+        self.a, self.b = Schema.objects.mass_create('a', 'b')
+        self.a.activate()
+        AwareModel.objects.create(name='a1', factor=1)
+        AwareModel.objects.create(name='a2', factor=2, status=True)
+        self.a.deactivate()
+
+        self.operation = InstallRollup('factors', 'tests.AwareModel', group_by=['status'], sums=['factor'])
+        self.state = ProjectState.from_apps(apps)
+        with connection.schema_editor() as editor:
+            self.operation.database_forwards('tests', editor, self.state, self.state)
+
+    def test_install(self):
+        rollup = Rollup.objects.get()
+        self.assertEqual(
+            ('factors', 'tests_awaremodel', '', 'status', 'factor'),
+            (rollup.name, rollup.source, rollup.date_column, rollup.dimensions, rollup.measures)
+        )
+        self.assertEqual([], totals())
+        self.assertEqual([('factors', 2)], rollups.refresh())
+        self.assertEqual([('a', False, 1, 1), ('a', True, 1, 2)], totals())
+        self.assertNotEqual(None, Rollup.objects.get().refreshed_at)
+
+    def test_trigger_records_changes(self):
+        rollups.refresh()
+
+        self.a.activate()
+        AwareModel.objects.create(name='a3', factor=3)
+        AwareModel.objects.filter(name='a2').update(status=False)
+        AwareModel.objects.filter(name='a1').update(name='a0')
+        self.b.activate()
+        AwareModel.objects.create(name='b1', factor=4, status=True)
+        # A schema created after the rollup was installed.
+        Schema.objects.create(name='c', schema='c').activate()
+        AwareModel.objects.create(name='c1', factor=5)
+        AwareModel.objects.create(name='c2', factor=6)
+        AwareModel.objects.filter(name='c1').delete()
+        self.b.deactivate()
+
+        rollups.refresh()
+        self.assertEqual(
+            [('a', False, 3, 6), ('b', True, 1, 4), ('c', False, 1, 6)],
+            totals()
+        )
+
+    def test_deleted_schema_is_forgotten(self):
+        rollups.refresh()
+        self.b.activate()
+        AwareModel.objects.create(name='b1', factor=4)
+        self.b.deactivate()
+
+        Schema.objects.filter(schema__in=['a', 'b']).delete(drop=True)
+        rollups.refresh()
+        self.assertEqual([], totals())
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO b.tests_awaremodel (name, status, factor) VALUES ('b1', false, 9)")
+            cursor.execute("ALTER TABLE b.tests_awaremodel DISABLE TRIGGER USER")
+            cursor.execute("INSERT INTO b.tests_awaremodel (name, status, factor) VALUES ('b2', false, 10)")
+            cursor.execute("ALTER TABLE b.tests_awaremodel ENABLE TRIGGER USER")
+
+        rollups.rebuild(Rollup.objects.get())
+        self.assertEqual([('a', False, 1, 1), ('a', True, 1, 2), ('b', False, 2, 19)], totals())
+
+    def test_cloned_records_are_added(self):
+        rollups.refresh()
+        clone.create_schema('a', 'd', include_records=True)
+        rollups.refresh()
+        self.assertEqual(
+            [('a', False, 1, 1), ('a', True, 1, 2), ('d', False, 1, 1), ('d', True, 1, 2)],
+            totals()
+        )
+
+    def test_template_schemata_are_not_aggregated(self):
+        template = SchemaTemplate.objects.create(name='template')
+        template.activate()
+        AwareModel.objects.create(name='t1', factor=5)
+        template.deactivate()
+        rollups.refresh()
+        self.assertEqual([('a', False, 1, 1), ('a', True, 1, 2)], totals())
+
+        # A schema cloned from the template, with it's records.
+        schema = Schema(name='e', schema='e')
+        schema._clone = template.schema
+        schema.save()
+        rollups.refresh()
+        self.assertEqual([('a', False, 1, 1), ('a', True, 1, 2), ('e', False, 1, 5)], totals())
+
+        rollups.rebuild(Rollup.objects.get(), ['a', template.schema])
+        self.assertEqual([('a', False, 1, 1), ('a', True, 1, 2)], totals())
+
+    def test_rebuild_skips_failed_schemata(self):
+        Schema.objects.filter(schema='b').update(status=provisioning.FAILED)
+        with connection.cursor() as cursor:
+            cursor.execute('DROP SCHEMA b CASCADE')
+        rollups.rebuild(Rollup.objects.get())
+        self.assertEqual([('a', False, 1, 1), ('a', True, 1, 2)], totals())
+
+    def test_command(self):
+        call_command('boardinghouse_refresh_rollups', 'factors', verbosity=0)
+        self.assertEqual(2, len(totals()))
+        call_command('boardinghouse_refresh_rollups', rebuild=True, verbosity=0)
+        self.assertEqual(2, len(totals()))
+
+    def test_backwards(self):
+        with connection.schema_editor() as editor:
+            self.operation.database_backwards('tests', editor, self.state, self.state)
+
+        self.assertFalse(Rollup.objects.exists())
+        self.assertFalse(_table_exists('factors', 'public'))
+        self.a.activate()
+        AwareModel.objects.create(name='a3')
@@ -1,8 +1,14 @@
+try:
+    from unittest.mock import Mock
+except ImportError:
+    from mock import Mock
+
 from django.test import TestCase
 from django.db import connection
 from django import forms
 from django.utils import six
 
+from boardinghouse.signals import schema_created, schemata_created
 from boardinghouse.schema import (
     activate_schema, deactivate_schema,
     TemplateSchemaActivation,
@@ -81,6 +87,21 @@ class TestPostgresSchemaCreation(TestCase):
         cursor.execute('CREATE SCHEMA already_here')
         with self.assertRaises(ValueError):
             Schema.objects.mass_create('already_here')
+        self.assertFalse(Schema.objects.filter(schema='already_here').exists())
+
+    def test_bulk_create_sends_signals(self):
+        single = Mock()
+        bulk = Mock()
+        schema_created.connect(single)
+        schemata_created.connect(bulk)
+        try:
+            Schema.objects.mass_create('a', 'b', 'c')
+        finally:
+            schema_created.disconnect(single)
+            schemata_created.disconnect(bulk)
+
+        self.assertEqual(['a', 'b', 'c'], [call[1]['schema'] for call in single.call_args_list])
+        bulk.assert_called_once_with(signal=schemata_created, sender=Schema, schemata=['a', 'b', 'c'])
 
 
 class TestSchemaDrop(TestCase):
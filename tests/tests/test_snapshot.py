@@ -0,0 +1,121 @@
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+
+from boardinghouse import snapshot
+from boardinghouse.drift import describe, find_drift
+from boardinghouse.models import SchemaSnapshot
+from boardinghouse.schema import get_schema_model
+
+from ..models import ViewBackedModel
+
+Schema = get_schema_model()
+
+INDEXES = "SELECT indexname, replace(indexdef, schemaname || '.', '') FROM pg_indexes WHERE schemaname = %s ORDER BY indexname"
+
+
+class TestSchemaSnapshot(TestCase):
+    def test_matches_database_function(self):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE FUNCTION __template__.spam_and_eggs() RETURNS BOOLEAN AS 'SELECT true' LANGUAGE SQL")
+            cursor.execute("SELECT clone_schema('__template__', 'serial', false)")
+        snapshot.clone_schema('__template__', 'snapshot')
+
+        items = describe(['serial', 'snapshot'])
+        self.assertEqual(set(items['serial']), set(items['snapshot']))
+
+        with connection.cursor() as cursor:
+            cursor.execute(INDEXES, ['serial'])
+            indexes = cursor.fetchall()
+            cursor.execute(INDEXES, ['snapshot'])
+            self.assertEqual(indexes, cursor.fetchall())
+
+            cursor.execute("SELECT pg_get_serial_sequence('snapshot.tests_awaremodel', 'id')")
+            self.assertEqual('snapshot.tests_awaremodel_id_seq', cursor.fetchone()[0])
+            cursor.execute('SELECT snapshot.spam_and_eggs()')
+            self.assertTrue(cursor.fetchone()[0])
+
+    def test_only_qualified_identifiers_are_replaced(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA a')
+            cursor.execute('CREATE TABLE a.data (id integer)')
+            cursor.execute("CREATE VIEW a.notes AS SELECT id, 'ba.data'::text AS note FROM a.data")
+        structure, records, finish = snapshot.generate('a')
+        self.assertIn("'ba.data'", finish)
+        self.assertIn('FROM {0}.data'.format(snapshot.PLACEHOLDER), finish)
+
+        snapshot.clone_schema('a', 'b')
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO b.data VALUES (1)')
+            cursor.execute('SELECT id, note FROM b.notes')
+            self.assertEqual([(1, 'ba.data')], cursor.fetchall())
+
+    def test_search_path_is_restored_after_errors(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW search_path')
+            search_path = cursor.fetchone()[0]
+
+        def fail(cursor, namespace):
+            cursor.execute('SELECT 1 / 0')
+
+        with patch('boardinghouse.snapshot._tables', side_effect=fail):
+            with self.assertRaises(DatabaseError):
+                snapshot.generate('__template__')
+
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW search_path')
+            self.assertEqual(search_path, cursor.fetchone()[0])
+
+    def test_records(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO __template__.tests_awaremodel (name, status, factor) VALUES ('a', true, 1)")
+        snapshot.clone_schema('__template__', 'copy', include_records=True)
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id, name FROM copy.tests_awaremodel')
+            (last_id, name), = cursor.fetchall()
+            self.assertEqual('a', name)
+            cursor.execute("SELECT nextval('copy.tests_awaremodel_id_seq')")
+            self.assertEqual(last_id + 1, cursor.fetchone()[0])
+
+    @override_settings(BOARDINGHOUSE_SCHEMA_SNAPSHOTS=True)
+    def test_creating_schemata(self):
+        Schema.objects.mass_create('a', 'b')
+
+        self.assertEqual(1, SchemaSnapshot.objects.filter(source='__template__').count())
+        self.assertEqual([], find_drift())
+
+        Schema.objects.get(schema='a').activate()
+        self.assertEqual(1000, ViewBackedModel.objects.count())
+
+    @override_settings(BOARDINGHOUSE_SCHEMA_SNAPSHOTS=True)
+    def test_refresh_discards_stale_snapshots(self):
+        stale = snapshot.get_snapshot('__template__')
+        snapshot.refresh()
+        self.assertEqual([stale.pk], list(SchemaSnapshot.objects.values_list('pk', flat=True)))
+
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE __template__.tests_awaremodel ADD COLUMN extra INTEGER')
+        snapshot.refresh()
+        self.assertFalse(SchemaSnapshot.objects.filter(pk=stale.pk).exists())
+
+        Schema.objects.create(name='a', schema='a')
+        self.assertEqual([], find_drift())
+
+    @override_settings(BOARDINGHOUSE_SCHEMA_SNAPSHOTS=True)
+    def test_stale_snapshots_are_not_used(self):
+        stale = snapshot.get_snapshot('__template__')
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE __template__.tests_awaremodel ADD COLUMN extra INTEGER')
+
+        Schema.objects.create(name='a', schema='a')
+        self.assertEqual([], find_drift())
+        self.assertEqual(
+            [snapshot.get_snapshot('__template__').pk],
+            list(SchemaSnapshot.objects.values_list('pk', flat=True))
+        )
+        self.assertNotEqual(stale.pk, snapshot.get_snapshot('__template__').pk)
@@ -0,0 +1,63 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from boardinghouse import spares
+from boardinghouse.drift import find_drift
+from boardinghouse.models import SpareSchema
+from boardinghouse.schema import _schema_exists, get_schema_model
+
+Schema = get_schema_model()
+
+
+@override_settings(BOARDINGHOUSE_SPARE_SCHEMATA=2)
+class TestSpareSchemata(TestCase):
+    def test_refill(self):
+        self.assertEqual((2, 0), spares.refill())
+        self.assertEqual((0, 0), spares.refill())
+
+        for spare in SpareSchema.objects.all():
+            self.assertTrue(spares.is_spare(spare.schema))
+            self.assertTrue(_schema_exists(spare.schema))
+
+    def test_creating_schema_claims_spare(self):
+        spares.refill()
+        spare = SpareSchema.objects.order_by('id')[0]
+
+        Schema.objects.create(name='a', schema='a')
+
+        self.assertFalse(_schema_exists(spare.schema))
+        self.assertEqual(1, SpareSchema.objects.count())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_get_serial_sequence('a.tests_awaremodel', 'id')")
+            self.assertEqual('a.tests_awaremodel_id_seq', cursor.fetchone()[0])
+
+    def test_creating_schema_without_spares(self):
+        Schema.objects.create(name='a', schema='a')
+
+        self.assertTrue(_schema_exists('a'))
+
+    def test_migrated_template_discards_spares(self):
+        spares.refill()
+        stale = set(SpareSchema.objects.values_list('schema', flat=True))
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE __template__.tests_awaremodel ADD COLUMN extra INTEGER')
+
+        self.assertFalse(spares.claim('a'))
+        self.assertEqual((2, 2), spares.refill())
+        self.assertFalse(stale & set(SpareSchema.objects.values_list('schema', flat=True)))
+
+        Schema.objects.create(name='a', schema='a')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT extra FROM a.tests_awaremodel')
+
+    def test_drift_ignores_spares(self):
+        spares.refill()
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE __template__.tests_awaremodel ADD COLUMN extra INTEGER')
+
+        self.assertEqual([], find_drift())
+
+    def test_command(self):
+        call_command('boardinghouse_refill_spares', size=3, verbosity=0)
+        self.assertEqual(3, SpareSchema.objects.count())
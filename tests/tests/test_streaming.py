@@ -0,0 +1,71 @@
+from django.db import connection
+from django.test import TestCase
+
+from boardinghouse.schema import get_active_schema_name, get_schema_model
+from boardinghouse.streaming import iterate_across_schemata
+
+from ..models import AwareModel, CoReferentialModelA, CoReferentialModelB
+
+Schema = get_schema_model()
+
+
+class TestIterateAcrossSchemata(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c = Schema.objects.mass_create('a', 'b', 'c')
+        for schema, count in [(self.a, 5), (self.b, 0), (self.c, 3)]:
+            schema.activate()
+            for i in range(count):
+                AwareModel.objects.create(name='{0}{1}'.format(schema.schema, i), factor=i)
+        self.c.deactivate()
+
+    def test_streams_each_schema_in_chunks(self):
+        queries = []
+
+        def factory():
+            queries.append(get_active_schema_name())
+            return AwareModel.objects.order_by('factor')
+
+        objects = [
+            (obj._schema, obj.name)
+            for obj in iterate_across_schemata(factory, chunk_size=2)
+        ]
+        self.assertEqual(['a', 'b', 'c'], sorted(queries))
+        self.assertEqual(
+            sorted([('a', 'a0'), ('a', 'a1'), ('a', 'a2'), ('a', 'a3'), ('a', 'a4'),
+                    ('c', 'c0'), ('c', 'c1'), ('c', 'c2')]),
+            sorted(objects)
+        )
+        self.assertEqual(None, get_active_schema_name())
+
+    def test_uses_server_side_cursor(self):
+        objects = iterate_across_schemata(lambda: AwareModel.objects.all(), ['a'], chunk_size=2)
+        next(objects)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM pg_cursors WHERE name LIKE 'stream\\_%%'")
+            self.assertEqual(1, cursor.fetchone()[0])
+        self.assertEqual(4, len(list(objects)))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM pg_cursors WHERE name LIKE 'stream\\_%%'")
+            self.assertEqual(0, cursor.fetchone()[0])
+
+    def test_related_objects_and_restoring_schema(self):
+        for schema in [self.a, self.c]:
+            schema.activate()
+            CoReferentialModelA.objects.create(name=schema.schema, other=CoReferentialModelB.objects.create(name='other'))
+
+        objects = iterate_across_schemata(lambda: CoReferentialModelA.objects.all(), [self.a, self.c])
+        self.assertEqual([('a', 'other'), ('c', 'other')], [(obj.name, obj.other.name) for obj in objects])
+        self.assertEqual('c', get_active_schema_name())
+
+    def test_values_querysets_are_rejected(self):
+        with self.assertRaises(ValueError):
+            list(iterate_across_schemata(lambda: AwareModel.objects.values('name'), ['a']))
+
+    def test_querysets_with_related_or_extra_columns_are_rejected(self):
+        for factory in [
+            lambda: CoReferentialModelA.objects.select_related('other'),
+            lambda: CoReferentialModelA.objects.prefetch_related('other'),
+            lambda: AwareModel.objects.extra(select={'name': "'other'"}),
+        ]:
+            with self.assertRaises(ValueError):
+                list(iterate_across_schemata(factory, ['a']))